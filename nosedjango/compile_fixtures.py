@@ -0,0 +1,89 @@
+"""
+``nosedjango-compile-fixtures``: compile fixture files so that test runs can
+load them without going through the serializers.
+
+Usage::
+
+    nosedjango-compile-fixtures --settings=myproject.settings [LABEL ...]
+
+Without labels every fixture in the fixture directories of the installed
+apps and ``FIXTURE_DIRS`` is compiled. Each fixture gets a
+``<fixture>.compiled`` file next to it, which nosedjango uses for as long as
+the fixture file and the models it contains are unchanged.
+"""
+
+from __future__ import absolute_import
+
+import os
+import sys
+from optparse import OptionParser
+
+from nosedjango.fixtures import (
+    COMPRESSION_FORMATS, FixtureCache, FixtureNotSupported, compile_fixture)
+
+def find_all_fixtures(fixture_cache):
+    """
+    Return ``(path, format)`` for every uncompressed fixture file in the
+    fixture directories.
+    """
+    from django.core import serializers
+
+    formats = serializers.get_public_serializer_formats()
+    found = []
+    for fixture_dir in fixture_cache.get_fixture_dirs():
+        if not fixture_dir or not os.path.isdir(fixture_dir):
+            continue
+        for file_name in sorted(os.listdir(fixture_dir)):
+            parts = file_name.split('.')
+            if len(parts) > 1 and parts[-1] in formats:
+                found.append((os.path.join(fixture_dir, file_name), parts[-1]))
+    return found
+
+def find_labelled_fixtures(fixture_cache, labels):
+    from django.db import DEFAULT_DB_ALIAS
+
+    found = []
+    for label in labels:
+        try:
+            found.extend(
+                fixture_cache.find_fixture_files(label, DEFAULT_DB_ALIAS))
+        except FixtureNotSupported:
+            sys.stderr.write(
+                "Skipped '%s': not found, ambiguous or compressed (%s)\n" % (
+                    label, ', '.join(COMPRESSION_FORMATS)))
+    return found
+
+def main(argv=None):
+    parser = OptionParser(usage='%prog [options] [LABEL ...]')
+    parser.add_option('--settings', metavar='MODULE',
+                      help='Django settings module, defaults to '
+                      'DJANGO_SETTINGS_MODULE.')
+    options, labels = parser.parse_args(argv)
+
+    if options.settings:
+        os.environ['DJANGO_SETTINGS_MODULE'] = options.settings
+    if 'DJANGO_SETTINGS_MODULE' not in os.environ:
+        parser.error('No settings module, use --settings')
+    # Settings given as a module next to the current directory
+    sys.path.insert(0, os.getcwd())
+
+    fixture_cache = FixtureCache()
+    if labels:
+        fixtures = find_labelled_fixtures(fixture_cache, labels)
+    else:
+        fixtures = find_all_fixtures(fixture_cache)
+
+    for path, format in fixtures:
+        try:
+            compiled_path = compile_fixture(path, format)
+        except FixtureNotSupported, e:
+            sys.stderr.write('Skipped: %s\n' % e)
+            continue
+        except (IOError, OSError), e:
+            sys.stderr.write('Skipped %s: %s\n' % (path, e))
+            continue
+        sys.stdout.write('Compiled %s\n' % compiled_path)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+Reusing the database connection between tests.
+
+After a transactional test is rolled back the connection is normally closed,
+since session settings changed by the test (PostgreSQL's ``client_encoding``
+in particular) would otherwise leak into the next one. Reconnecting costs a
+handshake per test, though, so with ``--django-keep-connection`` the session
+is reset in place instead.
+"""
+
+def clone_connection(connection):
+    """
+    A new, unconnected connection with the same settings, for running
+    statements in another thread without sharing ``connection``.
+    """
+    from django.db import load_backend
+
+    backend = load_backend(connection.settings_dict['ENGINE'])
+    return backend.DatabaseWrapper(
+        dict(connection.settings_dict), connection.alias)
+
+def _reset_postgresql(connection):
+    if connection._version[0:2] < (8, 3):
+        # No DISCARD ALL
+        return False
+
+    raw_connection = connection.connection
+    raw_connection.rollback()
+    # DISCARD ALL can't run inside a transaction block
+    raw_connection.set_isolation_level(0)
+    cursor = raw_connection.cursor()
+    try:
+        cursor.execute('DISCARD ALL')
+        # DISCARD ALL resets everything to the server's defaults; put back
+        # what Django set up when it connected
+        cursor.execute("SET client_encoding TO 'UTF8'")
+        time_zone = connection.settings_dict.get('TIME_ZONE')
+        if time_zone:
+            cursor.execute('SET TIME ZONE %s', [time_zone])
+    finally:
+        cursor.close()
+    raw_connection.set_isolation_level(connection.isolation_level)
+    return True
+
+def _reset_mysql(connection):
+    # Django sets nothing up per session beyond the connect() arguments
+    connection.connection.rollback()
+    return True
+
+def _reset_sqlite(connection):
+    connection.connection.rollback()
+    return True
+
+def reset_connection(connection):
+    """
+    Reset the session of the connection's open database connection, if it
+    has one, so that the next test can keep using it. Returns ``False`` if
+    the connection has to be closed instead.
+    """
+    if connection.connection is None:
+        return True
+
+    engine = connection.settings_dict['ENGINE']
+    if 'psycopg2' in engine or 'postgis' in engine:
+        reset = _reset_postgresql
+    elif 'mysql' in engine:
+        reset = _reset_mysql
+    elif 'sqlite3' in engine or 'spatialite' in engine:
+        reset = _reset_sqlite
+    else:
+        return False
+
+    try:
+        return reset(connection)
+    except Exception:
+        # A connection we can't reset isn't worth keeping
+        return False
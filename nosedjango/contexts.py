@@ -0,0 +1,62 @@
+"""
+Transactions that span a whole nose context (a test class or module). The
+context's fixtures are loaded once inside the transaction and every test runs
+inside a savepoint that is rolled back afterwards, so the fixtures survive
+from one test to the next.
+"""
+
+class FixtureContext(object):
+    """
+    The open transaction for a single nose context.
+    """
+    savepoint_name = 'nosedjango_test'
+
+    def __init__(self, context, connection):
+        self.context = context
+        self.connection = connection
+        self._old_isolation_level = None
+
+    def _is_sqlite(self):
+        return 'sqlite3' in self.connection.settings_dict['ENGINE']
+
+    def _execute(self, sql):
+        cursor = self.connection.cursor()
+        cursor.execute(sql)
+
+    def _savepoint_sql(self, statement):
+        return '%s %s' % (
+            statement, self.connection.ops.quote_name(self.savepoint_name))
+
+    def begin(self):
+        """
+        Open the transaction. Transaction management should already be
+        entered (and its commit/rollback functions disabled) by the caller.
+        """
+        if self._is_sqlite():
+            # pysqlite commits any open transaction before running a
+            # statement it doesn't recognise, SAVEPOINT included. Take over
+            # transaction handling for the lifetime of the context instead.
+            self.connection.cursor()
+            self._old_isolation_level = self.connection.connection.isolation_level
+            self.connection.connection.isolation_level = None
+            self._execute('BEGIN')
+
+    def savepoint(self):
+        self._execute(self._savepoint_sql('SAVEPOINT'))
+
+    def rollback_to_savepoint(self):
+        self._execute(self._savepoint_sql('ROLLBACK TO SAVEPOINT'))
+        if 'oracle' not in self.connection.settings_dict['ENGINE']:
+            # Oracle has no RELEASE; elsewhere, keep sqlite's savepoint stack
+            # from growing with every test
+            self._execute(self._savepoint_sql('RELEASE SAVEPOINT'))
+
+    def rollback(self):
+        """
+        Roll back everything done in the context, fixtures included.
+        """
+        if self._is_sqlite():
+            self._execute('ROLLBACK')
+            self.connection.connection.isolation_level = self._old_isolation_level
+        # Also marks the connection clean for leave_transaction_management
+        self.connection.rollback()
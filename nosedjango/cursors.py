@@ -0,0 +1,90 @@
+"""
+Hooks for watching the SQL that runs through Django's database connections.
+
+Listeners registered for a connection alias are called with the SQL and the
+time it took for every statement executed on a cursor from that connection,
+in any thread. Cursor hooks are called with the connection before any cursor
+is created on it.
+"""
+
+import time
+
+_listeners = {}
+_cursor_hooks = {}
+_patched_classes = set()
+
+class WatchingCursorWrapper(object):
+    def __init__(self, cursor, alias):
+        self.cursor = cursor
+        self.alias = alias
+
+    def _notify(self, sql, duration):
+        for listener in list(_listeners.get(self.alias, [])):
+            listener(sql, duration)
+
+    def execute(self, sql, params=()):
+        start = time.time()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            self._notify(sql, time.time() - start)
+
+    def executemany(self, sql, param_list):
+        start = time.time()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            self._notify(sql, time.time() - start)
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+def _patch_connection_class(connection_class):
+    """
+    Wrap ``cursor()`` on the connection class rather than the connection:
+    connections are thread-local, and queries from other threads (eg. a live
+    test server) have to be seen too.
+    """
+    if connection_class in _patched_classes:
+        return
+    original_cursor = connection_class.cursor
+
+    def cursor(self):
+        for hook in list(_cursor_hooks.get(self.alias, [])):
+            hook(self)
+        cursor = original_cursor(self)
+        if _listeners.get(self.alias):
+            return WatchingCursorWrapper(cursor, self.alias)
+        return cursor
+
+    connection_class.cursor = cursor
+    _patched_classes.add(connection_class)
+
+def add_query_listener(connection, listener):
+    """
+    Call ``listener(sql, duration)`` for every statement executed on
+    ``connection``.
+    """
+    _patch_connection_class(connection.__class__)
+    _listeners.setdefault(connection.alias, []).append(listener)
+
+def remove_query_listener(connection, listener):
+    listeners = _listeners.get(connection.alias, [])
+    if listener in listeners:
+        listeners.remove(listener)
+
+def add_cursor_hook(connection, hook):
+    """
+    Call ``hook(connection)`` before every cursor is created on
+    ``connection``.
+    """
+    _patch_connection_class(connection.__class__)
+    _cursor_hooks.setdefault(connection.alias, []).append(hook)
+
+def remove_cursor_hook(connection, hook):
+    hooks = _cursor_hooks.get(connection.alias, [])
+    if hook in hooks:
+        hooks.remove(hook)
@@ -0,0 +1,463 @@
+"""
+Test databases for the aliases in ``DATABASES`` other than ``default``.
+
+The default test database goes through the plugin's own machinery (Django
+plugins, templates, worker clones). Every other alias gets a test database
+from Django's ``create_test_db``; those living on a database server are
+created in parallel threads, alongside the default one when they don't
+depend on it. Aliases with ``TEST_MIRROR`` don't get a database at all: they
+share the connection of the alias they mirror, and with it its transaction,
+so that a test writing through ``default`` reads its own writes through the
+replica. Aliases pointing at the same database as an earlier one share its
+test database, like Django's own test runner does.
+"""
+
+from __future__ import absolute_import
+
+import os
+import sys
+
+try:
+    import json
+except ImportError:
+    from django.utils import simplejson as json
+
+from nosedjango import workers
+from nosedjango.parallel import ThreadPool, can_use_thread
+from nosedjango.reuse import can_reuse, keep_test_db, reuse_test_db, set_state
+from nosedjango.schema import get_schema_fingerprint
+
+# Like workers.MASTER_DB_ENV, for the other aliases: {alias: [old, master]}
+MASTER_DBS_ENV = 'NOSEDJANGO_MASTER_TEST_DBS'
+
+# What ``DatabaseFeatures.confirm`` finds out by querying the database
+CONFIRMED_FEATURES = ['_confirmed', 'supports_transactions', 'supports_stddev',
+                      'can_introspect_foreign_keys']
+
+def _is_in_memory(connection):
+    return 'sqlite3' in connection.settings_dict['ENGINE'] \
+        and connection.creation._get_test_db_name() == ':memory:'
+
+def _signature(settings_dict, name):
+    return (settings_dict['HOST'], settings_dict['PORT'],
+            settings_dict['ENGINE'], name)
+
+def get_creation_waves(aliases, dependencies):
+    """
+    Split ``aliases`` into lists that can be created in parallel, each one
+    after the previous one, honouring ``TEST_DEPENDENCIES``. Dependencies on
+    aliases that aren't in ``aliases`` count as met.
+    """
+    from django.core.exceptions import ImproperlyConfigured
+
+    waves = []
+    pending = list(aliases)
+    while pending:
+        wave = [alias for alias in pending
+                if not [dependency for dependency in dependencies.get(alias, ())
+                        if dependency in pending]]
+        if not wave:
+            raise ImproperlyConfigured(
+                'Circular dependency in TEST_DEPENDENCIES')
+        waves.append(wave)
+        pending = [alias for alias in pending if alias not in wave]
+    return waves
+
+class TestDatabases(object):
+    """
+    The test databases of the non-default aliases, from creation to
+    destruction, and the per-test isolation of their connections.
+    """
+    def __init__(self, verbosity=1, reuse=False):
+        self.verbosity = verbosity
+        # With --django-reuse-db, alias -> fingerprint of the kept databases
+        self.reuse = reuse
+        self.fingerprints = {}
+        # Aliases getting a test database of their own, and their real names
+        self.created = []
+        self.old_names = {}
+        # alias -> alias whose test database it shares
+        self.duplicates = {}
+        # alias -> mirrored alias, and the connections they had before
+        self.mirrors = {}
+        self.mirror_connections = {}
+        self.flushers = {}
+        self.dirty_tables = {}
+        self.is_set_up = False
+        self.pool = None
+        self.started = []
+        # Created so far, to drop them if setting up fails
+        self.ready = []
+
+        from django.db import DEFAULT_DB_ALIAS, connections
+
+        default = connections[DEFAULT_DB_ALIAS]
+        signatures = {}
+        if not _is_in_memory(default):
+            signatures[_signature(
+                default.settings_dict,
+                default.settings_dict['NAME'])] = DEFAULT_DB_ALIAS
+
+        for alias in sorted(connections):
+            if alias == DEFAULT_DB_ALIAS:
+                continue
+            # Not connections[alias]: in a forked worker, mirrors already
+            # share the connection of the alias they mirror
+            connections.ensure_defaults(alias)
+            settings_dict = connections.databases[alias]
+            self.old_names[alias] = settings_dict['NAME']
+            if settings_dict['TEST_MIRROR']:
+                self.mirrors[alias] = settings_dict['TEST_MIRROR']
+                continue
+            connection = connections[alias]
+            signature = _signature(settings_dict, settings_dict['NAME'])
+            if signature in signatures:
+                self.duplicates[alias] = signatures[signature]
+                continue
+            if not _is_in_memory(connection):
+                signatures[signature] = alias
+            self.created.append(alias)
+
+    def __nonzero__(self):
+        return bool(self.created or self.duplicates or self.mirrors)
+
+    @property
+    def aliases(self):
+        """
+        The aliases with connections of their own to isolate, mirrors
+        excluded: they are isolated along with the alias they mirror.
+        """
+        return self.created + sorted(self.duplicates)
+
+    def start_set_up(self):
+        """
+        Start creating the test databases that don't depend on any other one
+        in the background, so that they are created along with the default
+        test database. ``set_up`` creates the others and waits for them.
+        """
+        from django.db import connections
+
+        self.pool = ThreadPool()
+        self.started = []
+        self.ready = []
+        master_dbs = self.get_master_dbs()
+        dependencies = self._get_dependencies()
+        for alias in self.created:
+            if dependencies[alias] or not can_use_thread(connections[alias]):
+                continue
+            self.pool.submit(self._create_in_thread, alias, master_dbs)
+            self.started.append(alias)
+
+    def set_up(self, capture_seed=True):
+        """
+        Create the test databases, point duplicates and mirrors at them and,
+        unless ``capture_seed`` is false, prepare the per-alias flushers.
+        """
+        from django.db import connections
+
+        if self.pool is None:
+            self.start_set_up()
+        try:
+            master_dbs = self.get_master_dbs()
+            pending = [alias for alias in self.created
+                       if alias not in self.started]
+            for wave in get_creation_waves(pending, self._get_dependencies()):
+                for alias in wave:
+                    if can_use_thread(connections[alias]):
+                        self.pool.submit(
+                            self._create_in_thread, alias, master_dbs)
+                    else:
+                        self._create(alias, master_dbs)
+                self.pool.join()
+            self.pool.join()
+        except:
+            exc_type, exc_value, exc_tb = sys.exc_info()
+            self.abort_set_up()
+            raise exc_type, exc_value, exc_tb
+        self.pool = None
+
+        for alias, target in self.duplicates.items():
+            connections[alias].settings_dict['NAME'] = \
+                connections[target].settings_dict['NAME']
+            # Only create_test_db confirms the features; without
+            # supports_transactions, Django's TestCase commits its fixtures
+            for name in CONFIRMED_FEATURES:
+                if hasattr(connections[target].features, name):
+                    setattr(connections[alias].features, name,
+                            getattr(connections[target].features, name))
+        for alias, target in self.mirrors.items():
+            if connections[alias] is connections[target]:
+                continue
+            self.mirror_connections[alias] = connections[alias]
+            connections[alias].settings_dict['NAME'] = \
+                connections[target].settings_dict['NAME']
+            connections._connections[alias] = connections[target]
+        if capture_seed:
+            self.capture_seed()
+        self.is_set_up = True
+
+    def abort_set_up(self):
+        """
+        Wait for the databases still being created in the background, then
+        drop every one created so far. For when creating the default test
+        database, or one of ours, failed.
+        """
+        if self.pool is not None:
+            try:
+                self.pool.join()
+            except Exception:
+                # Already failing, with an error of the caller's
+                pass
+            self.pool = None
+        for alias in reversed(self.ready):
+            if alias in self.fingerprints:
+                # Kept for the next run anyway
+                continue
+            try:
+                self._destroy(alias)
+            except Exception:
+                pass
+        self.ready = []
+        self.started = []
+
+    def _get_dependencies(self):
+        from django.db import connections
+
+        dependencies = {}
+        for alias in self.created:
+            dependencies[alias] = connections.databases[alias].get(
+                'TEST_DEPENDENCIES', [])
+        return dependencies
+
+    def _create(self, alias, master_dbs=None):
+        """
+        Create the alias's test database, clone the main process's copy in a
+        multiprocess worker or reuse the one kept by the last run.
+        """
+        from django.conf import settings
+        from django.db import connections
+
+        connection = connections[alias]
+        if master_dbs is not None:
+            old_name, master_name = master_dbs[alias]
+            if workers.create_worker_db(
+                connection, old_name, master_name, self.verbosity):
+                self.ready.append(alias)
+                return
+
+        reuse = self.reuse and master_dbs is None and can_reuse(connection)
+        if reuse:
+            fingerprint = get_schema_fingerprint(settings, connection)
+            if reuse_test_db(connection, fingerprint, self.verbosity):
+                self.fingerprints[alias] = fingerprint
+                self.ready.append(alias)
+                return
+        connection.creation.create_test_db(
+            verbosity=self.verbosity, autoclobber=True)
+        self.ready.append(alias)
+        if reuse:
+            set_state(connection, fingerprint, clean=False)
+            self.fingerprints[alias] = fingerprint
+
+    def _destroy(self, alias):
+        from django.db import connections
+
+        connections[alias].creation.destroy_test_db(
+            self.old_names[alias], verbosity=self.verbosity)
+
+    def _create_in_thread(self, alias, master_dbs=None):
+        from django.db import connections
+
+        try:
+            self._create(alias, master_dbs)
+        finally:
+            # The main thread has to open its own connection
+            connections[alias].close()
+
+    def get_test_db_names(self):
+        """
+        Return ``{alias: (old_name, test_name)}`` for the created databases.
+        """
+        from django.db import connections
+
+        names = {}
+        for alias in self.created:
+            names[alias] = (
+                self.old_names[alias], connections[alias].settings_dict['NAME'])
+        return names
+
+    def publish_master_dbs(self):
+        """
+        Hand the test database names down to multiprocess workers, which
+        clone them into databases of their own.
+        """
+        os.environ[MASTER_DBS_ENV] = json.dumps(self.get_test_db_names())
+
+    def clear_master_dbs(self):
+        os.environ.pop(MASTER_DBS_ENV, None)
+
+    def get_master_dbs(self):
+        """
+        Return ``{alias: (old_name, master_name)}`` published by the main
+        process, or ``None`` outside of a multiprocess worker.
+        """
+        if MASTER_DBS_ENV not in os.environ:
+            return None
+        return json.loads(os.environ[MASTER_DBS_ENV])
+
+    def create_worker_dbs(self, verbosity=0):
+        """
+        Give a forked process test databases of its own, cloned from the
+        ones created here.
+        """
+        from django.db import connections
+
+        for alias in self.created:
+            connection = connections[alias]
+            master_name = connection.settings_dict['NAME']
+            if not _is_in_memory(connection):
+                workers.create_worker_db(
+                    connection, self.old_names[alias], master_name, verbosity)
+        for alias, target in self.duplicates.items():
+            connections[alias].close()
+            connections[alias].settings_dict['NAME'] = \
+                connections[target].settings_dict['NAME']
+
+    def destroy_own_worker_dbs(self):
+        """
+        Drop the databases ``create_worker_dbs`` made for this process.
+        """
+        from django.db import connections
+
+        for alias in self.created:
+            connection = connections[alias]
+            if not _is_in_memory(connection):
+                connection.creation.destroy_test_db(
+                    self.old_names[alias], verbosity=0)
+
+    def destroy_worker_dbs(self, master_dbs):
+        """
+        Drop the databases workers cloned from the ones in ``master_dbs``, as
+        returned by ``get_test_db_names`` before the databases were destroyed.
+        """
+        from django.db import connections
+
+        for alias, (old_name, master_name) in master_dbs.items():
+            workers.destroy_worker_dbs(
+                connections[alias], old_name, master_name, self.verbosity)
+
+    def capture_seed(self):
+        """
+        Remember every created database's seed rows and start tracking the
+        tables written to, see ``nosedjango.flush``.
+        """
+        from django.db import connections
+        from nosedjango.flush import DirtyTableTracker, get_flusher
+
+        for alias in self.created:
+            connection = connections[alias]
+            self.flushers[alias] = get_flusher(connection)
+            self.flushers[alias].capture_seed()
+            if alias not in self.dirty_tables:
+                self.dirty_tables[alias] = DirtyTableTracker(connection)
+                self.dirty_tables[alias].start()
+            self.dirty_tables[alias].clear()
+
+    def flush(self):
+        """
+        Reset the created databases after a non-transactional test, with the
+        flushers when the seed rows were captured and with Django's
+        ``flush`` command otherwise.
+        """
+        from django.core.management import call_command
+
+        for alias in self.created:
+            if alias in self.flushers:
+                self.flushers[alias].flush(self.dirty_tables[alias].tables)
+                self.dirty_tables[alias].clear()
+            else:
+                call_command('flush', verbosity=0, interactive=False,
+                             database=alias)
+
+    def enter_transactions(self):
+        from django.db import transaction
+
+        for alias in self.aliases:
+            transaction.enter_transaction_management(using=alias)
+            transaction.managed(True, using=alias)
+
+    def leave_transactions(self, rollback=True):
+        """
+        Roll back and leave the transactions of ``enter_transactions``.
+        Call with the real transaction functions restored.
+        """
+        from django.db import transaction
+
+        for alias in self.aliases:
+            if rollback:
+                transaction.rollback(using=alias)
+            if transaction.is_managed(using=alias):
+                transaction.leave_transaction_management(using=alias)
+
+    def rollback(self):
+        """
+        Roll back the current transactions while the transaction functions
+        are disabled, leaving transaction management as it is.
+        """
+        from django.db import connections
+
+        for alias in self.aliases:
+            connections[alias]._rollback()
+
+    def connections(self):
+        """
+        The connections of every alias, mirrors included, before ``set_up``
+        points the mirrors at the connections they mirror.
+        """
+        from django.db import connections
+
+        return [connections[alias]
+                for alias in self.aliases + sorted(self.mirrors)]
+
+    def tear_down(self, pool=None):
+        """
+        Restore the mirrors' connections and destroy the test databases,
+        on ``pool`` where the engine allows it. Without a pool of the
+        caller's, wait for all of them.
+        """
+        from django.db import connections
+
+        for alias, connection in self.mirror_connections.items():
+            connections._connections[alias] = connection
+            connection.settings_dict['NAME'] = self.old_names[alias]
+        self.mirror_connections = {}
+
+        for alias in sorted(self.duplicates):
+            connections[alias].close()
+            connections[alias].settings_dict['NAME'] = self.old_names[alias]
+        own_pool = pool is None
+        if own_pool:
+            pool = ThreadPool()
+        for alias in reversed(self.created):
+            connection = connections[alias]
+            if alias in self.fingerprints:
+                clean = alias in self.flushers
+                if clean:
+                    self.flushers[alias].flush(self.dirty_tables[alias].tables)
+                keep_test_db(connection, self.old_names[alias],
+                             self.fingerprints[alias], clean, self.verbosity)
+            elif can_use_thread(connection):
+                pool.submit(connection.creation.destroy_test_db,
+                            self.old_names[alias], verbosity=self.verbosity)
+            else:
+                connection.creation.destroy_test_db(
+                    self.old_names[alias], verbosity=self.verbosity)
+        if own_pool:
+            pool.join()
+
+        for tracker in self.dirty_tables.values():
+            tracker.stop()
+        self.dirty_tables = {}
+        self.flushers = {}
+        self.fingerprints = {}
+        self.is_set_up = False
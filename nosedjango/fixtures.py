@@ -0,0 +1,534 @@
+"""
+In-process fixture loading for nosedjango. Fixture files are located and
+deserialized once per test run, and the parsed objects are saved again for
+every test that asks for them, instead of ``loaddata`` re-reading and
+re-parsing the same files before every single test.
+
+Objects are written with one multi-row ``INSERT`` per table and batch of
+rows rather than one ``save()`` each. Whatever ``save()`` would do more than
+an insert for is still saved one by one: rows that already exist, objects
+without a primary key, proxy models, models ordered with respect to another
+and models somebody listens to ``pre_save`` or ``post_save`` for. Both kinds
+go in model by model, the models foreign keys point to first.
+"""
+
+from __future__ import absolute_import
+
+import hashlib
+import os
+import sys
+import traceback
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from nosedjango.cursors import add_cursor_hook, remove_cursor_hook
+
+COMPRESSION_FORMATS = ['gz', 'zip', 'bz2']
+
+# Compiled fixtures live next to their source, as <fixture>.compiled
+COMPILED_SUFFIX = '.compiled'
+COMPILED_VERSION = 1
+
+class FixtureNotSupported(Exception):
+    """
+    The fixture label can't be handled by the cache (eg. compressed or
+    ambiguous fixtures) and should be left to ``loaddata``.
+    """
+    pass
+
+# sqlite's default limit on the number of parameters of a statement
+SQLITE_MAX_VARIABLES = 999
+MAX_ROWS_PER_INSERT = 500
+
+def _has_receivers(signal, sender):
+    from django.dispatch.dispatcher import _make_id
+
+    return bool(signal._live_receivers(_make_id(sender)))
+
+def sort_models_by_dependencies(models):
+    """
+    Order ``models`` so that the models their foreign keys point to come
+    first, keeping the given order where it doesn't matter. Models in a
+    dependency cycle keep their given order.
+    """
+    models = list(models)
+    remaining = set(models)
+    dependencies = {}
+    for model in models:
+        dependencies[model] = set([
+            field.rel.to for field in model._meta.local_fields
+            if field.rel and field.rel.to in remaining
+            and field.rel.to is not model])
+
+    ordered = []
+    while remaining:
+        ready = [model for model in models
+                 if model in remaining and not (dependencies[model] & remaining)]
+        if not ready:
+            # A cycle; the database has to cope with it
+            ready = [model for model in models if model in remaining]
+        for model in ready:
+            ordered.append(model)
+            remaining.remove(model)
+    return ordered
+
+class BulkInserter(object):
+    """
+    Insert fixture objects into one database with as few statements as
+    possible.
+    """
+    def __init__(self, connection, using):
+        self.connection = connection
+        self.using = using
+        self.cursor = connection.cursor()
+        self.qn = connection.ops.quote_name
+
+    def can_insert(self, model):
+        """
+        Would a raw ``save()`` of a new ``model`` instance only insert a row?
+        """
+        from django.db.models import signals
+
+        meta = model._meta
+        return not meta.proxy \
+           and not meta.order_with_respect_to \
+           and not _has_receivers(signals.pre_save, model) \
+           and not _has_receivers(signals.post_save, model)
+
+    def _rows_per_insert(self, columns):
+        if 'sqlite3' in self.connection.settings_dict['ENGINE']:
+            return max(1, SQLITE_MAX_VARIABLES // columns)
+        return MAX_ROWS_PER_INSERT
+
+    def insert_rows(self, table, columns, rows):
+        if not rows:
+            return
+        placeholders = '(%s)' % ', '.join(['%s'] * len(columns))
+        column_sql = ', '.join([self.qn(column) for column in columns])
+        step = self._rows_per_insert(len(columns))
+        for start in range(0, len(rows), step):
+            chunk = rows[start:start + step]
+            params = []
+            for row in chunk:
+                params.extend(row)
+            self.cursor.execute('INSERT INTO %s (%s) VALUES %s' % (
+                self.qn(table), column_sql,
+                ', '.join([placeholders] * len(chunk))), params)
+
+    def existing_pks(self, model, pks):
+        manager = model._base_manager.using(self.using)
+        existing = set()
+        step = self._rows_per_insert(1)
+        for start in range(0, len(pks), step):
+            existing.update(manager.filter(
+                pk__in=pks[start:start + step]).values_list('pk', flat=True))
+        return existing
+
+    def get_row(self, obj):
+        # The values a raw save_base() would insert
+        return [
+            field.get_db_prep_save(
+                getattr(obj, field.attname) or field.pre_save(obj, True),
+                connection=self.connection)
+            for field in obj._meta.local_fields]
+
+    def save(self, obj):
+        from django.db import models
+
+        # Same as DeserializedObject.save(), but repeatable
+        models.Model.save_base(obj, using=self.using, raw=True)
+
+    def insert(self, objects):
+        """
+        Save the ``(instance, m2m data, whether the fixture gave a pk)``
+        triples model by model, the models their foreign keys point to
+        first. New rows of models ``can_insert`` allows go in with multi-row
+        ``INSERT`` statements, the rest are saved one by one in the same
+        pass, so that databases checking foreign keys right away (InnoDB)
+        find the rows they reference. Many-to-many data comes last, once
+        every row is in.
+        """
+        from django.db.models import signals
+
+        by_model = {}
+        model_order = []
+        for triple in objects:
+            model = triple[0].__class__
+            if model not in by_model:
+                by_model[model] = []
+                model_order.append(model)
+            by_model[model].append(triple)
+
+        inserted = []
+        saved = []
+        for model in sort_models_by_dependencies(model_order):
+            triples = by_model[model]
+            if not self.can_insert(model):
+                for obj, m2m_data, has_pk in triples:
+                    self.save(obj)
+                saved.extend(triples)
+                continue
+
+            # A later fixture overrides an earlier one, like save() would
+            latest = {}
+            for triple in triples:
+                if triple[2]:
+                    latest[triple[0].pk] = triple
+            existing = self.existing_pks(model, latest.keys())
+            new_triples = []
+            one_by_one = []
+            for triple in triples:
+                if not triple[2]:
+                    one_by_one.append(triple)
+                elif latest[triple[0].pk] is not triple:
+                    continue
+                elif triple[0].pk in existing:
+                    # Has to be updated instead
+                    one_by_one.append(triple)
+                else:
+                    new_triples.append(triple)
+
+            meta = model._meta
+            self.insert_rows(
+                meta.db_table,
+                [field.column for field in meta.local_fields],
+                [self.get_row(obj) for obj, m2m_data, has_pk in new_triples])
+            for obj, m2m_data, has_pk in new_triples:
+                obj._state.db = self.using
+                obj._state.adding = False
+            inserted.extend(new_triples)
+
+            for obj, m2m_data, has_pk in one_by_one:
+                self.save(obj)
+            saved.extend(one_by_one)
+
+        for obj, m2m_data, has_pk in inserted:
+            for field_name, values in m2m_data.items():
+                field = obj._meta.get_field(field_name)
+                through = field.rel.through
+                if _has_receivers(signals.m2m_changed, through):
+                    setattr(obj, field_name, values)
+                    continue
+                target_pk = field.rel.to._meta.pk
+                rows = []
+                seen = set()
+                for value in values:
+                    value = target_pk.get_db_prep_save(
+                        target_pk.to_python(value), connection=self.connection)
+                    if value not in seen:
+                        seen.add(value)
+                        rows.append([obj.pk, value])
+                self.insert_rows(
+                    field.m2m_db_table(),
+                    [field.m2m_column_name(), field.m2m_reverse_name()],
+                    rows)
+        for obj, m2m_data, has_pk in saved:
+            for accessor_name, object_list in m2m_data.items():
+                setattr(obj, accessor_name, object_list)
+            if not has_pk:
+                # Let the next load pick a fresh pk, like loaddata
+                obj.pk = None
+
+def _hash_file(path):
+    f = open(path, 'rb')
+    try:
+        return hashlib.sha1(f.read()).hexdigest()
+    finally:
+        f.close()
+
+def _get_model_label(model):
+    return '%s.%s' % (model._meta.app_label, model._meta.object_name.lower())
+
+def _get_attnames(model):
+    return [field.attname for field in model._meta.local_fields]
+
+def deserialize_fixture(path, format, using):
+    """
+    Return the ``(model instance, m2m data, whether the fixture gave a pk)``
+    triples for the objects in the fixture file.
+    """
+    from django.core import serializers
+
+    fixture = open(path, 'r')
+    try:
+        objects = list(serializers.deserialize(format, fixture, using=using))
+    finally:
+        fixture.close()
+    if not objects:
+        # loaddata treats an empty fixture as an error
+        raise FixtureNotSupported('%s is empty' % path)
+    return [
+        (obj.object, obj.m2m_data or {}, obj.object.pk is not None)
+        for obj in objects
+    ]
+
+def get_compiled_path(path):
+    return path + COMPILED_SUFFIX
+
+def compile_fixture(path, format):
+    """
+    Write the compiled form of the fixture file: the field values of every
+    object in the column order of its model, along with a hash of the source.
+    Fixtures that can't be deserialized without querying the database (natural
+    keys) raise ``FixtureNotSupported``, since the keys would be resolved
+    against whatever database the settings point at.
+    """
+    from django.db import DEFAULT_DB_ALIAS, connections
+
+    connection = connections[DEFAULT_DB_ALIAS]
+    queried = []
+    def refuse_queries(connection):
+        queried.append(True)
+        raise FixtureNotSupported(path)
+
+    add_cursor_hook(connection, refuse_queries)
+    try:
+        try:
+            objects = deserialize_fixture(path, format, DEFAULT_DB_ALIAS)
+        except Exception:
+            # The serializers may have wrapped our exception in their own
+            if queried:
+                raise FixtureNotSupported(
+                    '%s needs the database to be deserialized '
+                    '(natural keys)' % path)
+            raise
+    finally:
+        remove_cursor_hook(connection, refuse_queries)
+
+    models = {}
+    compiled_objects = []
+    for obj, m2m_data, has_pk in objects:
+        model = obj.__class__
+        label = _get_model_label(model)
+        if label not in models:
+            models[label] = _get_attnames(model)
+        compiled_objects.append((
+            label,
+            tuple([getattr(obj, attname) for attname in models[label]]),
+            m2m_data))
+
+    compiled_path = get_compiled_path(path)
+    tmp_path = '%s.%d.tmp' % (compiled_path, os.getpid())
+    f = open(tmp_path, 'wb')
+    try:
+        pickle.dump({
+            'version': COMPILED_VERSION,
+            'source_hash': _hash_file(path),
+            'models': models,
+            'objects': compiled_objects,
+        }, f, pickle.HIGHEST_PROTOCOL)
+    finally:
+        f.close()
+    os.rename(tmp_path, compiled_path)
+    return compiled_path
+
+def read_compiled_fixture(path):
+    """
+    Return the objects of the fixture file like ``deserialize_fixture``, from
+    its compiled form. Returns ``None`` if there is no compiled form, or if
+    it is out of date with the fixture file or the models.
+    """
+    from django.db.models import get_model
+
+    compiled_path = get_compiled_path(path)
+    if not os.path.exists(compiled_path):
+        return None
+    f = open(compiled_path, 'rb')
+    try:
+        try:
+            data = pickle.load(f)
+        except Exception:
+            return None
+    finally:
+        f.close()
+    if data.get('version') != COMPILED_VERSION \
+       or data.get('source_hash') != _hash_file(path):
+        return None
+
+    models = {}
+    for label, attnames in data['models'].items():
+        app_label, model_name = label.split('.')
+        model = get_model(app_label, model_name)
+        if model is None or _get_attnames(model) != attnames:
+            return None
+        models[label] = (model, attnames)
+
+    objects = []
+    for label, values, m2m_data in data['objects']:
+        model, attnames = models[label]
+        obj = model(**dict(zip(attnames, values)))
+        objects.append((obj, m2m_data, obj.pk is not None))
+    return objects
+
+class CachedFixture(object):
+    """
+    The parsed contents of a single fixture file.
+    """
+    def __init__(self, path, mtime, objects):
+        self.path = path
+        self.mtime = mtime
+        # (model instance, m2m data, whether the fixture gave a pk)
+        self.objects = objects
+
+class FixtureCache(object):
+    """
+    Locate fixtures the same way ``loaddata`` does, keep the deserialized
+    objects around (invalidated when the file's mtime changes) and save them
+    into the database on demand.
+    """
+    def __init__(self):
+        self._fixtures = {}
+        self._fixture_dirs = None
+
+    def get_fixture_dirs(self):
+        if self._fixture_dirs is None:
+            from django.conf import settings
+            from django.db.models import get_apps
+
+            app_module_paths = []
+            for app in get_apps():
+                if hasattr(app, '__path__'):
+                    # It's a 'models/' subpackage
+                    app_module_paths.extend(app.__path__)
+                else:
+                    # It's a models.py module
+                    app_module_paths.append(app.__file__)
+
+            self._fixture_dirs = [
+                os.path.join(os.path.dirname(path), 'fixtures')
+                for path in app_module_paths
+            ]
+            self._fixture_dirs += list(settings.FIXTURE_DIRS) + ['']
+        return self._fixture_dirs
+
+    def find_fixture_files(self, fixture_label, using):
+        """
+        Return a list of ``(path, format)`` pairs for the label, mirroring the
+        lookup rules of ``loaddata``.
+        """
+        from django.core import serializers
+
+        parts = fixture_label.split('.')
+        if len(parts) > 1 and parts[-1] in COMPRESSION_FORMATS:
+            raise FixtureNotSupported(fixture_label)
+
+        public_formats = serializers.get_public_serializer_formats()
+        if len(parts) == 1:
+            fixture_name = parts[0]
+            formats = public_formats
+        else:
+            fixture_name, format = '.'.join(parts[:-1]), parts[-1]
+            if format not in public_formats:
+                raise FixtureNotSupported(fixture_label)
+            formats = [format]
+
+        if os.path.isabs(fixture_name):
+            fixture_dirs = [fixture_name]
+        else:
+            fixture_dirs = self.get_fixture_dirs()
+
+        found = []
+        for fixture_dir in fixture_dirs:
+            found_in_dir = []
+            for database in [using, None]:
+                for format in formats:
+                    file_name = '.'.join(
+                        p for p in [fixture_name, database, format] if p)
+                    full_path = os.path.join(fixture_dir, file_name)
+                    for compression_format in COMPRESSION_FORMATS:
+                        if os.path.exists(
+                            '%s.%s' % (full_path, compression_format)):
+                            raise FixtureNotSupported(fixture_label)
+                    if os.path.isfile(full_path):
+                        found_in_dir.append((full_path, format))
+            if len(found_in_dir) > 1:
+                # loaddata reports this as an error, let it do so
+                raise FixtureNotSupported(fixture_label)
+            found.extend(found_in_dir)
+
+        if not found:
+            raise FixtureNotSupported(fixture_label)
+        return found
+
+    def get_fixture(self, path, format, using):
+        mtime = os.path.getmtime(path)
+        cached = self._fixtures.get((path, using))
+        if cached is not None and cached.mtime == mtime:
+            return cached
+
+        objects = read_compiled_fixture(path)
+        if objects is None:
+            objects = deserialize_fixture(path, format, using)
+
+        cached = CachedFixture(path, mtime, objects)
+        self._fixtures[(path, using)] = cached
+        return cached
+
+    def load(self, fixture_labels, using=None, commit=True):
+        """
+        Install the given fixtures. Returns ``False`` if any of them can't be
+        handled by the cache, in which case nothing was loaded and the caller
+        should fall back to ``loaddata``.
+        """
+        from django.core.management.color import no_style
+        from django.db import connections, router, transaction
+        from django.db import DEFAULT_DB_ALIAS
+
+        if using is None:
+            using = DEFAULT_DB_ALIAS
+
+        try:
+            fixtures = []
+            for fixture_label in fixture_labels:
+                for path, format in self.find_fixture_files(fixture_label, using):
+                    fixtures.append(self.get_fixture(path, format, using))
+        except FixtureNotSupported:
+            return False
+
+        connection = connections[using]
+        cursor = connection.cursor()
+
+        if commit:
+            transaction.commit_unless_managed(using=using)
+            transaction.enter_transaction_management(using=using)
+            transaction.managed(True, using=using)
+
+        inserter = BulkInserter(connection, using)
+        loaded_models = set()
+        try:
+            objects = []
+            for fixture in fixtures:
+                for obj, m2m_data, has_pk in fixture.objects:
+                    model = obj.__class__
+                    if not router.allow_syncdb(using, model):
+                        continue
+                    loaded_models.add(model)
+                    objects.append((obj, m2m_data, has_pk))
+            inserter.insert(objects)
+        except (SystemExit, KeyboardInterrupt):
+            raise
+        except Exception:
+            if commit:
+                transaction.rollback(using=using)
+                transaction.leave_transaction_management(using=using)
+            sys.stderr.write(
+                "Problem installing fixtures '%s': %s\n" % (
+                    "', '".join([fixture.path for fixture in fixtures]),
+                    ''.join(traceback.format_exception(*sys.exc_info()))))
+            return True
+
+        if loaded_models:
+            sequence_sql = connection.ops.sequence_reset_sql(
+                no_style(), loaded_models)
+            for line in sequence_sql:
+                cursor.execute(line)
+
+        if commit:
+            transaction.commit(using=using)
+            transaction.leave_transaction_management(using=using)
+            # Same MySQL workaround as loaddata, see Django #7572
+            connection.close()
+        return True
@@ -0,0 +1,205 @@
+"""
+Fast database resets for tests that don't use transaction isolation.
+
+Django's ``flush`` command deletes everything and then re-emits
+``post_syncdb``, which recreates content types, permissions, sites and the
+``initial_data`` fixtures from scratch. Instead, the rows present right after
+the test database was created (the "seed" rows) are captured once, and every
+reset empties the tables in one batch and re-inserts those rows.
+
+When a ``DirtyTableTracker`` is in use, only the tables that were written to
+since the last reset are emptied.
+"""
+
+from __future__ import absolute_import
+
+import re
+
+from nosedjango.cursors import add_query_listener, remove_query_listener
+
+WRITE_RE = re.compile(
+    r'^\s*(?:INSERT\s+(?:IGNORE\s+)?INTO|REPLACE\s+INTO|UPDATE|DELETE\s+FROM|'
+    r'TRUNCATE(?:\s+TABLE)?)\s+[`"\[]?([\w.]+)',
+    re.IGNORECASE)
+
+class DirtyTableTracker(object):
+    """
+    Collect the names of the tables that receive INSERT, UPDATE, DELETE or
+    TRUNCATE statements on a connection.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.tables = set()
+
+    def start(self):
+        add_query_listener(self.connection, self.query_executed)
+
+    def stop(self):
+        remove_query_listener(self.connection, self.query_executed)
+
+    def query_executed(self, sql, duration):
+        match = WRITE_RE.match(sql)
+        if match:
+            self.tables.add(match.group(1))
+
+    def clear(self):
+        self.tables = set()
+
+class BaseFlusher(object):
+    """
+    Generic implementation using the backend's own ``sql_flush``.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.tables = []
+        self.seed = []
+
+    def get_tables(self):
+        introspection = self.connection.introspection
+        return sorted(introspection.django_table_names(only_existing=True))
+
+    def capture_seed(self):
+        """
+        Remember the contents of every non-empty table. Call this right after
+        the test database is created.
+        """
+        qn = self.connection.ops.quote_name
+        cursor = self.connection.cursor()
+
+        self.tables = self.get_tables()
+        self.seed = []
+        for table in self.tables:
+            cursor.execute('SELECT * FROM %s' % qn(table))
+            rows = cursor.fetchall()
+            if rows:
+                columns = [column[0] for column in cursor.description]
+                self.seed.append((table, columns, list(rows)))
+
+    def get_models(self, tables):
+        """
+        Return the models owning any of ``tables``, either directly or
+        through a many-to-many table.
+        """
+        from django.db import models
+
+        owners = set()
+        for model in models.get_models():
+            opts = model._meta
+            if opts.db_table in tables:
+                owners.add(model)
+            for field in opts.local_many_to_many:
+                if field.m2m_db_table() in tables:
+                    owners.add(model)
+        return owners
+
+    def truncate_sql(self, tables):
+        from django.core.management.color import no_style
+
+        sequences = [
+            sequence
+            for sequence in self.connection.introspection.sequence_list()
+            if sequence['table'] in tables
+        ]
+        return self.connection.ops.sql_flush(no_style(), tables, sequences)
+
+    def after_seed_sql(self, tables):
+        from django.core.management.color import no_style
+
+        return self.connection.ops.sequence_reset_sql(
+            no_style(), self.get_models(tables))
+
+    def insert_seed(self, cursor, tables):
+        qn = self.connection.ops.quote_name
+        for table, columns, rows in self.seed:
+            if table not in tables:
+                continue
+            sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+                qn(table),
+                ', '.join([qn(column) for column in columns]),
+                ', '.join(['%s'] * len(columns)))
+            cursor.executemany(sql, rows)
+
+    def flush(self, tables=None):
+        """
+        Empty the given tables (all of them by default), restore their seed
+        rows and return the list of tables that were reset.
+        """
+        from django.db import transaction
+
+        if tables is None:
+            tables = self.tables
+        else:
+            tables = [table for table in self.tables if table in tables]
+        if not tables:
+            return []
+
+        cursor = self.connection.cursor()
+        for sql in self.truncate_sql(tables):
+            cursor.execute(sql)
+        self.insert_seed(cursor, tables)
+        for sql in self.after_seed_sql(tables):
+            cursor.execute(sql)
+        transaction.commit_unless_managed(using=self.connection.alias)
+        return tables
+
+class PostgresFlusher(BaseFlusher):
+    def truncate_sql(self, tables):
+        qn = self.connection.ops.quote_name
+        if len(tables) < len(self.tables):
+            # TRUNCATE refuses to empty a table referenced by a table that
+            # isn't truncated along with it. Foreign keys are deferred until
+            # commit, so plain DELETEs work.
+            return ['DELETE FROM %s' % qn(table) for table in tables]
+        return ['TRUNCATE %s RESTART IDENTITY' % ', '.join(
+            [qn(table) for table in tables])]
+
+    def after_seed_sql(self, tables):
+        if len(tables) == len(self.tables):
+            # Every other sequence was restarted by the TRUNCATE
+            tables = [table for table, _, _ in self.seed]
+        return super(PostgresFlusher, self).after_seed_sql(tables)
+
+class SqliteFlusher(BaseFlusher):
+    def capture_seed(self):
+        super(SqliteFlusher, self).capture_seed()
+
+        cursor = self.connection.cursor()
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE name = 'sqlite_sequence'")
+        self.has_sequences = bool(cursor.fetchall())
+
+    def truncate_sql(self, tables):
+        qn = self.connection.ops.quote_name
+        sql = ['DELETE FROM %s' % qn(table) for table in tables]
+        if self.has_sequences:
+            sql.append('DELETE FROM sqlite_sequence WHERE name IN (%s)' % (
+                ', '.join(["'%s'" % table for table in tables])))
+        return sql
+
+    def after_seed_sql(self, tables):
+        # sqlite_sequence follows explicitly inserted ids on its own
+        return []
+
+class MysqlFlusher(BaseFlusher):
+    def truncate_sql(self, tables):
+        qn = self.connection.ops.quote_name
+        sql = ['SET FOREIGN_KEY_CHECKS = 0']
+        sql.extend(['TRUNCATE %s' % qn(table) for table in tables])
+        return sql
+
+    def after_seed_sql(self, tables):
+        # AUTO_INCREMENT counters follow explicitly inserted ids on their own
+        return ['SET FOREIGN_KEY_CHECKS = 1']
+
+def get_flusher(connection):
+    """
+    Return the flusher implementation for the connection's database engine.
+    """
+    engine = connection.settings_dict['ENGINE']
+    if 'sqlite3' in engine:
+        return SqliteFlusher(connection)
+    elif 'postgresql' in engine:
+        return PostgresFlusher(connection)
+    elif 'mysql' in engine:
+        return MysqlFlusher(connection)
+    return BaseFlusher(connection)
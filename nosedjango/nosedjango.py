@@ -4,17 +4,44 @@ database (or schema) and installs apps from test settings file before tests
 are run, and tears the test database (or schema) down after all tests are run.
 """
 
-from __future__ import with_statement
+from __future__ import absolute_import, with_statement
 
+import atexit
+import inspect
 import math
 import os
 import random
 import re
 import string
 import sys
+import time
+
+try:
+    import json
+except ImportError:
+    from django.utils import simplejson as json
 
 import nose.case
 from nose.plugins import Plugin
+from nose.suite import LazySuite
+
+from nosedjango.connections import reset_connection
+from nosedjango.contexts import FixtureContext
+from nosedjango.cursors import (
+    add_cursor_hook, add_query_listener, remove_cursor_hook)
+from nosedjango.databases import TestDatabases
+from nosedjango.fixtures import FixtureCache
+from nosedjango.flush import DirtyTableTracker, get_flusher
+from nosedjango.parallel import ThreadPool, can_use_thread
+from nosedjango.reuse import can_reuse, keep_test_db, reuse_test_db, set_state
+from nosedjango.scheduling import (
+    DurationHistory, get_context_key, group_tests)
+from nosedjango.schema import get_schema_fingerprint
+from nosedjango.startup import StartupProfile
+from nosedjango.tempdirs import (
+    ensure_private_dir, get_user_temp_dir, is_private_dir, is_private_file)
+from nosedjango.templatedb import get_snapshot, get_template
+from nosedjango import server, workers
 
 # Force settings.py pointer
 # search the current working directory and all parent directories to find
@@ -33,7 +60,8 @@ def get_settings_path(settings_module):
         settings_module.split('.')[-1]
     )
     while cwd:
-        if settings_filename in os.listdir(cwd):
+        # A single stat, listing big directories on network mounts is slow
+        if os.path.isfile(os.path.join(cwd, settings_filename)):
             break
         cwd = os.path.split(cwd)[0]
         if os.name == 'nt' and NT_ROOT.match(cwd):
@@ -42,6 +70,61 @@ def get_settings_path(settings_module):
             return None
     return cwd
 
+# The cached directory goes onto sys.path, so only the user's own private
+# directory will do
+SETTINGS_PATH_CACHE = os.path.join(get_user_temp_dir(), 'settings-paths.json')
+
+def _read_settings_path_cache(cache_path):
+    if not is_private_dir(os.path.dirname(cache_path)) \
+       or not is_private_file(cache_path):
+        return {}
+    try:
+        f = open(cache_path)
+        try:
+            return json.load(f)
+        finally:
+            f.close()
+    except (IOError, ValueError):
+        return {}
+
+def _write_settings_path_cache(cache_path, cache):
+    try:
+        if not ensure_private_dir(os.path.dirname(cache_path)):
+            return
+        tmp_path = '%s.%d.tmp' % (cache_path, os.getpid())
+        # Regardless of the umask, or the next read ignores it
+        f = os.fdopen(os.open(
+            tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600), 'w')
+        try:
+            json.dump(cache, f)
+        finally:
+            f.close()
+        os.rename(tmp_path, cache_path)
+    except (IOError, OSError):
+        # Only costs the next run a crawl
+        pass
+
+def get_cached_settings_path(settings_module,
+                             cache_path=SETTINGS_PATH_CACHE):
+    '''
+    get_settings_path(), remembering the result for the current directory.
+    A cached path is used as long as the settings file is still there.
+    '''
+    settings_filename = '%s.py' % settings_module.split('.')[-1]
+    key = '%s:%s' % (os.getcwd(), settings_module)
+
+    cache = _read_settings_path_cache(cache_path)
+    settings_path = cache.get(key)
+    if settings_path is not None \
+       and os.path.isfile(os.path.join(settings_path, settings_filename)):
+        return settings_path
+
+    settings_path = get_settings_path(settings_module)
+    if settings_path:
+        cache[key] = settings_path
+        _write_settings_path_cache(cache_path, cache)
+    return settings_path
+
 def _dummy(*args, **kwargs):
     """Dummy function that replaces the transaction functions"""
     return
@@ -63,6 +146,20 @@ class NoseDjango(Plugin):
         Plugin.__init__(self)
         self.nose_config = None
         self.django_plugins = []
+        self.fixture_context = None
+        self.flusher = None
+        self.dirty_tables = None
+        self.server_client = None
+        self.is_warm = False
+        self.duration_history = None
+        self.context_starts = {}
+        self.schema_snapshot = None
+        self.test_db_created = False
+        self.test_databases = None
+        self.reused_fingerprint = None
+        self.query_count = 0
+        self.test_query_count = 0
+        self.startup_profile = StartupProfile(False)
 
     def disable_transaction_support(self, transaction):
         self.orig_commit = transaction.commit
@@ -92,6 +189,145 @@ class NoseDjango(Plugin):
                           help='Use custom Django settings module.',
                           metavar='SETTINGS',
                           )
+        parser.add_option('--django-settings-path',
+                          help='Directory to add to sys.path for importing '
+                          'the settings module, instead of looking for it '
+                          'in the working directory and its parents.',
+                          metavar='DIR',
+                          default=None,
+                          )
+        parser.add_option('--django-template-db',
+                          help='Build the test database once into a '
+                          'template and clone it on later runs. The '
+                          'template is rebuilt whenever the schema changes. '
+                          'Supported for sqlite and PostgreSQL.',
+                          action='store_true',
+                          dest='django_template_db',
+                          default=False,
+                          )
+        parser.add_option('--django-template-dir',
+                          help='Directory for storing sqlite test database '
+                          'templates.',
+                          metavar='DIR',
+                          default=None,
+                          )
+        parser.add_option('--django-no-fixture-cache',
+                          help='Load test fixtures with loaddata before '
+                          'every test instead of parsing each fixture file '
+                          'once and re-saving the cached objects.',
+                          action='store_true',
+                          dest='django_no_fixture_cache',
+                          default=False,
+                          )
+        parser.add_option('--django-context-fixtures',
+                          help='Load the fixtures of a test class or module '
+                          'once, when its tests start, and roll each test '
+                          'back to a savepoint instead of reloading them.',
+                          action='store_true',
+                          dest='django_context_fixtures',
+                          default=False,
+                          )
+        parser.add_option('--django-flush-command',
+                          help='Reset the database with Django\'s flush '
+                          'command after tests that don\'t use transaction '
+                          'isolation, instead of emptying the tables and '
+                          'restoring the rows present when the test database '
+                          'was created.',
+                          action='store_true',
+                          dest='django_flush_command',
+                          default=False,
+                          )
+        parser.add_option('--django-lazy-db',
+                          help='Only create the test database once a test '
+                          'needs it, so that runs of tests that never touch '
+                          'the database skip creating it.',
+                          action='store_true',
+                          dest='django_lazy_db',
+                          default=False,
+                          )
+        parser.add_option('--django-keep-connection',
+                          help='Keep the database connection open after '
+                          'rolling back a test and reset its session '
+                          'instead of reconnecting for the next test.',
+                          action='store_true',
+                          dest='django_keep_connection',
+                          default=False,
+                          )
+        parser.add_option('--django-reuse-db',
+                          help='Keep the test database at the end of the '
+                          'run and reuse it on the next run, unless the '
+                          'models changed in between.',
+                          action='store_true',
+                          dest='django_reuse_db',
+                          default=False,
+                          )
+        parser.add_option('--django-async-teardown',
+                          help='Drop the test databases in a background '
+                          'process once the run is over instead of waiting '
+                          'for them to be dropped.',
+                          action='store_true',
+                          dest='django_async_teardown',
+                          default=False,
+                          )
+        parser.add_option('--django-duration-scheduling',
+                          help='Time every test and test class and, with '
+                          '--processes, hand the slowest batches of tests '
+                          'to the workers first, based on earlier runs.',
+                          action='store_true',
+                          dest='django_duration_scheduling',
+                          default=False,
+                          )
+        parser.add_option('--django-duration-file',
+                          help='History file for --django-duration-scheduling '
+                          '(default .nosedjango-durations.json).',
+                          metavar='FILE',
+                          default='.nosedjango-durations.json',
+                          )
+        parser.add_option('--django-group-tests',
+                          help='Run tests that share their fixtures, URLconf '
+                          'and transaction isolation one after another, '
+                          'transactional tests first.',
+                          action='store_true',
+                          dest='django_group_tests',
+                          default=False,
+                          )
+        parser.add_option('--django-startup-profile',
+                          help='Time each stage of finding the settings, '
+                          'setting up Django and creating the test database, '
+                          'and print the breakdown before the tests run.',
+                          action='store_true',
+                          dest='django_startup_profile',
+                          default=False,
+                          )
+        parser.add_option('--django-server',
+                          help='Set up Django and the test database once and '
+                          'keep a pool of worker processes waiting for test '
+                          'runs started with --django-use-server.',
+                          action='store_true',
+                          dest='django_server',
+                          default=False,
+                          )
+        parser.add_option('--django-use-server',
+                          help='Run the tests on a running --django-server '
+                          'instead of setting up Django in this process. '
+                          'Falls back to a local run if no server is '
+                          'listening.',
+                          action='store_true',
+                          dest='django_use_server',
+                          default=False,
+                          )
+        parser.add_option('--django-server-socket',
+                          help='Unix socket the test server listens on.',
+                          metavar='PATH',
+                          default=None,
+                          )
+        parser.add_option('--django-server-workers',
+                          help='Number of warmed worker processes the test '
+                          'server keeps waiting for runs (default 2).',
+                          metavar='N',
+                          type='int',
+                          default=2,
+                          )
         super(NoseDjango, self).options(parser, env)
 
     def configure(self, options, conf):
@@ -103,14 +339,73 @@ class NoseDjango(Plugin):
         else:
             self.settings_module = 'settings'
 
+        self.explicit_settings_path = None
+        if options.django_settings_path:
+            self.explicit_settings_path = os.path.abspath(
+                options.django_settings_path)
+
+        self.use_template_db = options.django_template_db
+        self.default_template_dir = not options.django_template_dir
+        if options.django_template_dir:
+            self.template_dir = os.path.abspath(options.django_template_dir)
+        else:
+            self.template_dir = get_user_temp_dir()
+
+        if options.django_no_fixture_cache:
+            self.fixture_cache = None
+        else:
+            self.fixture_cache = FixtureCache()
+
+        self.use_context_fixtures = options.django_context_fixtures
+        self.use_flush_command = options.django_flush_command
+
+        if options.django_duration_scheduling:
+            self.duration_history = DurationHistory(
+                os.path.abspath(options.django_duration_file))
+
+        self.lazy_db = options.django_lazy_db
+        self.keep_connection = options.django_keep_connection
+        self.async_teardown = options.django_async_teardown
+        self.reuse_db = options.django_reuse_db
+        self.group_tests = options.django_group_tests
+        self.run_server = options.django_server
+        self.use_server = options.django_use_server
+        self.server_socket = options.django_server_socket \
+                or server.get_default_socket_path(self.settings_module)
+        self.server_workers = options.django_server_workers
+        # Workers would all print the same breakdown
+        self.startup_profile = StartupProfile(
+            options.django_startup_profile
+            and not getattr(conf, 'worker', False))
+
         super(NoseDjango, self).configure(options, conf)
 
         self.nose_config = conf
 
+    def _call_plugin(self, plugin, meth_name, args, kwargs):
+        method = getattr(plugin, meth_name)
+        if not self.startup_profile.active:
+            # Most hooks run for every test, long after startup
+            return method(*args, **kwargs)
+        with self.startup_profile.stage('%s (%s)' % (meth_name, plugin.name)):
+            return method(*args, **kwargs)
+
     def call_plugins_method(self, meth_name, *args, **kwargs):
         for plugin in self.django_plugins:
             if hasattr(plugin, meth_name):
-                getattr(plugin, meth_name)(*args, **kwargs)
+                self._call_plugin(plugin, meth_name, args, kwargs)
+
+    def call_plugins_first(self, meth_name, *args, **kwargs):
+        """
+        Call ``meth_name`` on each plugin until one of them returns a true
+        value, and return that value.
+        """
+        for plugin in self.django_plugins:
+            if hasattr(plugin, meth_name):
+                result = self._call_plugin(plugin, meth_name, args, kwargs)
+                if result:
+                    return result
+        return None
 
     def begin(self):
         """
@@ -118,63 +413,432 @@ class NoseDjango(Plugin):
         connection over to that database. Then call install() to install
         all apps listed in the loaded settings module.
         """
+        self.startup_profile.add(
+            'other plugins, until begin',
+            time.time() - self.startup_profile.start)
+
+        if not getattr(self.nose_config, 'worker', False):
+            # Left by an earlier multiprocess run in this process
+            workers.run_pending_drops()
+
         for plugin in self.nose_config.plugins.plugins:
             if getattr(plugin, 'django_plugin', False):
                 self.django_plugins.append(plugin)
 
+        if self.duration_history is not None:
+            if getattr(self.nose_config, 'worker', False):
+                self.duration_history.open_journal()
+            else:
+                self.duration_history.load()
+
+        if server.get_warm_plugin() is not None:
+            self._use_warm_server_state(server.get_warm_plugin())
+            self._count_queries()
+            return
+
+        if self.use_server:
+            self.server_client = server.connect(self.server_socket)
+            if self.server_client is not None:
+                # Leave Django alone, the server has it all set up
+                self.settings_path = None
+                return
+            sys.stderr.write('No nosedjango server is listening on %s, '
+                             'running the tests here\n' % self.server_socket)
+
         os.environ['DJANGO_SETTINGS_MODULE'] = self.settings_module
 
         if self.conf.addPaths:
-            map(add_path, self.conf.where)
+            with self.startup_profile.stage('add test paths to sys.path'):
+                map(add_path, self.conf.where)
+
+        if self.explicit_settings_path:
+            # Told where the settings are, no need to look for them
+            add_path(self.explicit_settings_path)
+            sys.path.append(self.explicit_settings_path)
+            self.settings_path = self.explicit_settings_path
+        else:
+            try:
+                with self.startup_profile.stage(
+                    'import %s' % self.settings_module):
+                    __import__(self.settings_module)
+                self.settings_path = self.settings_module
+            except ImportError:
+                # Settings module is not found in PYTHONPATH. Try to do
+                # some funky backwards crawling in directory tree, ie. add
+                # the working directory (and any package parents) to
+                # sys.path before trying to import django modules;
+                # otherwise, they won't be able to find project.settings
+                # if the working dir is project/ or project/..
+
+                with self.startup_profile.stage('settings path discovery'):
+                    self.settings_path = get_cached_settings_path(
+                        self.settings_module)
+
+                if not self.settings_path:
+                    # short circuit if no settings file can be found
+                    raise RuntimeError("Can't find Django settings file!")
+
+                add_path(self.settings_path)
+                sys.path.append(self.settings_path)
+
+        with self.startup_profile.stage('django.conf.settings'):
+            from django.conf import settings
+
+            # Some Django code paths evaluate differently
+            # between DEBUG and not DEBUG.  Example of this include the url
+            # dispatcher when 404's are hit.  Django's own test runner forces
+            # DEBUG to be off.
+            settings.DEBUG = False
 
-        try:
-            __import__(self.settings_module)
-            self.settings_path = self.settings_module
-        except ImportError:
-            # Settings module is not found in PYTHONPATH. Try to do
-            # some funky backwards crawling in directory tree, ie. add
-            # the working directory (and any package parents) to
-            # sys.path before trying to import django modules;
-            # otherwise, they won't be able to find project.settings
-            # if the working dir is project/ or project/..
+        self.call_plugins_method('beforeConnectionSetup', settings)
 
-            self.settings_path = get_settings_path(self.settings_module)
+        with self.startup_profile.stage('import Django'):
+            from django.core import management
+            from django.test.utils import setup_test_environment
 
-            if not self.settings_path:
-                # short circuit if no settings file can be found
-                raise RuntimeError("Can't find Django settings file!")
+            self.old_db = settings.DATABASES['default']['NAME']
+            from django.db import connection
+
+        self.call_plugins_method(
+            'beforeTestSetup', settings, setup_test_environment, connection)
+        with self.startup_profile.stage('setup_test_environment'):
+            setup_test_environment()
+        self.call_plugins_method('afterTestSetup', settings)
 
-            add_path(self.settings_path)
-            sys.path.append(self.settings_path)
+        if self.startup_profile.active:
+            # Otherwise the models are imported whenever Django first needs
+            # them, usually while creating the test database
+            self._load_app_models(settings)
 
-        from django.conf import settings
+        with self.startup_profile.stage('management commands'):
+            management.get_commands()
+        management._commands['syncdb'] = 'django.core'
 
-        # Some Django code paths evaluate differently
-        # between DEBUG and not DEBUG.  Example of this include the url
-        # dispatcher when 404's are hit.  Django's own test runner forces DEBUG
-        # to be off.
-        settings.DEBUG = False
+        self.test_databases = TestDatabases(self.verbosity, reuse=self.reuse_db)
+        self._count_queries()
+
+        is_multiprocess_main = \
+            getattr(self.nose_config, 'multiprocess_workers', 0) \
+            and not getattr(self.nose_config, 'worker', False)
+        if self.lazy_db and not is_multiprocess_main and not self.run_server:
+            # Anything reaching for a cursor before then would end up in the
+            # real database
+            for lazy_connection in self._get_connections():
+                add_cursor_hook(lazy_connection, self._create_test_db_on_demand)
+            self.begin_end = time.time()
+            return
 
-        self.call_plugins_method('beforeConnectionSetup', settings)
+        with self.startup_profile.stage('test database'):
+            self._set_up_test_db()
 
-        from django.core import management
-        from django.test.utils import setup_test_environment
+        if is_multiprocess_main:
+            # This database is only the master copy for the worker
+            # processes, which must not share our connection either
+            workers.publish_master_db(
+                self.old_db, settings.DATABASES['default']['NAME'])
+            self.test_databases.publish_master_dbs()
+            for master_connection in self._get_connections():
+                master_connection.close()
+        self.begin_end = time.time()
 
-        self.old_db = settings.DATABASES['default']['NAME']
+    def _load_app_models(self, settings):
+        """
+        Import the models of each installed app, timing every app.
+        """
+        with self.startup_profile.stage('app models'):
+            with self.startup_profile.stage('import django.db.models'):
+                from django.db.models.loading import cache
+
+            for app_name in settings.INSTALLED_APPS:
+                if app_name in cache.handled:
+                    continue
+                with self.startup_profile.stage(app_name):
+                    cache.load_app(app_name, True)
+            # Apps whose models had to wait for another app's
+            cache.get_apps()
+
+    def _get_connections(self):
+        """
+        The default connection followed by those of the other aliases.
+        """
         from django.db import connection
 
-        self.call_plugins_method(
-            'beforeTestSetup', settings, setup_test_environment, connection)
-        setup_test_environment()
-        self.call_plugins_method('afterTestSetup', settings)
+        return [connection] + self.test_databases.connections()
 
-        management.get_commands()
-        management._commands['syncdb'] = 'django.core'
+    def _count_queries(self):
+        from django.db import connections
+
+        for alias in connections:
+            add_query_listener(connections[alias], self._query_executed)
+
+    def _query_executed(self, sql, duration):
+        self.query_count += 1
+
+    def _test_used_database(self):
+        """
+        Did the current test run any queries, in any thread?
+        """
+        return self.query_count != self.test_query_count
+
+    def _uses_database(self, test):
+        """
+        Tests declaring ``uses_database = False`` skip all of the per-test
+        database bookkeeping.
+        """
+        return getattr(test.context, 'uses_database', True)
+
+    def _can_skip_clean_up(self, test, use_transaction_isolation,
+                           using_django_testcase_management):
+        """
+        Can ``afterTest`` leave the database alone? Only if the test ran no
+        queries and either had its own transaction, which then has nothing
+        to roll back, or said it doesn't use the database. Other tests are
+        flushed regardless, as other processes may have written to the
+        database for them.
+        """
+        if self._test_used_database() or self._should_rebuild_schema(test):
+            return False
+        if not self._uses_database(test):
+            return True
+        return use_transaction_isolation \
+            and not using_django_testcase_management
+
+    def _set_up_test_db(self):
+        from django.conf import settings
+        from django.core import management
+        from django.db import connection
 
         self.call_plugins_method(
             'beforeTestDb', settings, connection, management)
-        connection.creation.create_test_db(verbosity=self.verbosity)
+        if self.test_databases:
+            # Databases on servers are created while we create ours
+            self.test_databases.start_set_up()
+        try:
+            with self.startup_profile.stage('create test database'):
+                self._create_test_db(settings, connection)
+        except:
+            exc_type, exc_value, exc_tb = sys.exc_info()
+            if self.test_databases:
+                self.test_databases.abort_set_up()
+            raise exc_type, exc_value, exc_tb
         self.call_plugins_method('afterTestDb', settings, connection)
+        with self.startup_profile.stage('capture seed rows'):
+            self._capture_seed(connection)
+        if self.test_databases:
+            with self.startup_profile.stage('other test databases'):
+                self.test_databases.set_up(
+                    capture_seed=not self.use_flush_command)
+        self.test_db_created = True
+
+    def _ensure_test_db(self):
+        """
+        With ``--django-lazy-db``, create the test database if it doesn't
+        exist yet.
+        """
+        from django.db import connection
+
+        if self.test_db_created:
+            return
+        for lazy_connection in self._get_connections():
+            remove_cursor_hook(lazy_connection, self._create_test_db_on_demand)
+        self._set_up_test_db()
+
+    def _create_test_db_on_demand(self, connection):
+        """
+        Cursor hook creating the test database when a test that wasn't known
+        to need it asks for a cursor.
+        """
+        from django.db import transaction
+
+        # Step out of the test's transaction, otherwise it would roll the
+        # new database back along with the test. Nothing has run in it yet.
+        in_test_transaction = transaction.commit is _dummy
+        if in_test_transaction:
+            self.restore_transaction_support(transaction)
+            transaction.leave_transaction_management()
+            self.test_databases.leave_transactions(rollback=False)
+
+        self._ensure_test_db()
+
+        if in_test_transaction:
+            transaction.enter_transaction_management()
+            transaction.managed(True)
+            self.test_databases.enter_transactions()
+            self.disable_transaction_support(transaction)
+
+    def _test_needs_database(self, test):
+        """
+        Does the test need the database before it starts? Tests that only
+        turn out to need it later get it on their first cursor.
+        """
+        from django.test import TransactionTestCase
+
+        if not isinstance(test, nose.case.Test):
+            return False
+        context = test.context
+        uses_database = getattr(context, 'uses_database', None)
+        if uses_database is not None:
+            return uses_database
+        return bool(getattr(context, 'fixtures', None)) \
+           or getattr(context, 'rebuild_schema', False) \
+           or isinstance(test.test, TransactionTestCase)
+
+    def _use_warm_server_state(self, warm_plugin):
+        """
+        Take over the already created test database inside a test server
+        worker.
+        """
+        self.is_warm = True
+        self.settings_path = warm_plugin.settings_path
+        self.old_db = warm_plugin.old_db
+        self.flusher = warm_plugin.flusher
+        self.dirty_tables = warm_plugin.dirty_tables
+        self.test_databases = warm_plugin.test_databases
+        self.test_db_created = True
+        if self.dirty_tables is not None:
+            self.dirty_tables.clear()
+        for tracker in self.test_databases.dirty_tables.values():
+            tracker.clear()
+
+    def loadTestsFromNames(self, names, module=None):
+        if self.server_client is not None:
+            # Importing the tests would import Django; the server does that
+            return None, []
+        return None
+
+    def prepareTest(self, test):
+        """
+        With ``--django-duration-scheduling`` and ``--processes``, hand the
+        batches of tests to the workers longest-first. With
+        ``--django-group-tests``, run tests sharing their setup together.
+        """
+        self._finish_startup_profile()
+
+        if getattr(self.nose_config, 'worker', False) or not self.settings_path:
+            return None
+
+        if self.duration_history is not None \
+           and getattr(self.nose_config, 'multiprocess_workers', 0):
+            from nose.plugins.multiprocess import MultiProcessTestRunner
+
+            # Split the suite exactly the way the multiprocess runner will
+            batches = list(
+                MultiProcessTestRunner(config=self.nose_config).nextBatch(test))
+            return LazySuite(self.duration_history.order_batches(batches))
+
+        if self.group_tests:
+            return group_tests(test, self._get_setup_key)
+        return None
+
+    def _finish_startup_profile(self):
+        if not self.startup_profile.active:
+            return
+        if hasattr(self, 'begin_end'):
+            self.startup_profile.add(
+                'loading tests', time.time() - self.begin_end)
+        self.startup_profile.finish(sys.stderr)
+
+    def _get_setup_key(self, context):
+        """
+        Sort key describing the database setup a context's tests need.
+        """
+        from django.conf import settings
+
+        fixtures = getattr(context, 'fixtures', None) or ()
+        return (
+            bool(getattr(context, 'rebuild_schema', False)),
+            not self._context_uses_transaction_isolation(context, settings),
+            tuple(fixtures),
+            getattr(context, 'urls', None) or '',
+        )
+
+    def prepareTestRunner(self, runner):
+        if self.server_client is not None:
+            argv = [arg for arg in sys.argv[1:] if arg != '--django-use-server']
+            return server.ClientRunner(
+                self.server_client, argv, self.settings_module,
+                self.nose_config)
+        if self.run_server and not self.is_warm:
+            return server.TestServer(
+                self, self.server_socket, self.server_workers,
+                self.nose_config)
+        return None
+
+    def _can_use_template_dir(self):
+        """
+        Templates restored from the default directory are trusted, so skip
+        them if the directory isn't private to this user.
+        """
+        if not self.default_template_dir \
+           or ensure_private_dir(self.template_dir):
+            return True
+        sys.stderr.write('Not using templates, %s is not private to this '
+                         'user\n' % self.template_dir)
+        return False
+
+    def _create_test_db(self, settings, connection):
+        """
+        Create the test database. With ``--django-template-db``, clone it from
+        a template matching the current schema when one exists, and save a new
+        template otherwise. Multiprocess workers clone the main process's test
+        database into one of their own.
+        """
+        if getattr(self.nose_config, 'worker', False):
+            master_db = workers.get_master_db()
+            if master_db is not None:
+                self.old_db, master_name = master_db
+                if workers.create_worker_db(
+                    connection, self.old_db, master_name, self.verbosity):
+                    return
+
+        if self.call_plugins_first(
+            'createTestDb', settings, connection, self.verbosity):
+            return
+
+        fingerprint = None
+        if self.use_template_db or self.reuse_db:
+            fingerprint = get_schema_fingerprint(settings, connection)
+
+        reuse = self.reuse_db and can_reuse(connection)
+        if reuse and reuse_test_db(connection, fingerprint, self.verbosity):
+            self.reused_fingerprint = fingerprint
+            return
+
+        template = None
+        if self.use_template_db and self._can_use_template_dir():
+            template = get_template(
+                connection,
+                self.old_db,
+                fingerprint,
+                self.template_dir)
+
+        if template is not None and template.exists():
+            template.restore(verbosity=self.verbosity)
+        else:
+            # A kept test database for other models goes without asking
+            connection.creation.create_test_db(
+                verbosity=self.verbosity, autoclobber=reuse)
+            if template is not None:
+                template.save()
+        if reuse:
+            set_state(connection, fingerprint, clean=False)
+            self.reused_fingerprint = fingerprint
+
+    def _capture_seed(self, connection):
+        """
+        Remember the freshly created database's rows (content types,
+        permissions, sites, initial data) so that non-transactional tests can
+        be cleaned up without Django's ``flush``.
+        """
+        if self.use_flush_command:
+            return
+        self.flusher = get_flusher(connection)
+        self.flusher.capture_seed()
+
+        if self.dirty_tables is None:
+            self.dirty_tables = DirtyTableTracker(connection)
+            self.dirty_tables.start()
+        self.dirty_tables.clear()
 
     def _should_use_transaction_isolation(self, test, settings):
         """
@@ -187,7 +851,14 @@ class NoseDjango(Plugin):
         work properly and any tests that depend on external access to the test
         database won't be able to view data created/altered during the test.
         """
-        if not getattr(test.context, 'use_transaction_isolation', True):
+        return self._context_uses_transaction_isolation(test.context, settings)
+
+    def _context_uses_transaction_isolation(self, context, settings):
+        if not getattr(context, 'uses_database', True):
+            # No transaction to roll back; should the test touch the
+            # database anyway, it gets flushed
+            return False
+        if not getattr(context, 'use_transaction_isolation', True):
             # The test explicitly says not to use transaction isolation
             return False
         if getattr(settings, 'DISABLE_TRANSACTION_MANAGEMENT', False):
@@ -221,40 +892,163 @@ class NoseDjango(Plugin):
             return True
         return False
 
+    def _should_use_context_fixtures(self, context, settings):
+        """
+        Should the fixtures for this context be loaded once for all of its
+        tests, with each test rolled back to a savepoint?
+        """
+        from django.test import TransactionTestCase
+
+        if not self.use_context_fixtures:
+            return False
+        if not getattr(context, 'fixtures', None):
+            return False
+        if getattr(context, 'rebuild_schema', False):
+            return False
+        if getattr(context, 'multi_db', False):
+            # Only the default database gets the savepoints
+            return False
+        if inspect.isclass(context) \
+           and issubclass(context, TransactionTestCase):
+            # Django's testcases manage their own transactions and fixtures
+            return False
+        return self._context_uses_transaction_isolation(context, settings)
+
+    def _can_run_in_fixture_context(self, test, settings):
+        return self._should_use_transaction_isolation(test, settings) \
+           and not self._should_use_django_testcase_management(test) \
+           and not self._should_rebuild_schema(test)
+
+    def startContext(self, context):
+        """
+        With ``--django-context-fixtures``, open a transaction spanning the
+        whole context and load the context's fixtures into it.
+        """
+        self.context_starts[id(context)] = time.time()
+
+        if not self.settings_path or self.fixture_context is not None:
+            # Tests in nested contexts run inside the outer context's
+            # savepoints
+            return
+
+        from django.conf import settings
+        from django.db import connection, transaction
+
+        if not self._should_use_context_fixtures(context, settings):
+            return
+
+        self._ensure_test_db()
+        transaction.enter_transaction_management()
+        transaction.managed(True)
+        self.test_databases.enter_transactions()
+        self.disable_transaction_support(transaction)
+
+        self.fixture_context = FixtureContext(context, connection)
+        self.fixture_context.begin()
+        self._load_fixtures(context.fixtures, commit=False, context=context)
+
+    def stopContext(self, context):
+        if self.fixture_context is not None \
+           and self.fixture_context.context is context:
+            self._end_fixture_context()
+
+        start = self.context_starts.pop(id(context), None)
+        if self.duration_history is not None and start is not None:
+            self.duration_history.record_context(
+                get_context_key(context), time.time() - start)
+
+    def _end_fixture_context(self):
+        """
+        Roll back the context-wide transaction, fixtures included.
+        """
+        from django.db import connection, transaction
+
+        self.restore_transaction_support(transaction)
+        self.fixture_context.rollback()
+        self.fixture_context = None
+        if transaction.is_managed():
+            transaction.leave_transaction_management()
+        self.test_databases.leave_transactions()
+        self._release_connection(connection)
+        for other_connection in self.test_databases.connections():
+            self._release_connection(other_connection)
+
     def afterTest(self, test):
         """
         Clean up any changes to the test database.
         """
+        try:
+            self._clean_up_test(test)
+        finally:
+            if self.duration_history is not None \
+               and hasattr(self, 'test_start'):
+                self.duration_history.record_test(
+                    test.id(), time.time() - self.test_start)
+
+    def _clean_up_test(self, test):
         # Restore transaction support on tests
         from django.conf import settings
         from django.contrib.contenttypes.models import ContentType
         from django.db import connection, transaction
-        from django.core.management import call_command
         from django.test.utils import setup_test_environment, teardown_test_environment
-        from django import VERSION as DJANGO_VERSION
 
-        if self._should_rebuild_schema(test):
-            connection.creation.destroy_test_db(
-                self.old_db, verbosity=self.verbosity)
-            teardown_test_environment()
-
-            setup_test_environment()
-            connection.creation.create_test_db(verbosity=self.verbosity)
+        if self.fixture_context is not None:
+            self.fixture_context.rollback_to_savepoint()
+            # Only the default database holds the context's fixtures
+            self.test_databases.rollback()
+            self.call_plugins_method('afterRollback', settings)
             return
 
         use_transaction_isolation = self._should_use_transaction_isolation(
             test, settings)
         using_django_testcase_management = self._should_use_django_testcase_management(test)
 
+        if self._can_skip_clean_up(
+                test, use_transaction_isolation,
+                using_django_testcase_management):
+            # Nothing to roll back, and the connection can stay open
+            if use_transaction_isolation \
+               and not using_django_testcase_management:
+                self.restore_transaction_support(transaction)
+                if transaction.is_managed():
+                    transaction.leave_transaction_management()
+                self.test_databases.leave_transactions(rollback=False)
+            self.call_plugins_method('afterRollback', settings)
+            return
+
+        if self._should_rebuild_schema(test):
+            if use_transaction_isolation \
+               and not using_django_testcase_management:
+                self.restore_transaction_support(transaction)
+                transaction.rollback()
+                if transaction.is_managed():
+                    transaction.leave_transaction_management()
+                self.test_databases.leave_transactions()
+
+            if self.schema_snapshot is not None:
+                teardown_test_environment()
+                self.schema_snapshot.restore(verbosity=self.verbosity)
+                setup_test_environment()
+            else:
+                connection.creation.destroy_test_db(
+                    self.old_db, verbosity=self.verbosity)
+                teardown_test_environment()
+
+                setup_test_environment()
+                connection.creation.create_test_db(verbosity=self.verbosity)
+            self._capture_seed(connection)
+            return
+
         if use_transaction_isolation \
            and not using_django_testcase_management:
             self.restore_transaction_support(transaction)
             transaction.rollback()
             if transaction.is_managed():
                 transaction.leave_transaction_management()
-            # If connection is not closed Postgres can go wild with
-            # character encodings.
-            connection.close()
+            self.test_databases.leave_transactions()
+            self._release_connection(connection)
+            for other_connection in self.test_databases.connections():
+                self._release_connection(other_connection)
         elif not use_transaction_isolation:
             # Have to clear the db even if we're using django because django
             # doesn't properly flush the database after a test. It relies on
@@ -262,69 +1056,123 @@ class NoseDjango(Plugin):
             # test doesn't flush and then a normal test runs, because it will
             # expect the db to already be flushed
             ContentType.objects.clear_cache() # Otherwise django.contrib.auth.Permissions will depend on deleted ContentTypes
-            call_command('flush', verbosity=0, interactive=False)
-
-            # In Django <1.2 Depending on the order of certain post-syncdb
-            # signals, ContentTypes can be removed accidentally. Manually delete and re-add all
-            # and recreate ContentTypes if we're using the contenttypes app
-            # See: http://code.djangoproject.com/ticket/9207
-            # See: http://code.djangoproject.com/ticket/7052
-            if DJANGO_VERSION[0] <= 1 and DJANGO_VERSION[1] < 2 \
-               and 'django.contrib.contenttypes' in settings.INSTALLED_APPS:
-                from django.contrib.contenttypes.models import ContentType
-                from django.contrib.contenttypes.management import update_all_contenttypes
-                from django.db import models
-                from django.contrib.auth.management import create_permissions
-                from django.contrib.auth.models import Permission
-
-                ContentType.objects.all().delete()
-                ContentType.objects.clear_cache()
-                update_all_contenttypes(verbosity=0)
-
-                # Because of various ways of handling auto-increment, we need to
-                # make sure the new contenttypes start at 1
-                next_pk = 1
-                content_types = list(ContentType.objects.all().order_by('pk'))
-                ContentType.objects.all().delete()
-                for ct in content_types:
-                    ct.pk = next_pk
-                    ct.save()
-                    next_pk += 1
-
-                # Because of the same problems with ContentTypes, we can get
-                # busted permissions
-                Permission.objects.all().delete()
-                for app in models.get_apps():
-                    create_permissions(app=app, created_models=None, verbosity=0)
-
-                # Because of various ways of handling auto-increment, we need to
-                # make sure the new permissions start at 1
-                next_pk = 1
-                permissions = list(Permission.objects.all().order_by('pk'))
-                Permission.objects.all().delete()
-                for perm in permissions:
-                    perm.pk = next_pk
-                    perm.save()
-                    next_pk += 1
+            if self.flusher is not None:
+                self._flush_dirty_tables(test)
+            else:
+                self._flush_with_command()
+            self.test_databases.flush()
 
         self.call_plugins_method('afterRollback', settings)
 
+    def _release_connection(self, connection):
+        """
+        Close the connection after a rollback, or reset its session with
+        ``--django-keep-connection``.
+        """
+        if self.keep_connection and reset_connection(connection):
+            return
+        # If connection is not closed Postgres can go wild with
+        # character encodings.
+        connection.close()
+
+    def _flush_dirty_tables(self, test):
+        """
+        Reset the tables written to since the last reset. Writes from tests
+        that were rolled back still count, since a live server thread could
+        have committed them on its own connection.
+        """
+        tables = self.flusher.flush(self.dirty_tables.tables)
+        self.dirty_tables.clear()
+
+        if tables and self.verbosity >= 2:
+            sys.stderr.write("    Reset %d table(s) after %s: %s\n" % (
+                len(tables), test, ', '.join(tables)))
+
+    def _flush_with_command(self):
+        """
+        Reset the database with Django's ``flush`` command.
+        """
+        from django.conf import settings
+        from django.core.management import call_command
+        from django import VERSION as DJANGO_VERSION
+
+        call_command('flush', verbosity=0, interactive=False)
+
+        # In Django <1.2 Depending on the order of certain post-syncdb
+        # signals, ContentTypes can be removed accidentally. Manually delete and re-add all
+        # and recreate ContentTypes if we're using the contenttypes app
+        # See: http://code.djangoproject.com/ticket/9207
+        # See: http://code.djangoproject.com/ticket/7052
+        if DJANGO_VERSION[0] <= 1 and DJANGO_VERSION[1] < 2 \
+           and 'django.contrib.contenttypes' in settings.INSTALLED_APPS:
+            from django.contrib.contenttypes.models import ContentType
+            from django.contrib.contenttypes.management import update_all_contenttypes
+            from django.db import models
+            from django.contrib.auth.management import create_permissions
+            from django.contrib.auth.models import Permission
+
+            ContentType.objects.all().delete()
+            ContentType.objects.clear_cache()
+            update_all_contenttypes(verbosity=0)
+
+            # Because of various ways of handling auto-increment, we need to
+            # make sure the new contenttypes start at 1
+            next_pk = 1
+            content_types = list(ContentType.objects.all().order_by('pk'))
+            ContentType.objects.all().delete()
+            for ct in content_types:
+                ct.pk = next_pk
+                ct.save()
+                next_pk += 1
+
+            # Because of the same problems with ContentTypes, we can get
+            # busted permissions
+            Permission.objects.all().delete()
+            for app in models.get_apps():
+                create_permissions(app=app, created_models=None, verbosity=0)
+
+            # Because of various ways of handling auto-increment, we need to
+            # make sure the new permissions start at 1
+            next_pk = 1
+            permissions = list(Permission.objects.all().order_by('pk'))
+            Permission.objects.all().delete()
+            for perm in permissions:
+                perm.pk = next_pk
+                perm.save()
+                next_pk += 1
+
     def beforeTest(self, test):
         """
         Load any database fixtures, set up any test url configurations and
         prepare for using transactions for database rollback if possible.
         """
+        self.test_start = time.time()
         if not self.settings_path:
             # short circuit if no settings file can be found
             return
 
         from django.contrib.sites.models import Site
         from django.contrib.contenttypes.models import ContentType
-        from django.core.management import call_command
         from django.core.urlresolvers import clear_url_caches
         from django.conf import settings
         from django.db import transaction
 
+        if self.fixture_context is not None:
+            if self._can_run_in_fixture_context(test, settings):
+                self._before_fixture_context_test(test, settings)
+                return
+            # This test needs a real commit/rollback or flush, so the
+            # remaining tests of the context go back to loading their
+            # fixtures one test at a time.
+            self._end_fixture_context()
+
+        if self._test_needs_database(test):
+            self._ensure_test_db()
+        self.test_query_count = self.query_count
+
+        if self._should_rebuild_schema(test) and self.schema_snapshot is None:
+            self._save_schema_snapshot()
+
         use_transaction_isolation = self._should_use_transaction_isolation(
             test, settings)
         using_django_testcase_management = self._should_use_django_testcase_management(test)
@@ -333,26 +1181,28 @@ class NoseDjango(Plugin):
             self.call_plugins_method('beforeTransactionManagement', settings, test)
             transaction.enter_transaction_management()
             transaction.managed(True)
+            self.test_databases.enter_transactions()
             self.disable_transaction_support(transaction)
 
-        Site.objects.clear_cache()
-        ContentType.objects.clear_cache() # Otherwise django.contrib.auth.Permissions will depend on deleted ContentTypes
+        uses_database = self._uses_database(test)
+        if uses_database:
+            Site.objects.clear_cache()
+            ContentType.objects.clear_cache() # Otherwise django.contrib.auth.Permissions will depend on deleted ContentTypes
 
         if use_transaction_isolation and not using_django_testcase_management:
             self.call_plugins_method('afterTransactionManagement', settings, test)
 
         self.call_plugins_method('beforeFixtureLoad', settings, test)
         if isinstance(test, nose.case.Test) \
-           and not using_django_testcase_management:
+           and not using_django_testcase_management \
+           and uses_database:
             # Mirrors django.test.testcases:TestCase
 
             if hasattr(test.context, 'fixtures'):
-                # We have to use this slightly awkward syntax due to the fact
-                # that we're using *args and **kwargs together.
-                if use_transaction_isolation:
-                    call_command('loaddata', *test.context.fixtures, **{'verbosity': 0, 'commit': False})
-                else:
-                    call_command('loaddata', *test.context.fixtures, **{'verbosity': 0})
+                self._load_fixtures(
+                    test.context.fixtures,
+                    commit=not use_transaction_isolation,
+                    context=test.context)
         self.call_plugins_method('afterFixtureLoad', settings, test)
 
         self.call_plugins_method('beforeUrlConfLoad', settings, test)
@@ -362,14 +1212,192 @@ class NoseDjango(Plugin):
             # We have to use this slightly awkward syntax due to the fact
             # that we're using *args and **kwargs together.
             self.old_urlconf = settings.ROOT_URLCONF
-            settings.ROOT_URLCONF = self.urls
+            settings.ROOT_URLCONF = test.context.urls
+            clear_url_caches()
+        self.call_plugins_method('afterUrlConfLoad', settings, test)
+
+    def _save_schema_snapshot(self):
+        """
+        Snapshot the database before the first test that alters the schema,
+        so that ``afterTest`` can restore it instead of building a new test
+        database. Only taken when needed, as it copies the whole database, so
+        rows earlier tests left behind are removed first: tests without
+        transaction isolation are only reset before the next such test, and
+        Django's ``TransactionTestCase`` flushes before it runs, not after.
+        """
+        from django.core.management import call_command
+        from django.db import connection
+
+        if not self._reset_dirty_tables():
+            call_command('flush', verbosity=0, interactive=False)
+        self.schema_snapshot = get_snapshot(connection, self.old_db)
+        if self.schema_snapshot is not None:
+            self.schema_snapshot.save()
+
+    def _before_fixture_context_test(self, test, settings):
+        """
+        Prepare a test that runs inside the open fixture context: set a
+        savepoint and only load fixtures the context didn't already load.
+        """
+        from django.contrib.sites.models import Site
+        from django.contrib.contenttypes.models import ContentType
+        from django.core.urlresolvers import clear_url_caches
+
+        self.fixture_context.savepoint()
+
+        Site.objects.clear_cache()
+        ContentType.objects.clear_cache()
+
+        self.call_plugins_method('beforeFixtureLoad', settings, test)
+        if isinstance(test, nose.case.Test) \
+           and test.context is not self.fixture_context.context \
+           and hasattr(test.context, 'fixtures'):
+            self._load_fixtures(
+                test.context.fixtures, commit=False, context=test.context)
+        self.call_plugins_method('afterFixtureLoad', settings, test)
+
+        self.call_plugins_method('beforeUrlConfLoad', settings, test)
+        if isinstance(test, nose.case.Test) \
+           and hasattr(test.context, 'urls'):
+            self.old_urlconf = settings.ROOT_URLCONF
+            settings.ROOT_URLCONF = test.context.urls
             clear_url_caches()
         self.call_plugins_method('afterUrlConfLoad', settings, test)
 
+    def _load_fixtures(self, fixtures, commit, context=None):
+        """
+        Install ``fixtures`` from the fixture cache, falling back to
+        ``loaddata`` for anything the cache can't handle. Like Django's
+        ``TestCase``, contexts with ``multi_db = True`` get them installed in
+        every database. Duplicates and mirrors already see them through the
+        alias they share a database with.
+        """
+        from django.core.management import call_command
+        from django.db import DEFAULT_DB_ALIAS
+
+        aliases = [DEFAULT_DB_ALIAS]
+        if getattr(context, 'multi_db', False):
+            aliases.extend(self.test_databases.created)
+
+        for alias in aliases:
+            if self.fixture_cache is not None \
+               and self.fixture_cache.load(
+                   fixtures, using=alias, commit=commit):
+                continue
+
+            # We have to use this slightly awkward syntax due to the fact
+            # that we're using *args and **kwargs together.
+            call_command('loaddata', *fixtures, **{
+                'verbosity': 0, 'commit': commit, 'database': alias})
+
+    def _destroy_test_db(self, settings, connection, workers_stopped=False):
+        """
+        Drop the test databases of every alias, all at once where the engine
+        allows it.
+        """
+        self.call_plugins_method('beforeDestroyTestDb', settings, connection)
+        if self.schema_snapshot is not None:
+            self.schema_snapshot.delete()
+        master_name = settings.DATABASES['default']['NAME']
+        master_dbs = self.test_databases.get_test_db_names()
+
+        pool = ThreadPool()
+        if self.reused_fingerprint is not None:
+            keep_test_db(
+                connection, self.old_db, self.reused_fingerprint,
+                self._reset_dirty_tables(), self.verbosity)
+        elif can_use_thread(connection):
+            pool.submit(connection.creation.destroy_test_db,
+                        self.old_db, verbosity=self.verbosity)
+        else:
+            connection.creation.destroy_test_db(
+                self.old_db, verbosity=self.verbosity)
+        if self.test_databases.is_set_up:
+            self.test_databases.tear_down(pool)
+        pool.join()
+
+        if workers.get_master_db() is not None:
+            destroy_worker_dbs = [
+                (workers.destroy_worker_dbs, connection, self.old_db,
+                 master_name, self.verbosity),
+                (self.test_databases.destroy_worker_dbs, master_dbs),
+                (self._clear_master_dbs,)]
+            if workers_stopped:
+                for call in destroy_worker_dbs:
+                    call[0](*call[1:])
+            else:
+                # The workers are still connected to their databases at
+                # this point; nose only stops them after finalize
+                workers.drop_later(*destroy_worker_dbs)
+        self.call_plugins_method('afterDestroyTestDb', settings, connection)
+
+    def _clear_master_dbs(self):
+        """
+        Forget the names published for the workers once their databases are
+        gone, so that a later run in this process doesn't take itself for a
+        worker.
+        """
+        workers.clear_master_db()
+        self.test_databases.clear_master_dbs()
+
+    def _reset_dirty_tables(self):
+        """
+        Put the rows of the tables written to since the last reset back the
+        way they were after the test database was created. Returns whether
+        the database was left clean.
+        """
+        if self.flusher is None or self.dirty_tables is None:
+            # --django-flush-command
+            return False
+        self.flusher.flush(self.dirty_tables.tables)
+        self.dirty_tables.clear()
+        return True
+
+    def _destroy_test_db_later(self, settings, connection):
+        """
+        With ``--django-async-teardown``, leave dropping the test databases
+        to a background process started once nose is done, so that the run
+        ends without waiting for the database server.
+        """
+        if not hasattr(os, 'fork'):
+            self._destroy_test_db(settings, connection)
+            return
+        for open_connection in self._get_connections():
+            open_connection.close()
+        atexit.register(
+            self._destroy_test_db_in_background, settings, connection)
+
+    def _destroy_test_db_in_background(self, settings, connection):
+        if os.fork():
+            self._clear_master_dbs()
+            return
+        # Detach from the terminal and from nose's exit status
+        try:
+            try:
+                os.setsid()
+                devnull = os.open(os.devnull, os.O_RDWR)
+                for fd in (0, 1, 2):
+                    os.dup2(devnull, fd)
+                self.verbosity = 0
+                self.test_databases.verbosity = 0
+                self._destroy_test_db(
+                    settings, connection, workers_stopped=True)
+            except:
+                pass
+        finally:
+            os._exit(0)
+
     def finalize(self, result=None):
         """
         Clean up any created database and schema.
         """
+        self._finish_startup_profile()
+
+        if self.duration_history is not None \
+           and not getattr(self.nose_config, 'worker', False):
+            self.duration_history.merge_journals()
+            self.duration_history.save()
+
         if not self.settings_path:
             # short circuit if no settings file can be found
             return
@@ -379,9 +1407,21 @@ class NoseDjango(Plugin):
         from django.conf import settings
         from django.core.urlresolvers import clear_url_caches
 
-        self.call_plugins_method('beforeDestroyTestDb', settings, connection)
-        connection.creation.destroy_test_db(self.old_db, verbosity=self.verbosity)
-        self.call_plugins_method('afterDestroyTestDb', settings, connection)
+        if self.is_warm:
+            # The test database belongs to the test server
+            if hasattr(self, 'old_urlconf'):
+                settings.ROOT_URLCONF = self.old_urlconf
+                clear_url_caches()
+            return
+
+        if self.test_db_created and self.async_teardown:
+            self._destroy_test_db_later(settings, connection)
+        elif self.test_db_created:
+            self._destroy_test_db(settings, connection)
+        else:
+            for lazy_connection in self._get_connections():
+                remove_cursor_hook(
+                    lazy_connection, self._create_test_db_on_demand)
 
         self.call_plugins_method(
             'beforeTeardownTestEnv', settings, teardown_test_environment)
@@ -0,0 +1,59 @@
+"""
+Creating and dropping test databases on a pool of threads. Most of that time
+is spent waiting for the database server, so the work for several databases
+overlaps well.
+"""
+
+import sys
+import threading
+
+MAX_THREADS = 8
+
+def can_use_thread(connection):
+    """
+    Can ``connection`` be set up or torn down in another thread? sqlite
+    connections only work in the thread that opened them, and sqlite
+    databases are quick to create anyway.
+    """
+    return 'sqlite3' not in connection.settings_dict['ENGINE']
+
+class ThreadPool(object):
+    """
+    Run calls in the background, at most ``max_threads`` at a time;
+    ``submit`` blocks until one of them is done. ``join`` waits for all of them and re-raises the first exception any of
+    them raised.
+    """
+    def __init__(self, max_threads=MAX_THREADS):
+        self.semaphore = threading.BoundedSemaphore(max_threads)
+        self.threads = []
+        self.errors = []
+
+    def submit(self, function, *args, **kwargs):
+        # Wait for a free slot first, so that there are never more than
+        # max_threads threads
+        self.semaphore.acquire()
+        thread = threading.Thread(
+            target=self._run, args=(function, args, kwargs))
+        try:
+            thread.start()
+        except:
+            self.semaphore.release()
+            raise
+        self.threads.append(thread)
+
+    def _run(self, function, args, kwargs):
+        try:
+            function(*args, **kwargs)
+        except:
+            self.errors.append(sys.exc_info())
+        finally:
+            self.semaphore.release()
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        if self.errors:
+            exc_type, exc_value, exc_tb = self.errors[0]
+            self.errors = []
+            raise exc_type, exc_value, exc_tb
@@ -49,6 +49,14 @@ class IPluginInterface(object):
     def beforeTestDb(self, settings, connection, management):
         pass
 
+    def createTestDb(self, settings, connection, verbosity):
+        """
+        Create the test database in place of ``create_test_db``. Return
+        ``True`` if the database was created, so that nosedjango and any
+        remaining plugins skip their own creation.
+        """
+        pass
+
     def afterTestDb(self, settings, connection):
         pass
 
@@ -0,0 +1,272 @@
+import glob
+import os
+import sys
+import time
+
+try:
+    import json
+except ImportError:
+    from django.utils import simplejson as json
+
+from nosedjango.plugins.base_plugin import Plugin
+
+PHASES = ('transaction', 'fixtures', 'urlconf', 'test', 'teardown')
+SORT_COLUMNS = ('total',) + PHASES + ('queries', 'sql')
+
+def get_column(profile, column):
+    """
+    ``column`` of a profile as returned by ``TestProfile.as_dict``.
+    """
+    if column == 'total':
+        return profile['total']
+    if column == 'queries':
+        return profile['queries']
+    if column == 'sql':
+        return profile['sql_time']
+    return profile['phases'][column]
+
+class TestProfile(object):
+    """
+    Timings and query counts for a single test.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.start = time.time()
+        self.end = None
+        self.phase = None
+        self.phase_start = None
+        self.phases = dict((phase, 0.0) for phase in PHASES)
+        self.queries = dict((phase, 0) for phase in PHASES)
+        self.sql_time = 0.0
+
+    def enter(self, phase):
+        self.leave()
+        self.phase = phase
+        self.phase_start = time.time()
+
+    def leave(self):
+        if self.phase is not None:
+            self.phases[self.phase] += time.time() - self.phase_start
+            self.phase = None
+
+    def query_executed(self, duration):
+        if self.phase is not None:
+            self.queries[self.phase] += 1
+        self.sql_time += duration
+
+    def finish(self):
+        self.leave()
+        self.end = time.time()
+
+    def get(self, column):
+        if column == 'total':
+            return self.end - self.start
+        if column == 'queries':
+            return sum(self.queries.values())
+        if column == 'sql':
+            return self.sql_time
+        return self.phases[column]
+
+    def as_dict(self):
+        return {
+            'test': self.name,
+            'total': self.get('total'),
+            'phases': self.phases,
+            'queries': self.get('queries'),
+            'phase_queries': self.queries,
+            'sql_time': self.sql_time,
+        }
+
+class ProfilePlugin(Plugin):
+    """
+    Record, for every test, how long nosedjango's setup and cleanup phases
+    and the test itself took, along with the number of SQL queries and the
+    time spent running them. The slowest tests are reported when the run
+    finishes and every test is written to a JSON file.
+
+    The phases are: ``transaction`` (entering transaction management),
+    ``fixtures``, ``urlconf``, ``test`` (the test body, including ``setUp``
+    and ``tearDown``) and ``teardown`` (rollback or flush).
+
+    Multiprocess workers never run ``finalize``; like the duration history of
+    ``nosedjango.scheduling``, they append their profiles to a journal file
+    of their own, which the main process merges into the report.
+    """
+    name = 'django-profile'
+    # beforeTest has to run before nosedjango's, which goes through the
+    # transaction, fixtures and urlconf phases
+    score = 150
+
+    def __init__(self, *args, **kwargs):
+        super(ProfilePlugin, self).__init__(*args, **kwargs)
+
+        self.nose_config = None
+        self.profiles = []
+        self.current = None
+        self.journal = None
+        self.listened = set()
+
+    def options(self, parser, env=None):
+        if env is None:
+            env = os.environ
+        parser.add_option('--django-profile-sort',
+                          help='Column to sort the profile report by, one of '
+                          '%s (default total).' % ', '.join(SORT_COLUMNS),
+                          type='choice',
+                          choices=SORT_COLUMNS,
+                          default='total',
+                          )
+        parser.add_option('--django-profile-limit',
+                          help='Number of tests to show in the profile '
+                          'report, 0 for all of them (default 20).',
+                          metavar='N',
+                          type='int',
+                          default=20,
+                          )
+        parser.add_option('--django-profile-file',
+                          help='Write the profile of every test to FILE as '
+                          'JSON (default nosedjango-profile.json).',
+                          metavar='FILE',
+                          default='nosedjango-profile.json',
+                          )
+        super(ProfilePlugin, self).options(parser, env)
+
+    def configure(self, options, config):
+        self.sort = options.django_profile_sort
+        self.limit = options.django_profile_limit
+        self.profile_file = os.path.abspath(options.django_profile_file)
+        self.nose_config = config
+
+        super(ProfilePlugin, self).configure(options, config)
+
+    def _journal_path(self, pid):
+        return '%s.%d.journal' % (self.profile_file, pid)
+
+    def _journal_paths(self):
+        return glob.glob('%s.*.journal' % self.profile_file)
+
+    def begin(self):
+        if getattr(self.nose_config, 'worker', False):
+            self.journal = open(self._journal_path(os.getpid()), 'a')
+        else:
+            # Left by a run that didn't get to finalize
+            for journal_path in self._journal_paths():
+                os.remove(journal_path)
+
+    def afterTestDb(self, settings, connection):
+        from django.db import connections
+        from nosedjango.cursors import add_query_listener
+
+        for alias in connections:
+            # Mirrors may already share the connection of another alias
+            listened_alias = connections[alias].alias
+            if listened_alias not in self.listened:
+                add_query_listener(connections[alias], self.query_executed)
+                self.listened.add(listened_alias)
+
+    def query_executed(self, sql, duration):
+        if self.current is not None:
+            self.current.query_executed(duration)
+
+    def _finish_current(self):
+        if self.current is not None:
+            self.current.finish()
+            profile = self.current.as_dict()
+            self.profiles.append(profile)
+            self.current = None
+            if self.journal is not None:
+                self.journal.write('%s\n' % json.dumps(profile))
+                self.journal.flush()
+
+    def merge_journals(self):
+        for journal_path in self._journal_paths():
+            f = open(journal_path)
+            try:
+                for line in f:
+                    try:
+                        self.profiles.append(json.loads(line))
+                    except ValueError:
+                        # Worker killed halfway through a line
+                        continue
+            finally:
+                f.close()
+            os.remove(journal_path)
+
+    def beforeTest(self, test):
+        # Tests that rebuild the schema never reach afterRollback
+        self._finish_current()
+        self.current = TestProfile(test.id())
+
+    def _enter(self, phase):
+        if self.current is not None:
+            self.current.enter(phase)
+
+    def _leave(self):
+        if self.current is not None:
+            self.current.leave()
+
+    def beforeTransactionManagement(self, settings, test):
+        self._enter('transaction')
+
+    def afterTransactionManagement(self, settings, test):
+        self._leave()
+
+    def beforeFixtureLoad(self, settings, test):
+        self._enter('fixtures')
+
+    def afterFixtureLoad(self, settings, test):
+        self._leave()
+
+    def beforeUrlConfLoad(self, settings, test):
+        self._enter('urlconf')
+
+    def afterUrlConfLoad(self, settings, test):
+        self._leave()
+
+    def startTest(self, test):
+        self._enter('test')
+
+    def stopTest(self, test):
+        self._enter('teardown')
+
+    def afterRollback(self, settings):
+        self._finish_current()
+
+    def finalize(self, result):
+        self._finish_current()
+        if getattr(self.nose_config, 'worker', False):
+            return
+        self.merge_journals()
+        if not self.profiles:
+            return
+
+        profiles = sorted(
+            self.profiles, key=lambda profile: get_column(profile, self.sort),
+            reverse=True)
+
+        f = open(self.profile_file, 'w')
+        try:
+            json.dump(profiles, f, indent=2)
+        finally:
+            f.close()
+
+        if self.limit:
+            profiles = profiles[:self.limit]
+        self.print_report(profiles, sys.stderr)
+
+    def print_report(self, profiles, stream):
+        headers = ('total',) + PHASES + ('queries', 'sql')
+        stream.write('-' * 80 + '\n')
+        stream.write('Test profile, sorted by %s (all tests in %s)\n' % (
+            self.sort, self.profile_file))
+        stream.write('%s  test\n' % ' '.join(
+            ['%9s' % header for header in headers]))
+        for profile in profiles:
+            columns = []
+            for header in headers:
+                if header == 'queries':
+                    columns.append('%9d' % get_column(profile, header))
+                else:
+                    columns.append('%9.3f' % get_column(profile, header))
+            stream.write('%s  %s\n' % (' '.join(columns), profile['test']))
+        stream.write('-' * 80 + '\n')
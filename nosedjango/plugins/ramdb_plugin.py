@@ -0,0 +1,409 @@
+import atexit
+import getpass
+import glob
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import time
+
+from nose.config import ConfigError
+
+from nosedjango.plugins.base_plugin import Plugin
+
+# Inherited by multiprocess workers, which use the main process's server
+RAMDB_ENV = 'NOSEDJANGO_RAMDB'
+STARTUP_TIMEOUT = 60
+SHUTDOWN_TIMEOUT = 10
+
+POSTGRESQL = 'postgresql'
+MYSQL = 'mysql'
+
+# PostgreSQL refuses to run as root, so the tests running as root start the
+# server as this user instead
+SYSTEM_USER = 'nobody'
+
+def get_engine_kind(engine):
+    if 'postgresql' in engine or 'postgis' in engine:
+        return POSTGRESQL
+    if 'mysql' in engine:
+        return MYSQL
+    return None
+
+def get_ram_dir():
+    """
+    ``/dev/shm`` is a tmpfs on practically every Linux system.
+    """
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return None
+
+def find_program(name, bin_dir=None, search_dirs=()):
+    """
+    Look for ``name`` in ``bin_dir`` if given, otherwise on ``PATH`` and in
+    ``search_dirs`` (glob patterns, newest version first).
+    """
+    if bin_dir:
+        dirs = [bin_dir]
+    else:
+        dirs = os.environ.get('PATH', '').split(os.pathsep)
+        for pattern in search_dirs:
+            dirs.extend(sorted(glob.glob(pattern), reverse=True))
+    for dirname in dirs:
+        path = os.path.join(dirname, name)
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    raise ConfigError(
+        "--with-django-ramdb can't find %s, use --django-ramdb-bin-dir" % name)
+
+def get_user_ids(user):
+    """
+    The uid and gid of the system user called ``user``.
+    """
+    import pwd
+
+    try:
+        entry = pwd.getpwnam(user)
+    except KeyError:
+        raise ConfigError('--django-ramdb-user: no user called %s' % user)
+    return entry.pw_uid, entry.pw_gid
+
+class RamDbServer(object):
+    """
+    Starting and stopping a throwaway database server keeping everything
+    under ``base_dir`` and only listening on a unix socket there. The server
+    classes add what is particular to their engine: ``initialize`` to create
+    the data directory, ``get_server_command``, ``connect`` to open and close
+    a connection, raising while the server isn't ready, and ``get_settings``
+    with what to update the matching ``DATABASES`` entries with.
+
+    When running as root, the server's programs are run as ``system_user``.
+    """
+    kind = None
+    stop_signal = signal.SIGKILL
+
+    def __init__(self, base_dir, bin_dir=None, system_user=SYSTEM_USER):
+        self.base_dir = base_dir
+        self.bin_dir = bin_dir
+        self.data_dir = os.path.join(base_dir, 'data')
+        self.log_path = os.path.join(base_dir, 'server.log')
+        self.process = None
+        self.run_as = None
+        self.system_user = getpass.getuser()
+        if hasattr(os, 'geteuid') and os.geteuid() == 0:
+            self.run_as = get_user_ids(system_user)
+            self.system_user = system_user
+
+    def start(self):
+        if self.run_as is not None:
+            # The server writes its log itself, next to its data
+            open(self.log_path, 'a').close()
+            for path in (self.base_dir, self.log_path):
+                os.chown(path, *self.run_as)
+        self.initialize()
+        self.process = self._run(self.get_server_command(), wait=False)
+
+        deadline = time.time() + STARTUP_TIMEOUT
+        while True:
+            if self.process.poll() is not None:
+                self._fail('exited with code %s' % self.process.returncode)
+            try:
+                self.connect()
+                return
+            except Exception:
+                if time.time() > deadline:
+                    self._fail("didn't accept connections within %s seconds"
+                               % STARTUP_TIMEOUT)
+                time.sleep(0.1)
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self._signal(self.stop_signal)
+            deadline = time.time() + SHUTDOWN_TIMEOUT
+            while self.process.poll() is None and time.time() < deadline:
+                time.sleep(0.05)
+            if self.process.poll() is None:
+                self._signal(signal.SIGKILL)
+                self.process.wait()
+        self.process = None
+        shutil.rmtree(self.base_dir, ignore_errors=True)
+
+    def _signal(self, signum):
+        try:
+            os.kill(self.process.pid, signum)
+        except OSError:
+            pass
+
+    def _run(self, command, wait=True):
+        log = open(self.log_path, 'a')
+        try:
+            process = subprocess.Popen(
+                command, stdout=log, stderr=subprocess.STDOUT,
+                close_fds=True, cwd=self.base_dir,
+                preexec_fn=self.run_as and self._drop_privileges)
+        finally:
+            log.close()
+        if wait and process.wait() != 0:
+            self._fail('%s exited with code %s' % (
+                os.path.basename(command[0]), process.returncode))
+        return process
+
+    def _drop_privileges(self):
+        uid, gid = self.run_as
+        os.setgroups([])
+        os.setgid(gid)
+        os.setuid(uid)
+
+    def _fail(self, reason):
+        f = open(self.log_path)
+        try:
+            output = f.read()[-2000:]
+        finally:
+            f.close()
+        self.stop()
+        raise RuntimeError(
+            'Throwaway %s server %s:\n%s' % (self.kind, reason, output))
+
+class PostgreSQLServer(RamDbServer):
+    kind = POSTGRESQL
+    # Immediate shutdown, without a checkpoint
+    stop_signal = signal.SIGQUIT
+    user = 'postgres'
+    port = 5432
+    search_dirs = ['/usr/lib/postgresql/*/bin', '/usr/pgsql-*/bin']
+
+    def initialize(self):
+        initdb = find_program('initdb', self.bin_dir, self.search_dirs)
+        self._run([initdb, '-D', self.data_dir, '-U', self.user,
+                   '-A', 'trust', '-E', 'UTF8', '--locale=C'])
+
+    def get_server_command(self):
+        postgres = find_program('postgres', self.bin_dir, self.search_dirs)
+        return [
+            postgres, '-D', self.data_dir,
+            '-k', self.base_dir, '-p', str(self.port),
+            '-c', 'listen_addresses=',
+            '-c', 'fsync=off',
+            '-c', 'synchronous_commit=off',
+            '-c', 'full_page_writes=off',
+        ]
+
+    def connect(self):
+        import psycopg2
+
+        psycopg2.connect(
+            host=self.base_dir, port=self.port, user=self.user,
+            database='postgres').close()
+
+    def get_settings(self):
+        return {
+            'HOST': self.base_dir,
+            'PORT': str(self.port),
+            'USER': self.user,
+            'PASSWORD': '',
+        }
+
+class MySQLServer(RamDbServer):
+    kind = MYSQL
+    user = 'root'
+    search_dirs = ['/usr/sbin', '/usr/libexec']
+
+    def __init__(self, *args, **kwargs):
+        super(MySQLServer, self).__init__(*args, **kwargs)
+        self.socket_path = os.path.join(self.base_dir, 'mysql.sock')
+
+    def initialize(self):
+        mysqld = find_program('mysqld', self.bin_dir, self.search_dirs)
+        version = subprocess.Popen(
+            [mysqld, '--version'], stdout=subprocess.PIPE).communicate()[0]
+        if 'mariadb' in version.lower():
+            mysql_install_db = find_program(
+                'mysql_install_db', self.bin_dir, self.search_dirs)
+            self._run([mysql_install_db, '--no-defaults',
+                       '--datadir=%s' % self.data_dir,
+                       '--user=%s' % self.system_user,
+                       '--auth-root-authentication-method=normal'])
+        else:
+            self._run([mysqld, '--no-defaults', '--initialize-insecure',
+                       '--datadir=%s' % self.data_dir,
+                       '--user=%s' % self.system_user])
+
+    def get_server_command(self):
+        mysqld = find_program('mysqld', self.bin_dir, self.search_dirs)
+        return [
+            mysqld, '--no-defaults',
+            '--datadir=%s' % self.data_dir,
+            '--socket=%s' % self.socket_path,
+            '--pid-file=%s' % os.path.join(self.base_dir, 'mysqld.pid'),
+            '--log-error=%s' % self.log_path,
+            '--tmpdir=%s' % self.base_dir,
+            '--user=%s' % self.system_user,
+            '--skip-networking',
+            '--skip-log-bin',
+            '--sync-binlog=0',
+            '--innodb-flush-log-at-trx-commit=0',
+            '--innodb-flush-method=nosync',
+            '--skip-innodb-doublewrite',
+        ]
+
+    def connect(self):
+        import MySQLdb
+
+        MySQLdb.connect(unix_socket=self.socket_path, user=self.user).close()
+
+    def get_settings(self):
+        return {
+            'HOST': self.socket_path,
+            'PORT': '',
+            'USER': self.user,
+            'PASSWORD': '',
+        }
+
+SERVERS = {
+    POSTGRESQL: PostgreSQLServer,
+    MYSQL: MySQLServer,
+}
+
+class RamDbPlugin(Plugin):
+    """
+    Run the tests against a throwaway PostgreSQL or MySQL server started just
+    for the run, with its data directory on a tmpfs and everything that
+    makes it durable turned off. Tests keep the SQL semantics of the real
+    engine at close to the speed of in-memory sqlite.
+
+    The server is started before Django connects to the database, by the
+    main process only; multiprocess workers use the same server. Every alias
+    in ``DATABASES`` using the engine is pointed at it.
+    """
+    name = 'django-ramdb'
+    # Finalize after nosedjango, which drops the test database on the server
+    score = 50
+
+    def __init__(self, *args, **kwargs):
+        super(RamDbPlugin, self).__init__(*args, **kwargs)
+
+        self.engine = None
+        self.base_dir = None
+        self.bin_dir = None
+        self.system_user = SYSTEM_USER
+        self.server = None
+        self.server_pid = None
+
+    def options(self, parser, env=None):
+        if env is None:
+            env = os.environ
+        parser.add_option('--django-ramdb-engine',
+                          help='Which server to start, "postgresql" or '
+                          '"mysql". Defaults to the engine of the default '
+                          'database.',
+                          choices=sorted(SERVERS),
+                          dest='django_ramdb_engine',
+                          default=None,
+                          )
+        parser.add_option('--django-ramdb-dir',
+                          help='Directory to keep the server\'s data in. '
+                          'Defaults to /dev/shm.',
+                          metavar='DIR',
+                          dest='django_ramdb_dir',
+                          default=None,
+                          )
+        parser.add_option('--django-ramdb-bin-dir',
+                          help='Directory with the server\'s programs '
+                          '(initdb and postgres, or mysqld). Searched for on '
+                          'PATH by default.',
+                          metavar='DIR',
+                          dest='django_ramdb_bin_dir',
+                          default=None,
+                          )
+        parser.add_option('--django-ramdb-user',
+                          help='User to run the server as when the tests run '
+                          'as root. Defaults to "%s".' % SYSTEM_USER,
+                          metavar='USER',
+                          dest='django_ramdb_user',
+                          default=SYSTEM_USER,
+                          )
+        super(RamDbPlugin, self).options(parser, env)
+
+    def configure(self, options, config):
+        self.engine = options.django_ramdb_engine
+        self.base_dir = options.django_ramdb_dir
+        self.bin_dir = options.django_ramdb_bin_dir
+        self.system_user = options.django_ramdb_user
+
+        super(RamDbPlugin, self).configure(options, config)
+
+    def beforeConnectionSetup(self, settings):
+        if self.engine is None:
+            self.engine = get_engine_kind(
+                settings.DATABASES['default'].get('ENGINE', ''))
+            if self.engine is None:
+                raise ConfigError(
+                    '--with-django-ramdb needs a PostgreSQL or MySQL default '
+                    'database, or --django-ramdb-engine')
+
+        server_settings = self._get_server_settings()
+        for database in settings.DATABASES.values():
+            if get_engine_kind(database.get('ENGINE', '')) == self.engine:
+                database.update(server_settings)
+
+    def _get_server_settings(self):
+        if RAMDB_ENV in os.environ:
+            kind, host, port, user = os.environ[RAMDB_ENV].split(os.pathsep)
+            if kind == self.engine:
+                return {'HOST': host, 'PORT': port, 'USER': user,
+                        'PASSWORD': ''}
+
+        if self.server is None:
+            self._start_server()
+        server_settings = self.server.get_settings()
+        os.environ[RAMDB_ENV] = os.pathsep.join([
+            self.engine, server_settings['HOST'], server_settings['PORT'],
+            server_settings['USER']])
+        return server_settings
+
+    def _start_server(self):
+        base_dir = self.base_dir or get_ram_dir()
+        if base_dir is None:
+            raise ConfigError(
+                'No /dev/shm to keep the database in, use --django-ramdb-dir')
+        if not os.path.isdir(base_dir):
+            os.makedirs(base_dir)
+
+        server_dir = tempfile.mkdtemp(prefix='nosedjango-ramdb-', dir=base_dir)
+        try:
+            server = SERVERS[self.engine](
+                server_dir, self.bin_dir, self.system_user)
+        except:
+            shutil.rmtree(server_dir, ignore_errors=True)
+            raise
+        try:
+            server.start()
+        except:
+            server.stop()
+            raise
+        self.server = server
+        self.server_pid = os.getpid()
+        # Also covers runs that never get to finalize
+        atexit.register(self._stop_server)
+
+    def _stop_server(self):
+        # Forked processes inherit the server object, but don't own it
+        if self.server is not None and self.server_pid == os.getpid():
+            self.server.stop()
+            self.server = None
+            os.environ.pop(RAMDB_ENV, None)
+
+    def finalize(self, result=None):
+        from django.db import connections
+        from nosedjango import workers
+
+        if self.server is None or self.server_pid != os.getpid():
+            return
+        if workers.get_master_db() is not None:
+            # The workers' databases are dropped at exit, once nose has
+            # stopped the workers; the server is stopped after that
+            return
+        for connection in connections.all():
+            connection.close()
+        self._stop_server()
@@ -7,12 +7,72 @@ class SqlitePlugin(Plugin):
     """
     Modify django database settings to use an in-memory sqlite instance for
     faster test runs and easy multiprocess testing.
+
+    With ``--django-sqlite-cache-dir``, the freshly created in-memory database
+    is saved to that directory, keyed on the schema fingerprint, and later
+    runs restore it instead of running ``syncdb`` again.
     """
     name = 'django-sqlite'
 
+    def __init__(self, *args, **kwargs):
+        super(SqlitePlugin, self).__init__(*args, **kwargs)
+
+        self.cache_dir = None
+        self.rebuild = False
+
+    def options(self, parser, env=None):
+        if env is None:
+            env = os.environ
+        parser.add_option('--django-sqlite-cache-dir',
+                          help='Cache the created in-memory test database in '
+                          'DIR and restore it on later runs as long as the '
+                          'models and migrations are unchanged.',
+                          metavar='DIR',
+                          default=None,
+                          )
+        parser.add_option('--django-sqlite-rebuild',
+                          help='Ignore any cached test database and build a '
+                          'fresh one (which then replaces the cached copy).',
+                          action='store_true',
+                          dest='django_sqlite_rebuild',
+                          default=False,
+                          )
+        super(SqlitePlugin, self).options(parser, env)
+
+    def configure(self, options, config):
+        if options.django_sqlite_cache_dir:
+            self.cache_dir = os.path.abspath(options.django_sqlite_cache_dir)
+        self.rebuild = options.django_sqlite_rebuild
+
+        super(SqlitePlugin, self).configure(options, config)
+
     def beforeConnectionSetup(self, settings):
         settings.DATABASES['default']['ENGINE'] = 'django.db.backends.sqlite3'
         settings.DATABASES['default']['NAME'] = '' # in-memory database
         settings.DATABASES['default']['OPTIONS'] = {}
         settings.DATABASES['default']['USER'] = ''
         settings.DATABASES['default']['PASSWORD'] = ''
+
+    def createTestDb(self, settings, connection, verbosity):
+        """
+        Restore the test database from the cache directory if there's a copy
+        matching the current schema, otherwise create it and cache it.
+        """
+        if not self.cache_dir:
+            return None
+
+        from nosedjango.schema import get_schema_fingerprint
+        from nosedjango.templatedb import SqliteTemplate
+
+        snapshot = SqliteTemplate(
+            connection,
+            connection.settings_dict['NAME'],
+            get_schema_fingerprint(settings, connection),
+            self.cache_dir)
+
+        if snapshot.exists() and not self.rebuild:
+            snapshot.restore(verbosity=verbosity)
+        else:
+            connection.creation.create_test_db(verbosity=verbosity)
+            snapshot.save()
+        return True
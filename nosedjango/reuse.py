@@ -0,0 +1,105 @@
+"""
+Keeping test databases between runs, for ``--django-reuse-db``.
+
+Instead of being destroyed at the end of the run, the test database is left
+behind with a one-row table recording the schema fingerprint it was created
+for and whether the run cleaned up after itself. The next run reuses it when
+the fingerprint still matches, after emptying it with Django's ``flush`` if
+the last run didn't get to clean up, and creates it again otherwise.
+"""
+
+from __future__ import absolute_import
+
+from nosedjango.templatedb import switch_to_database
+
+STATE_TABLE = 'nosedjango_reuse'
+
+def can_reuse(connection):
+    """
+    In-memory sqlite databases don't outlive the process.
+    """
+    return connection.creation._get_test_db_name() != ':memory:'
+
+def get_state(connection):
+    """
+    Return ``(fingerprint, clean)`` stored in the database the connection
+    points at, or ``None`` if the database or the table doesn't exist.
+    """
+    qn = connection.ops.quote_name
+    try:
+        cursor = connection.cursor()
+        cursor.execute(
+            'SELECT fingerprint, clean FROM %s' % qn(STATE_TABLE))
+        row = cursor.fetchone()
+    except Exception:
+        # PostgreSQL won't run anything else in the failed transaction
+        if connection.connection is not None:
+            connection._rollback()
+        connection.close()
+        return None
+    if row is None:
+        return None
+    return row[0], bool(row[1])
+
+def set_state(connection, fingerprint, clean):
+    from django.db import transaction
+
+    qn = connection.ops.quote_name
+    cursor = connection.cursor()
+    if STATE_TABLE not in connection.introspection.get_table_list(cursor):
+        cursor.execute('CREATE TABLE %s (fingerprint varchar(40), '
+                       'clean integer)' % qn(STATE_TABLE))
+    cursor.execute('DELETE FROM %s' % qn(STATE_TABLE))
+    cursor.execute(
+        'INSERT INTO %s (fingerprint, clean) VALUES (%%s, %%s)'
+        % qn(STATE_TABLE), [fingerprint, int(clean)])
+    transaction.commit_unless_managed(using=connection.alias)
+
+def reuse_test_db(connection, fingerprint, verbosity=1):
+    """
+    Point the connection at the test database an earlier run kept, if it
+    was created for ``fingerprint``, the way ``create_test_db`` would.
+    Returns ``False`` when the test database has to be created.
+    """
+    from django.core.management import call_command
+
+    if not can_reuse(connection):
+        return False
+
+    settings_dict = connection.settings_dict
+    old_database_name = settings_dict['NAME']
+    test_database_name = connection.creation._get_test_db_name()
+    connection.close()
+    settings_dict['NAME'] = test_database_name
+    state = get_state(connection)
+    if state is None or state[0] != fingerprint:
+        connection.close()
+        settings_dict['NAME'] = old_database_name
+        return False
+
+    if verbosity >= 1:
+        test_db_repr = ''
+        if verbosity >= 2:
+            test_db_repr = " ('%s')" % test_database_name
+        print "Reusing test database for alias '%s'%s..." % (
+            connection.alias, test_db_repr)
+    switch_to_database(connection, test_database_name)
+    fingerprint, clean = state
+    if not clean:
+        call_command('flush', verbosity=0, interactive=False,
+                     database=connection.alias)
+    # Until this run cleans up after itself
+    set_state(connection, fingerprint, clean=False)
+    return True
+
+def keep_test_db(connection, old_database_name, fingerprint, clean,
+                 verbosity=1):
+    """
+    Leave the test database in place for the next run instead of
+    destroying it, and point the connection back at the real database.
+    """
+    set_state(connection, fingerprint, clean)
+    connection.close()
+    if verbosity >= 1:
+        print "Keeping test database for alias '%s'..." % connection.alias
+    connection.settings_dict['NAME'] = old_database_name
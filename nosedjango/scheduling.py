@@ -0,0 +1,192 @@
+"""
+Test ordering: duration-based scheduling for nose's multiprocess plugin, and
+grouping of tests that share their database setup.
+
+Duration-based scheduling
+-------------------------
+
+Every test and every test context (class or module) is timed, and the
+durations are kept in a small history file between runs. Workers, which
+never run ``finalize``, append their timings to a journal file of their own
+that the main process folds into the history at the end of the run.
+
+On the next multiprocess run the batches handed to the workers are ordered
+longest-first. Workers pull batches from a shared queue, so this is the
+classic longest-processing-time partitioning: the long batches start right
+away and the short ones fill the gaps at the end.
+
+Grouping by setup
+-----------------
+
+Tests are regrouped so that the ones declaring the same fixtures, URLconf
+and transaction isolation run one after another, and the switch between
+transactional and non-transactional tests (which triggers a flush) happens
+as rarely as possible. Test classes, and modules or packages with nose
+fixtures or Django test attributes of their own, are moved as a whole.
+"""
+
+from __future__ import absolute_import
+
+import glob
+import inspect
+import os
+import unittest
+
+try:
+    import json
+except ImportError:
+    from django.utils import simplejson as json
+
+from nose.suite import ContextSuite, LazySuite
+
+DJANGO_TEST_ATTRIBUTES = (
+    'fixtures', 'urls', 'use_transaction_isolation', 'rebuild_schema')
+
+def get_context_key(context):
+    """
+    Return the history key for a test class or module.
+    """
+    if inspect.isclass(context):
+        return '%s.%s' % (context.__module__, context.__name__)
+    return getattr(context, '__name__', None)
+
+class DurationHistory(object):
+    """
+    Durations, in seconds, of tests and contexts from previous runs.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.tests = {}
+        self.contexts = {}
+        self.journal = None
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        f = open(self.path)
+        try:
+            try:
+                data = json.load(f)
+            except ValueError:
+                # A corrupt history only costs us the ordering
+                return
+        finally:
+            f.close()
+        self.tests.update(data.get('tests', {}))
+        self.contexts.update(data.get('contexts', {}))
+
+    def _journal_path(self, pid):
+        return '%s.%d.journal' % (self.path, pid)
+
+    def open_journal(self):
+        """
+        Write timings to this process's journal as they are recorded,
+        instead of keeping them for ``save``.
+        """
+        self.journal = open(self._journal_path(os.getpid()), 'a')
+
+    def record_test(self, key, duration):
+        self._record('tests', key, duration)
+
+    def record_context(self, key, duration):
+        self._record('contexts', key, duration)
+
+    def _record(self, kind, key, duration):
+        if key is None:
+            return
+        getattr(self, kind)[key] = duration
+        if self.journal is not None:
+            self.journal.write('%s\n' % json.dumps([kind, key, duration]))
+            self.journal.flush()
+
+    def merge_journals(self):
+        for journal_path in glob.glob('%s.*.journal' % self.path):
+            f = open(journal_path)
+            try:
+                for line in f:
+                    try:
+                        kind, key, duration = json.loads(line)
+                    except ValueError:
+                        # Worker killed halfway through a line
+                        continue
+                    getattr(self, kind)[key] = duration
+            finally:
+                f.close()
+            os.remove(journal_path)
+
+    def save(self):
+        tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        f = open(tmp_path, 'w')
+        try:
+            json.dump({'tests': self.tests, 'contexts': self.contexts}, f)
+        finally:
+            f.close()
+        os.rename(tmp_path, self.path)
+
+    def estimate(self, batch, default):
+        """
+        Estimate how long ``batch`` (a test or a suite) takes, using
+        ``default`` for tests that have never been timed.
+        """
+        if not isinstance(batch, unittest.TestSuite):
+            return self.tests.get(batch.id(), default)
+
+        context = getattr(batch, 'context', None)
+        if context is not None:
+            duration = self.contexts.get(get_context_key(context))
+            if duration is not None:
+                return duration
+
+        tests = list(batch)
+        if isinstance(batch, LazySuite):
+            # Iterating a lazy suite consumes it
+            batch._tests = tests
+        return sum([self.estimate(test, default) for test in tests])
+
+    def order_batches(self, batches):
+        """
+        Sort ``batches`` longest-first.
+        """
+        if self.tests:
+            default = sum(self.tests.values()) / len(self.tests)
+        else:
+            default = 0.0
+        estimates = [
+            (self.estimate(batch, default), index, batch)
+            for index, batch in enumerate(batches)]
+        estimates.sort(key=lambda item: (-item[0], item[1]))
+        return [batch for _, _, batch in estimates]
+
+def get_movable_parts(test):
+    """
+    Split ``test`` into the parts that can run in any order relative to each
+    other without changing how their contexts are set up. Suites without a
+    context, like the one nose builds when given several modules, are always
+    split.
+    """
+    if isinstance(test, ContextSuite):
+        context = test.context
+        if inspect.isclass(context) \
+           or test.hasFixtures() \
+           or [name for name in DJANGO_TEST_ATTRIBUTES
+               if hasattr(context, name)]:
+            return [test]
+    if not isinstance(test, unittest.TestSuite):
+        return [test]
+
+    parts = []
+    for case in test:
+        parts.extend(get_movable_parts(case))
+    return parts
+
+def group_tests(test, get_key):
+    """
+    Return a suite running the movable parts of ``test`` ordered by
+    ``get_key(context)``, keeping the original order among equal keys.
+    """
+    parts = get_movable_parts(test)
+    keyed = [
+        (get_key(getattr(part, 'context', None)), index, part)
+        for index, part in enumerate(parts)]
+    keyed.sort(key=lambda item: (item[0], item[1]))
+    return LazySuite([part for _, _, part in keyed])
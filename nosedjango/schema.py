@@ -0,0 +1,221 @@
+"""
+Answering "has the test database schema changed?" without touching the
+database.
+
+``get_schema_fingerprint()`` hashes what ``create_test_db`` would build for a
+connection: the database engine, ``INSTALLED_APPS``, every model's table,
+columns, indexes and constraints, the model names and permissions ``syncdb``
+turns into ``auth_permission`` rows, and the custom SQL, migration and
+``initial_data`` fixture files shipped with the apps or in ``FIXTURE_DIRS``. It only looks at the model registry and those files,
+so it takes milliseconds. Templates, reused test databases and cached sqlite
+databases are all keyed on it.
+
+To find out why two fingerprints differ, save the schema description with
+``nosedjango-schema-diff --save FILE`` and compare it later with
+``nosedjango-schema-diff FILE``.
+"""
+
+import difflib
+import os
+from hashlib import sha1
+
+def _describe_field(field, connection):
+    description = [
+        field.name,
+        field.column,
+        field.db_type(connection=connection),
+        field.null,
+        field.unique,
+        field.db_index,
+        field.primary_key,
+        getattr(field, 'db_tablespace', None) or '',
+    ]
+    if getattr(field, 'rel', None) and getattr(field.rel, 'to', None):
+        to = field.rel.to
+        if isinstance(to, basestring):
+            description.append(to)
+        else:
+            description.append(to._meta.db_table)
+    return description
+
+def _describe_model(model, connection):
+    opts = model._meta
+    return [
+        opts.app_label,
+        opts.db_table,
+        sorted(map(list, opts.unique_together)),
+        [_describe_field(field, connection) for field in opts.local_fields],
+        getattr(opts, 'db_tablespace', None) or '',
+        # What the auth_permission rows are made of
+        unicode(opts.verbose_name_raw),
+        sorted([[codename, unicode(name)]
+                for codename, name in opts.permissions]),
+    ]
+
+def _describe_files(dirname, prefix='', extension=''):
+    """
+    Hash the files in ``dirname`` starting with ``prefix`` and ending in
+    ``extension``.
+    """
+    files = []
+    for filename in sorted(os.listdir(dirname)):
+        if not filename.startswith(prefix) \
+           or not filename.endswith(extension):
+            continue
+        f = open(os.path.join(dirname, filename), 'rb')
+        try:
+            files.append([filename, sha1(f.read()).hexdigest()])
+        finally:
+            f.close()
+    return files
+
+def _describe_app_files(settings, dirname, extension='', prefix=''):
+    """
+    Hash the files ending in ``extension`` in the ``dirname`` directory of
+    each installed app.
+    """
+    from django.utils.importlib import import_module
+
+    description = []
+    for app_name in settings.INSTALLED_APPS:
+        try:
+            app_module = import_module(app_name)
+        except ImportError:
+            continue
+        app_dir = os.path.join(os.path.dirname(app_module.__file__), dirname)
+        if not os.path.isdir(app_dir):
+            continue
+        description.append(
+            [app_name, _describe_files(app_dir, prefix, extension)])
+    return description
+
+def _describe_migrations(settings):
+    """
+    Describe the migration files (South-style ``migrations`` packages)
+    shipped with each installed app.
+    """
+    return _describe_app_files(settings, 'migrations', '.py')
+
+def _describe_custom_sql(settings):
+    """
+    Describe the ``sql/<model>.sql`` and ``sql/<model>.<backend>.sql``
+    files ``syncdb`` runs after creating the tables.
+    """
+    return _describe_app_files(settings, 'sql', '.sql')
+
+def _describe_initial_data(settings):
+    """
+    Describe the ``initial_data`` fixtures ``syncdb`` loads, from the apps'
+    ``fixtures`` directories and from ``FIXTURE_DIRS``.
+    """
+    description = _describe_app_files(
+        settings, 'fixtures', prefix='initial_data.')
+    for fixture_dir in getattr(settings, 'FIXTURE_DIRS', ()):
+        if not os.path.isdir(fixture_dir):
+            continue
+        files = _describe_files(fixture_dir, prefix='initial_data.')
+        if files:
+            description.append([fixture_dir, files])
+    return description
+
+def _get_defaults(settings, connection):
+    if settings is None:
+        from django.conf import settings
+    if connection is None:
+        from django.db import connection
+    return settings, connection
+
+def get_schema_description(settings=None, connection=None):
+    """
+    Build a plain, repr-stable description of the schema that
+    ``create_test_db`` would produce for the given connection (the default
+    one unless given). It is made of lists, strings, booleans and ``None``
+    only, so it can also be stored as JSON.
+    """
+    from django.db import models
+
+    settings, connection = _get_defaults(settings, connection)
+    all_models = models.get_models(include_auto_created=True)
+    all_models = sorted(
+        all_models,
+        key=lambda m: (m._meta.app_label, m._meta.db_table))
+
+    return [
+        connection.settings_dict['ENGINE'],
+        list(settings.INSTALLED_APPS),
+        [_describe_model(model, connection) for model in all_models],
+        _describe_migrations(settings),
+        _describe_custom_sql(settings),
+        _describe_initial_data(settings),
+    ]
+
+def get_schema_fingerprint(settings=None, connection=None):
+    """
+    Return a short hex digest identifying the schema that ``create_test_db``
+    would produce for the given connection (the default one unless given).
+    Any change to the database engine, the installed apps, model
+    definitions, permissions, custom SQL, migrations or ``initial_data``
+    fixtures produces a different fingerprint.
+    """
+    description = get_schema_description(settings, connection)
+    return get_description_fingerprint(description)
+
+def get_description_fingerprint(description):
+    return sha1(repr(description)).hexdigest()[:16]
+
+def format_schema_description(description):
+    """
+    Render a schema description as lines of text, one per table, column and
+    file, for diffing.
+    """
+    # Descriptions saved before initial data and permissions were described
+    # have fewer items
+    engine, apps, models, migrations, custom_sql = description[:5]
+    initial_data = description[5:] and description[5] or []
+    lines = ['engine %s' % engine]
+    lines.extend(['app %s' % app for app in apps])
+    for model in models:
+        app_label, db_table, unique_together, fields, tablespace = model[:5]
+        lines.append('table %s (%s)%s' % (
+            db_table, app_label,
+            tablespace and ' tablespace %s' % tablespace or ''))
+        if len(model) > 5:
+            verbose_name, permissions = model[5:7]
+            lines.append('  verbose name %s' % verbose_name)
+            for codename, name in permissions:
+                lines.append('  permission %s %s' % (codename, name))
+        for columns in unique_together:
+            lines.append('  unique together %s' % ', '.join(columns))
+        for field in fields:
+            name, column, db_type, null, unique, db_index, primary_key, \
+                field_tablespace = field[:8]
+            flags = [null and 'null' or 'not null']
+            if primary_key:
+                flags.append('primary key')
+            if unique:
+                flags.append('unique')
+            if db_index:
+                flags.append('index')
+            if field_tablespace:
+                flags.append('tablespace %s' % field_tablespace)
+            if len(field) > 8:
+                flags.append('references %s' % field[8])
+            lines.append('  column %s %s (%s) %s' % (
+                column, db_type, name, ', '.join(flags)))
+    for kind, app_files in (('migration', migrations),
+                            ('sql', custom_sql),
+                            ('initial data', initial_data)):
+        for app_name, files in app_files:
+            for filename, digest in files:
+                lines.append('%s %s %s %s' % (
+                    kind, app_name, filename, digest[:12]))
+    return lines
+
+def diff_schema_descriptions(old, new, old_name='old', new_name='new'):
+    """
+    Return the unified diff between two schema descriptions as a list of
+    lines; empty if they describe the same schema.
+    """
+    return list(difflib.unified_diff(
+        format_schema_description(old), format_schema_description(new),
+        old_name, new_name, lineterm=''))
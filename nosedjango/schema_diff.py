@@ -0,0 +1,110 @@
+"""
+``nosedjango-schema-diff``: show what changed between two schema
+fingerprints.
+
+Usage::
+
+    nosedjango-schema-diff --settings=myproject.settings --save FILE
+    nosedjango-schema-diff --settings=myproject.settings OLD
+    nosedjango-schema-diff OLD NEW
+
+The first form prints the current fingerprint and saves it to ``FILE`` along
+with the schema description it was computed from. The second compares a
+saved file with the current schema and the third compares two saved files.
+Like ``diff``, it exits with status 1 when the schemas differ.
+"""
+
+from __future__ import absolute_import
+
+import os
+import sys
+from optparse import OptionParser
+
+try:
+    import json
+except ImportError:
+    from django.utils import simplejson as json
+
+from nosedjango.schema import (
+    diff_schema_descriptions, format_schema_description,
+    get_description_fingerprint, get_schema_description)
+
+def get_current_schema(database):
+    from django.conf import settings
+    from django.db import connections
+
+    description = get_schema_description(settings, connections[database])
+    return {
+        'fingerprint': get_description_fingerprint(description),
+        'description': description,
+    }
+
+def load_schema(path):
+    f = open(path)
+    try:
+        return json.load(f)
+    finally:
+        f.close()
+
+def save_schema(path, schema):
+    f = open(path, 'w')
+    try:
+        json.dump(schema, f, indent=1)
+    finally:
+        f.close()
+
+def main(argv=None):
+    parser = OptionParser(usage='%prog [options] [OLD [NEW]]')
+    parser.add_option('--settings', metavar='MODULE',
+                      help='Django settings module, defaults to '
+                      'DJANGO_SETTINGS_MODULE.')
+    parser.add_option('--database', default='default',
+                      help='Database alias whose engine to describe the '
+                      'schema for (default "default").')
+    parser.add_option('--save', metavar='FILE',
+                      help='Save the current fingerprint and schema '
+                      'description to FILE.')
+    parser.add_option('-v', '--verbose', action='store_true', default=False,
+                      help='Print the current schema description.')
+    options, args = parser.parse_args(argv)
+    if len(args) > 2:
+        parser.error('Compare at most two files')
+
+    if len(args) == 2:
+        old, new = load_schema(args[0]), load_schema(args[1])
+        new_name = args[1]
+    else:
+        if options.settings:
+            os.environ['DJANGO_SETTINGS_MODULE'] = options.settings
+        if 'DJANGO_SETTINGS_MODULE' not in os.environ:
+            parser.error('No settings module, use --settings')
+        # Settings given as a module next to the current directory
+        sys.path.insert(0, os.getcwd())
+
+        new = get_current_schema(options.database)
+        new_name = 'current'
+        sys.stdout.write('%s\n' % new['fingerprint'])
+        if options.verbose:
+            for line in format_schema_description(new['description']):
+                sys.stdout.write('%s\n' % line)
+        if options.save:
+            save_schema(options.save, new)
+        if not args:
+            return 0
+        old = load_schema(args[0])
+
+    if old['fingerprint'] == new['fingerprint']:
+        return 0
+    lines = diff_schema_descriptions(
+        old['description'], new['description'], args[0], new_name)
+    if not lines:
+        # Same schema, computed by another version of nosedjango
+        sys.stdout.write('%s and %s describe the same schema\n' % (
+            args[0], new_name))
+        return 0
+    for line in lines:
+        sys.stdout.write('%s\n' % line)
+    return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
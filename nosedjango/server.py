@@ -0,0 +1,409 @@
+"""
+A resident test server that keeps Django warmed up between test runs.
+
+``nosetests --with-django --django-server`` imports the settings and every
+app, sets up the test environment and creates the test database once, then
+forks a pool of worker processes from that state and listens on a unix
+socket. ``nosetests --with-django --django-use-server <tests>`` skips all of
+that: it forwards its command line to the server, where one of the waiting
+workers runs the tests and streams the output back.
+
+Every worker serves a single run and then exits, so tests can't leak state
+into each other's runs, and the server forks a replacement straight away.
+In-memory sqlite databases are simply inherited by the fork; with any other
+database each worker clones the server's test database into its own before
+it starts waiting for a run.
+
+Workers run the code the server imported when it started. A run is refused,
+and the server stopped, as soon as the source of any of those modules has
+changed; the next run then sets Django up locally until the server is started
+again.
+
+The socket lives in the user's private temporary directory, and clients only
+talk to a socket owned by their own user.
+"""
+
+from __future__ import absolute_import
+
+import errno
+import os
+import signal
+import socket
+import struct
+import sys
+import traceback
+import unittest
+
+try:
+    import json
+except ImportError:
+    from django.utils import simplejson as json
+
+from nosedjango import workers
+from nosedjango.tempdirs import (
+    ensure_private_dir, get_user_temp_dir, is_private_socket)
+
+FRAME_HEADER = '!cI'
+FRAME_HEADER_SIZE = struct.calcsize(FRAME_HEADER)
+STDOUT, STDERR, EXIT = 'o', 'e', 'x'
+
+# The server's plugin instance, inside a worker that is running tests
+_warm_plugin = None
+
+def get_warm_plugin():
+    """
+    Return the server's ``NoseDjango`` plugin when called from a test run
+    inside a server worker. Django is already set up and the test database
+    exists in that case.
+    """
+    return _warm_plugin
+
+def get_default_socket_path(settings_module):
+    return os.path.join(
+        get_user_temp_dir(), 'server-%s.sock' % settings_module)
+
+def _get_source_path(module):
+    path = getattr(module, '__file__', None)
+    if not path:
+        return None
+    if path.endswith('.pyc') or path.endswith('.pyo'):
+        path = path[:-1]
+    return os.path.abspath(path)
+
+def get_module_mtimes():
+    """
+    Return ``{path: mtime}`` for the source of every module imported so far.
+    """
+    mtimes = {}
+    for module in sys.modules.values():
+        path = _get_source_path(module)
+        if path is None:
+            continue
+        try:
+            mtimes[path] = os.stat(path).st_mtime
+        except OSError:
+            continue
+    return mtimes
+
+def get_changed_modules(mtimes):
+    """
+    Return the paths in ``mtimes`` that were modified or removed since.
+    """
+    changed = []
+    for path, mtime in mtimes.items():
+        try:
+            if os.stat(path).st_mtime == mtime:
+                continue
+        except OSError:
+            pass
+        changed.append(path)
+    return sorted(changed)
+
+def send_frame(sock, kind, data):
+    sock.sendall(struct.pack(FRAME_HEADER, kind, len(data)) + data)
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise EOFError('nosedjango server closed the connection')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return ''.join(chunks)
+
+def recv_frame(sock):
+    kind, size = struct.unpack(
+        FRAME_HEADER, _recv_exactly(sock, FRAME_HEADER_SIZE))
+    return kind, _recv_exactly(sock, size)
+
+class FrameStream(object):
+    """
+    File-like object sending everything written to it over the client's
+    socket, tagged as stdout or stderr.
+    """
+    def __init__(self, sock, kind):
+        self.sock = sock
+        self.kind = kind
+
+    def write(self, data):
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        if data:
+            send_frame(self.sock, self.kind, data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+class RemoteResult(unittest.TestResult):
+    """
+    The outcome of a run on the server, as far as the client knows it.
+    """
+    def __init__(self, success):
+        unittest.TestResult.__init__(self)
+        self.success = success
+
+    def wasSuccessful(self):
+        return self.success
+
+def connect(socket_path):
+    """
+    Return a socket connected to the server at ``socket_path``, or ``None``
+    if no server of this user's is listening there.
+    """
+    if not os.path.lexists(socket_path):
+        return None
+    if not is_private_socket(socket_path):
+        # Anyone else's server could report whatever results it likes
+        sys.stderr.write('Ignoring %s: not a socket owned by this user\n'
+                         % socket_path)
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except socket.error:
+        sock.close()
+        return None
+    return sock
+
+class ClientRunner(object):
+    """
+    Test runner that hands the run over to the server and relays its output.
+    """
+    def __init__(self, sock, argv, settings_module, config):
+        self.sock = sock
+        self.argv = argv
+        self.settings_module = settings_module
+        self.config = config
+
+    def run(self, test):
+        request = json.dumps({
+            'argv': self.argv,
+            'cwd': os.getcwd(),
+            'settings': self.settings_module,
+        })
+        send_frame(self.sock, 'r', request)
+
+        success = False
+        try:
+            while True:
+                kind, data = recv_frame(self.sock)
+                if kind == STDOUT:
+                    sys.stdout.write(data)
+                    sys.stdout.flush()
+                elif kind == STDERR:
+                    sys.stderr.write(data)
+                    sys.stderr.flush()
+                elif kind == EXIT:
+                    success = data == '0'
+                    break
+        except EOFError, e:
+            sys.stderr.write('%s\n' % e)
+        self.sock.close()
+
+        result = RemoteResult(success)
+        self.config.plugins.finalize(result)
+        return result
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+class TestServer(object):
+    """
+    Test runner that serves test runs from pre-forked workers until it is
+    interrupted (Ctrl-C or SIGTERM), instead of running the tests it was given.
+    """
+    def __init__(self, plugin, socket_path, pool_size, config):
+        self.plugin = plugin
+        self.socket_path = socket_path
+        self.pool_size = pool_size
+        self.config = config
+        self.listener = None
+        self.children = set()
+        self.module_mtimes = {}
+        self.is_stale = False
+
+    def run(self, test):
+        from django.conf import settings
+        from django.db import connection
+
+        self.test_db_name = settings.DATABASES['default']['NAME']
+        self.test_db_names = self.plugin.test_databases.get_test_db_names()
+        if self.test_db_name != ':memory:':
+            # Workers get their own connections to their own databases
+            connection.close()
+        for other_connection in self.plugin.test_databases.connections():
+            other_connection.close()
+
+        self.module_mtimes = get_module_mtimes()
+        self.listen()
+        signal.signal(signal.SIGTERM, _interrupt)
+        sys.stderr.write('nosedjango server listening on %s with %d '
+                         'worker(s), press Ctrl-C to stop\n' % (
+                         self.socket_path, self.pool_size))
+        try:
+            try:
+                for i in range(self.pool_size):
+                    self.fork_worker()
+                while True:
+                    self.wait_for_worker()
+            except KeyboardInterrupt:
+                pass
+        finally:
+            self.shutdown()
+
+        result = unittest.TestResult()
+        self.config.plugins.finalize(result)
+        if self.test_db_name != ':memory:':
+            workers.destroy_worker_dbs(
+                connection, self.plugin.old_db, self.test_db_name,
+                self.plugin.verbosity)
+        self.plugin.test_databases.destroy_worker_dbs(self.test_db_names)
+        return result
+
+    def listen(self):
+        socket_dir = os.path.dirname(self.socket_path)
+        if socket_dir == get_user_temp_dir() \
+           and not ensure_private_dir(socket_dir):
+            raise RuntimeError(
+                '%s is not a directory only this user can write to, use '
+                '--django-server-socket' % socket_dir)
+        if os.path.lexists(self.socket_path):
+            if not is_private_socket(self.socket_path):
+                raise RuntimeError(
+                    '%s exists and is not a socket owned by this user'
+                    % self.socket_path)
+            if connect(self.socket_path) is not None:
+                raise RuntimeError(
+                    'A nosedjango server is already listening on %s'
+                    % self.socket_path)
+            os.remove(self.socket_path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Only this user may connect
+        old_umask = os.umask(077)
+        try:
+            self.listener.bind(self.socket_path)
+        finally:
+            os.umask(old_umask)
+        self.listener.listen(self.pool_size)
+
+    def wait_for_worker(self):
+        try:
+            pid, status = os.wait()
+        except OSError, e:
+            if e.errno == errno.EINTR:
+                return
+            raise
+        if pid in self.children:
+            self.children.remove(pid)
+            self.fork_worker()
+
+    def shutdown(self):
+        # A second Ctrl-C mustn't leave the workers or the socket behind
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        for pid in self.children:
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+        self.children = set()
+        self.listener.close()
+        if is_private_socket(self.socket_path):
+            os.remove(self.socket_path)
+
+    def fork_worker(self):
+        pid = os.fork()
+        if pid:
+            self.children.add(pid)
+            return
+
+        # Never return into the server's code or run its exit handlers
+        status = 1
+        try:
+            try:
+                self.serve_one()
+                status = 0
+            except KeyboardInterrupt:
+                pass
+            except:
+                traceback.print_exc()
+        finally:
+            os._exit(status)
+
+    def serve_one(self):
+        from django.db import connection
+
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        if self.test_db_name != ':memory:':
+            workers.create_worker_db(
+                connection, self.plugin.old_db, self.test_db_name,
+                self.plugin.verbosity)
+        self.plugin.test_databases.create_worker_dbs(self.plugin.verbosity)
+
+        sock, _ = self.listener.accept()
+        self.listener.close()
+        try:
+            kind, data = recv_frame(sock)
+            request = json.loads(data)
+            success = self.run_tests(sock, request)
+            send_frame(sock, EXIT, success and '0' or '1')
+            if self.is_stale:
+                os.kill(os.getppid(), signal.SIGTERM)
+        finally:
+            sock.close()
+            if self.test_db_name != ':memory:':
+                connection.creation.destroy_test_db(
+                    self.plugin.old_db, verbosity=0)
+            self.plugin.test_databases.destroy_own_worker_dbs()
+
+    def run_tests(self, sock, request):
+        global _warm_plugin
+        from nose.core import TestProgram
+
+        stdout = FrameStream(sock, STDOUT)
+        stderr = FrameStream(sock, STDERR)
+        if request['settings'] != self.plugin.settings_module:
+            stderr.write('The nosedjango server runs with settings %s, not '
+                         '%s\n' % (self.plugin.settings_module,
+                                   request['settings']))
+            return False
+
+        changed = get_changed_modules(self.module_mtimes)
+        if changed:
+            message = (
+                'The nosedjango server would run stale code, these modules '
+                'changed since it started:\n  %s\nStopping it; run the tests '
+                'again, and restart it with --django-server.\n'
+                % '\n  '.join(changed))
+            stderr.write(message)
+            sys.stderr.write(message)
+            self.is_stale = True
+            return False
+
+        os.chdir(request['cwd'])
+        sys.stdout, sys.stderr = stdout, stderr
+        _warm_plugin = self.plugin
+        try:
+            program = TestProgram(
+                argv=['nosetests'] + request['argv'], exit=False)
+            return program.success
+        except SystemExit, e:
+            # Option errors and the like
+            return not e.code
+        except:
+            traceback.print_exc()
+            return False
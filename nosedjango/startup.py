@@ -0,0 +1,64 @@
+"""
+Timing of the stages nosedjango goes through before the first test runs,
+for ``--django-startup-profile``.
+"""
+
+from __future__ import with_statement
+
+import contextlib
+import time
+
+class StartupProfile(object):
+    """
+    Nested, named timings. ``stage`` is a no-op unless the profile is
+    active, so callers don't need to check.
+    """
+    def __init__(self, active):
+        self.active = active
+        self.start = time.time()
+        self.stages = []
+        self.depth = 0
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if not self.active:
+            yield
+            return
+
+        record = [self.depth, name, None]
+        self.stages.append(record)
+        self.depth += 1
+        start = time.time()
+        try:
+            yield
+        finally:
+            record[2] = time.time() - start
+            self.depth -= 1
+
+    def add(self, name, duration):
+        """
+        Record a stage that wasn't timed with ``stage``.
+        """
+        if self.active:
+            self.stages.append([self.depth, name, duration])
+
+    def finish(self, stream):
+        """
+        Print the breakdown and stop recording.
+        """
+        if not self.active:
+            return
+        self.active = False
+
+        total = time.time() - self.start
+        stream.write('-' * 70 + '\n')
+        stream.write('nosedjango startup profile\n')
+        for depth, name, duration in self.stages:
+            if duration is None:
+                # Left by an exception
+                continue
+            percentage = total and duration * 100 / total
+            stream.write('%9.3fs %5.1f%%  %s%s\n' % (
+                duration, percentage, '  ' * depth, name))
+        stream.write('%9.3fs         total\n' % total)
+        stream.write('-' * 70 + '\n')
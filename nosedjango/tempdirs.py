@@ -0,0 +1,70 @@
+"""
+Per-user directories for the files nosedjango keeps between runs. Whatever is
+read back from them (settings paths that end up on ``sys.path``, template
+databases, the test server's socket) is trusted, so they live under a name containing the user id, are
+created readable by their owner only and are ignored when someone else owns
+them or can write to them.
+"""
+
+import os
+import stat
+import tempfile
+
+def get_user_temp_dir():
+    """
+    ``nosedjango-<uid>`` in the system temporary directory.
+    """
+    if hasattr(os, 'getuid'):
+        name = 'nosedjango-%s' % os.getuid()
+    else:
+        name = 'nosedjango'
+    return os.path.join(tempfile.gettempdir(), name)
+
+def _is_private(path, file_type):
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    if stat.S_IFMT(st.st_mode) != file_type:
+        # Also rules out symlinks planted in place of the real thing
+        return False
+    if not hasattr(os, 'getuid'):
+        return True
+    return st.st_uid == os.getuid() and not st.st_mode & 022
+
+def is_private_dir(path):
+    """
+    Is ``path`` a directory owned by the current user that nobody else can
+    write to?
+    """
+    return _is_private(path, stat.S_IFDIR)
+
+def is_private_file(path):
+    """
+    Is ``path`` a regular file owned by the current user that nobody else
+    can write to?
+    """
+    return _is_private(path, stat.S_IFREG)
+
+def is_private_socket(path):
+    """
+    Is ``path`` a unix socket owned by the current user that nobody else can
+    write to?
+    """
+    return _is_private(path, stat.S_IFSOCK)
+
+def ensure_private_dir(path):
+    """
+    Create ``path`` with mode 0700 if it doesn't exist yet. Returns whether
+    it can be trusted, see ``is_private_dir``.
+    """
+    if not os.path.lexists(path):
+        parent = os.path.dirname(path)
+        if parent and not os.path.exists(parent):
+            os.makedirs(parent)
+        try:
+            os.mkdir(path, 0700)
+        except OSError:
+            # Created by a parallel run in the meantime, checked below
+            pass
+    return is_private_dir(path)
@@ -0,0 +1,351 @@
+"""
+Test database templates. A template holds a freshly created test database so
+that later runs can clone it instead of running ``syncdb`` and all of the
+``post_syncdb`` handlers from scratch. Templates are keyed by the schema
+fingerprint, so changing a model or the installed apps builds a new one.
+
+Snapshots work the same way but only last for one run: they let tests that
+set ``rebuild_schema`` get a pristine database back without a new ``syncdb``.
+"""
+
+import os
+
+def copy_sqlite_database(source, target):
+    """
+    Copy the full contents of the ``source`` sqlite connection into the
+    (empty) ``target`` connection.
+
+    Python 2's sqlite3 module doesn't expose sqlite's online backup API, so
+    the copy replays the SQL dump of ``source`` instead.
+    """
+    target.executescript('\n'.join(source.iterdump()))
+    target.commit()
+
+def execute_on_database(connection, database_name, sql, params=None):
+    """
+    Run ``sql`` in autocommit mode while connected to ``database_name``
+    (usually the original, non-test database), since PostgreSQL won't copy
+    or drop a database that has open connections. Returns the fetched rows
+    for queries.
+    """
+    settings_dict = connection.settings_dict
+    current_name = settings_dict['NAME']
+    connection.close()
+    settings_dict['NAME'] = database_name
+    try:
+        cursor = connection.cursor()
+        connection.creation.set_autocommit()
+        cursor.execute(sql, params)
+        if cursor.description is not None:
+            return cursor.fetchall()
+        return None
+    finally:
+        connection.close()
+        settings_dict['NAME'] = current_name
+
+def switch_to_database(connection, database_name):
+    """
+    Point the connection at a newly created test database, the way
+    ``create_test_db`` does.
+    """
+    connection.close()
+    connection.settings_dict['NAME'] = database_name
+    connection.features.confirm()
+
+class BaseTemplate(object):
+    """
+    A schema template for a single database connection.
+    """
+    def __init__(self, connection, old_database_name, fingerprint,
+                 template_dir):
+        self.connection = connection
+        self.old_database_name = old_database_name
+        self.fingerprint = fingerprint
+        self.template_dir = template_dir
+
+    def get_test_db_name(self):
+        return self.connection.creation._get_test_db_name()
+
+    def exists(self):
+        """
+        Is there a template for the current schema fingerprint?
+        """
+        raise NotImplementedError
+
+    def save(self):
+        """
+        Store the freshly created test database as the template for the
+        current fingerprint, discarding templates for older fingerprints.
+        """
+        raise NotImplementedError
+
+    def restore(self, verbosity=1):
+        """
+        Create the test database as a copy of the template and point the
+        connection at it, the way ``create_test_db`` would.
+        """
+        raise NotImplementedError
+
+    def delete(self):
+        """
+        Remove the template for the current fingerprint.
+        """
+        raise NotImplementedError
+
+    def _announce(self, verbosity, source):
+        if verbosity >= 1:
+            test_db_repr = ''
+            if verbosity >= 2:
+                test_db_repr = " ('%s')" % self.get_test_db_name()
+            print "Creating test database for alias '%s'%s from %s..." % (
+                self.connection.alias, test_db_repr, source)
+
+class SqliteTemplate(BaseTemplate):
+    """
+    Keep the template as an sqlite database file. Works for both file-based
+    and in-memory test databases.
+    """
+    def _get_prefix(self):
+        test_database_name = self.get_test_db_name()
+        if test_database_name == ':memory:':
+            base_name = 'memory'
+        else:
+            base_name = os.path.splitext(os.path.basename(test_database_name))[0]
+        return '%s-%s-' % (self.connection.alias, base_name)
+
+    def get_template_path(self):
+        return os.path.join(
+            self.template_dir,
+            '%s%s.sqlite3' % (self._get_prefix(), self.fingerprint))
+
+    def exists(self):
+        return os.path.exists(self.get_template_path())
+
+    def save(self):
+        from django.db.backends.sqlite3.base import Database
+
+        if not os.path.exists(self.template_dir):
+            os.makedirs(self.template_dir)
+
+        prefix = self._get_prefix()
+        for filename in os.listdir(self.template_dir):
+            if filename.startswith(prefix) and filename.endswith('.sqlite3'):
+                os.remove(os.path.join(self.template_dir, filename))
+
+        # Write to a temporary file first so that parallel test processes
+        # never see a half-written template
+        template_path = self.get_template_path()
+        tmp_path = '%s.%s.tmp' % (template_path, os.getpid())
+        self.connection.cursor()
+        target = Database.connect(tmp_path)
+        try:
+            copy_sqlite_database(self.connection.connection, target)
+        finally:
+            target.close()
+        os.rename(tmp_path, template_path)
+
+    def restore(self, verbosity=1):
+        from django.db.backends.sqlite3.base import Database
+
+        self._announce(verbosity, "template '%s'" % self.get_template_path())
+        source = Database.connect(self.get_template_path())
+        try:
+            self._restore_from(source)
+        finally:
+            source.close()
+
+    def _restore_from(self, source):
+        test_database_name = self.get_test_db_name()
+        if test_database_name != ':memory:' \
+           and os.access(test_database_name, os.F_OK):
+            os.remove(test_database_name)
+
+        switch_to_database(self.connection, test_database_name)
+        if test_database_name == ':memory:' \
+           and self.connection.connection is not None:
+            # Django never closes in-memory databases; throw away whatever
+            # schema the current one has
+            self.connection.connection.close()
+            self.connection.connection = None
+        # The restore has to go through Django's own connection, otherwise an
+        # in-memory database would vanish along with our private one.
+        self.connection.cursor()
+        copy_sqlite_database(source, self.connection.connection)
+
+    def delete(self):
+        if self.exists():
+            os.remove(self.get_template_path())
+
+class PostgresTemplate(BaseTemplate):
+    """
+    Keep the template as a PostgreSQL database and clone it with
+    ``CREATE DATABASE ... TEMPLATE``.
+    """
+    def _get_prefix(self):
+        return '%s_tpl_' % self.get_test_db_name()
+
+    def get_template_name(self):
+        return '%s%s' % (self._get_prefix(), self.fingerprint)
+
+    def _execute_on_old_db(self, sql, params=None):
+        return execute_on_database(
+            self.connection, self.old_database_name, sql, params)
+
+    def _template_names(self):
+        prefix = self._get_prefix()
+        rows = self._execute_on_old_db('SELECT datname FROM pg_database')
+        return [row[0] for row in rows if row[0].startswith(prefix)]
+
+    def exists(self):
+        return self.get_template_name() in self._template_names()
+
+    def save(self):
+        qn = self.connection.ops.quote_name
+        for stale_name in self._template_names():
+            self._execute_on_old_db('DROP DATABASE %s' % qn(stale_name))
+
+        self._execute_on_old_db('CREATE DATABASE %s TEMPLATE %s' % (
+            qn(self.get_template_name()), qn(self.get_test_db_name())))
+
+    def restore(self, verbosity=1):
+        qn = self.connection.ops.quote_name
+        template_name = self.get_template_name()
+        test_database_name = self.get_test_db_name()
+
+        self._announce(verbosity, "template '%s'" % template_name)
+        self._execute_on_old_db(
+            'DROP DATABASE IF EXISTS %s' % qn(test_database_name))
+        self._execute_on_old_db('CREATE DATABASE %s TEMPLATE %s' % (
+            qn(test_database_name), qn(template_name)))
+
+        switch_to_database(self.connection, test_database_name)
+
+    def delete(self):
+        self._execute_on_old_db('DROP DATABASE IF EXISTS %s' % (
+            self.connection.ops.quote_name(self.get_template_name())))
+
+class PostgresSnapshot(PostgresTemplate):
+    """
+    Snapshots live next to the templates under a prefix of their own, so
+    that saving one doesn't drop the templates.
+    """
+    def _get_prefix(self):
+        return '%s_snap_' % self.get_test_db_name()
+
+class SqliteSnapshot(SqliteTemplate):
+    """
+    Keep the snapshot in a private in-memory database, which leaves nothing
+    behind even in processes that never get to clean up.
+    """
+    def __init__(self, *args, **kwargs):
+        super(SqliteSnapshot, self).__init__(*args, **kwargs)
+        self.snapshot = None
+
+    def exists(self):
+        return self.snapshot is not None
+
+    def save(self):
+        from django.db.backends.sqlite3.base import Database
+
+        self.connection.cursor()
+        self.snapshot = Database.connect(':memory:')
+        copy_sqlite_database(self.connection.connection, self.snapshot)
+
+    def restore(self, verbosity=1):
+        self._announce(verbosity, 'a snapshot')
+        self._restore_from(self.snapshot)
+
+    def delete(self):
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot = None
+
+class MysqlSnapshot(BaseTemplate):
+    """
+    Dump the schema and the rows of every table into memory and replay them
+    into a recreated database.
+    """
+    def __init__(self, *args, **kwargs):
+        super(MysqlSnapshot, self).__init__(*args, **kwargs)
+        self.dump = None
+
+    def exists(self):
+        return self.dump is not None
+
+    def save(self):
+        qn = self.connection.ops.quote_name
+        cursor = self.connection.cursor()
+        cursor.execute("SHOW FULL TABLES WHERE Table_type = 'BASE TABLE'")
+        tables = [row[0] for row in cursor.fetchall()]
+
+        self.dump = []
+        for table in tables:
+            cursor.execute('SHOW CREATE TABLE %s' % qn(table))
+            create_sql = cursor.fetchone()[1]
+            cursor.execute('SELECT * FROM %s' % qn(table))
+            rows = list(cursor.fetchall())
+            columns = [column[0] for column in cursor.description]
+            self.dump.append((table, create_sql, columns, rows))
+
+    def restore(self, verbosity=1):
+        qn = self.connection.ops.quote_name
+        test_database_name = self.get_test_db_name()
+
+        self._announce(verbosity, 'a snapshot')
+        execute_on_database(
+            self.connection, self.old_database_name,
+            'DROP DATABASE IF EXISTS %s' % qn(test_database_name))
+        execute_on_database(
+            self.connection, self.old_database_name,
+            'CREATE DATABASE %s %s' % (
+                qn(test_database_name),
+                self.connection.creation.sql_table_creation_suffix()))
+        switch_to_database(self.connection, test_database_name)
+
+        cursor = self.connection.cursor()
+        cursor.execute('SET FOREIGN_KEY_CHECKS = 0')
+        for table, create_sql, columns, rows in self.dump:
+            cursor.execute(create_sql)
+            if rows:
+                cursor.executemany('INSERT INTO %s (%s) VALUES (%s)' % (
+                    qn(table),
+                    ', '.join([qn(column) for column in columns]),
+                    ', '.join(['%s'] * len(columns))), rows)
+        cursor.execute('SET FOREIGN_KEY_CHECKS = 1')
+
+    def delete(self):
+        self.dump = None
+
+def get_snapshot(connection, old_database_name):
+    """
+    Return an empty snapshot for the connection's test database, or
+    ``None`` if the engine doesn't support snapshots.
+    """
+    engine = connection.settings_dict['ENGINE']
+    if 'sqlite3' in engine:
+        snapshot_class = SqliteSnapshot
+    elif 'postgresql' in engine:
+        snapshot_class = PostgresSnapshot
+    elif 'mysql' in engine:
+        snapshot_class = MysqlSnapshot
+    else:
+        return None
+
+    return snapshot_class(
+        connection, old_database_name, 'pid%d' % os.getpid(), None)
+
+def get_template(connection, old_database_name, fingerprint, template_dir):
+    """
+    Return the template implementation for the connection's database engine,
+    or ``None`` if the engine doesn't support templates.
+    """
+    engine = connection.settings_dict['ENGINE']
+    if 'sqlite3' in engine:
+        template_class = SqliteTemplate
+    elif 'postgresql' in engine:
+        template_class = PostgresTemplate
+    else:
+        return None
+
+    return template_class(
+        connection, old_database_name, fingerprint, template_dir)
@@ -0,0 +1,155 @@
+"""
+Test databases for nose's multiprocess plugin.
+
+The main process creates the test database as usual and then only serves as
+the master copy: every worker process gets its own database, named after the
+worker's pid and cloned from the master where the engine allows it, so that
+workers don't clash on PostgreSQL or MySQL. Workers never run ``finalize``,
+so the main process drops all worker databases once they have exited, several
+at a time.
+"""
+
+from __future__ import absolute_import
+
+import atexit
+import glob
+import os
+import shutil
+import time
+
+from nosedjango.connections import clone_connection
+from nosedjango.parallel import ThreadPool
+from nosedjango.templatedb import execute_on_database, switch_to_database
+
+# Workers may be forked after the main process switched its settings over to
+# the test database, so the names are handed down through the environment
+OLD_DB_ENV = 'NOSEDJANGO_OLD_DB'
+MASTER_DB_ENV = 'NOSEDJANGO_MASTER_TEST_DB'
+
+def publish_master_db(old_database_name, master_name):
+    os.environ[OLD_DB_ENV] = old_database_name
+    os.environ[MASTER_DB_ENV] = master_name
+
+def clear_master_db():
+    os.environ.pop(OLD_DB_ENV, None)
+    os.environ.pop(MASTER_DB_ENV, None)
+
+# Calls dropping worker databases, waiting for nose to stop the workers
+_pending_drops = []
+
+def drop_later(*calls):
+    """
+    Make the ``(function, args...)`` calls once the workers are gone: at
+    exit, or when the next test run in this process begins (setup.py runs
+    several), whichever comes first.
+    """
+    if not _pending_drops:
+        atexit.register(run_pending_drops)
+    _pending_drops.extend(calls)
+
+def run_pending_drops():
+    while _pending_drops:
+        call = _pending_drops.pop(0)
+        call[0](*call[1:])
+
+def get_master_db():
+    """
+    Return the ``(old_database_name, master_name)`` published by the main
+    process, or ``None`` outside of a multiprocess run.
+    """
+    if MASTER_DB_ENV not in os.environ:
+        return None
+    return os.environ[OLD_DB_ENV], os.environ[MASTER_DB_ENV]
+
+def get_worker_db_prefix(master_name):
+    return '%s_worker' % master_name
+
+def get_worker_db_name(master_name):
+    return '%s%d' % (get_worker_db_prefix(master_name), os.getpid())
+
+def _execute_with_retries(connection, database_name, sql, tries=10):
+    """
+    PostgreSQL refuses to copy or drop a database while other sessions are
+    still connected to it, which happens briefly when workers start and exit.
+    """
+    for attempt in range(tries):
+        try:
+            return execute_on_database(connection, database_name, sql)
+        except Exception:
+            if attempt == tries - 1:
+                raise
+            time.sleep(0.5)
+
+def create_worker_db(connection, old_database_name, master_name, verbosity=1):
+    """
+    Create this worker's test database and point the connection at it.
+    Returns ``False`` when the worker should create its test database the
+    usual way instead.
+    """
+    engine = connection.settings_dict['ENGINE']
+    if 'sqlite3' in engine and master_name == ':memory:':
+        # In-memory databases are private to each process already
+        return False
+
+    creation = connection.creation
+    connection.close()
+    connection.settings_dict['NAME'] = old_database_name
+
+    worker_name = get_worker_db_name(master_name)
+    connection.settings_dict['TEST_NAME'] = worker_name
+    if verbosity >= 1:
+        print "Creating test database for alias '%s' ('%s') from '%s'..." % (
+            connection.alias, worker_name, master_name)
+
+    if 'sqlite3' in engine:
+        shutil.copyfile(master_name, worker_name)
+        switch_to_database(connection, worker_name)
+    elif 'postgresql' in engine:
+        qn = connection.ops.quote_name
+        execute_on_database(
+            connection, old_database_name,
+            'DROP DATABASE IF EXISTS %s' % qn(worker_name))
+        _execute_with_retries(
+            connection, old_database_name,
+            'CREATE DATABASE %s TEMPLATE %s' % (
+                qn(worker_name), qn(master_name)))
+        switch_to_database(connection, worker_name)
+    else:
+        # No cheap way to copy a database; build it from scratch
+        creation.create_test_db(verbosity=verbosity, autoclobber=True)
+    return True
+
+def destroy_worker_dbs(connection, old_database_name, master_name,
+                       verbosity=1):
+    """
+    Drop every worker database created from ``master_name``.
+    """
+    engine = connection.settings_dict['ENGINE']
+    prefix = get_worker_db_prefix(master_name)
+
+    if 'sqlite3' in engine:
+        if master_name != ':memory:':
+            for path in glob.glob('%s*' % prefix):
+                os.remove(path)
+        return
+
+    if 'postgresql' in engine:
+        sql = 'SELECT datname FROM pg_database'
+    elif 'mysql' in engine:
+        sql = 'SHOW DATABASES'
+    else:
+        return
+
+    qn = connection.ops.quote_name
+    rows = execute_on_database(connection, old_database_name, sql)
+    pool = ThreadPool()
+    for (name,) in rows:
+        if not name.startswith(prefix):
+            continue
+        if verbosity >= 1:
+            print "Destroying test database for alias '%s' ('%s')..." % (
+                connection.alias, name)
+        pool.submit(
+            _execute_with_retries, clone_connection(connection),
+            old_database_name, 'DROP DATABASE %s' % qn(name))
+    pool.join()
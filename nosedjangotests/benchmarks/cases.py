@@ -0,0 +1,60 @@
+"""
+Synthetic test classes for the overhead benchmark. Every class gets
+``NOSEDJANGO_BENCHMARK_TESTS`` identical tests that each save a poll and
+count the polls, so that all the per-test work nosedjango does (rollback,
+flush, fixture loading, URLconf swapping) has something to clean up, except
+``ControlCase``, whose tests do nothing and don't use the database.
+"""
+
+import datetime
+import os
+from unittest import TestCase as UnitTestCase
+
+from django.test import TestCase
+
+from nosedjangotests.polls.models import Poll
+
+TESTS_ENV = 'NOSEDJANGO_BENCHMARK_TESTS'
+
+def _make_test(name):
+    def test(self):
+        Poll.objects.create(
+            question='Benchmark?', pub_date=datetime.datetime.now())
+        Poll.objects.count()
+    # nose selects test methods by their name
+    test.__name__ = name
+    return test
+
+def _make_noop_test(name):
+    def test(self):
+        pass
+    test.__name__ = name
+    return test
+
+def _make_case(name, base, make_test=_make_test, **attrs):
+    for i in range(int(os.environ.get(TESTS_ENV, '100'))):
+        test_name = 'test_%04d' % i
+        attrs[test_name] = make_test(test_name)
+    return type(name, (base,), attrs)
+
+# What running a test costs nose and nosedjango without any database work,
+# the baseline the other classes are measured against
+ControlCase = _make_case(
+    'ControlCase', UnitTestCase, make_test=_make_noop_test,
+    uses_database=False)
+
+TransactionalCase = _make_case('TransactionalCase', UnitTestCase)
+
+FlushCase = _make_case(
+    'FlushCase', UnitTestCase, use_transaction_isolation=False)
+
+DjangoCase = _make_case('DjangoCase', TestCase)
+
+FixturesCase = _make_case(
+    'FixturesCase', UnitTestCase, fixtures=['polls1.json', 'polls2.json'])
+
+UrlsCase = _make_case('UrlsCase', UnitTestCase, urls='nosedjangotests.urls')
+
+FixturesUrlsCase = _make_case(
+    'FixturesUrlsCase', UnitTestCase,
+    fixtures=['polls1.json', 'polls2.json'], urls='nosedjangotests.urls')
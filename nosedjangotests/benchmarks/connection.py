@@ -0,0 +1,75 @@
+"""
+Compare closing the database connection after every rolled back test with
+resetting its session (``--django-keep-connection``).
+
+Run it from the nosedjangotests directory against the database a settings
+module points at, for instance::
+
+    python -m benchmarks.connection --settings nosedjangotests.settings -n 500
+
+Each cycle does what nosedjango does around a transactional test that runs a
+single query: enter transaction management, query, roll back, leave
+transaction management and then either close or reset the connection. With
+an in-memory sqlite database Django never really closes the connection, so
+both paths cost the same there.
+"""
+
+import os
+import sys
+import time
+from optparse import OptionParser
+
+def run_cycles(connection, cycles, release):
+    from django.db import transaction
+
+    start = time.time()
+    for i in range(cycles):
+        transaction.enter_transaction_management()
+        transaction.managed(True)
+        cursor = connection.cursor()
+        cursor.execute('SELECT 1')
+        cursor.fetchall()
+        transaction.rollback()
+        transaction.leave_transaction_management()
+        release(connection)
+    return time.time() - start
+
+def close_connection(connection):
+    connection.close()
+
+def keep_connection(connection):
+    from nosedjango.connections import reset_connection
+
+    if not reset_connection(connection):
+        connection.close()
+
+def main(argv=None):
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--settings', default='nosedjangotests.settings',
+                      help='Django settings module to connect with.')
+    parser.add_option('-n', '--cycles', type='int', default=200,
+                      help='Number of simulated tests per path (default 200).')
+    options, args = parser.parse_args(argv)
+
+    os.environ['DJANGO_SETTINGS_MODULE'] = options.settings
+    from django.db import connection
+
+    # Connect once so that neither path pays for the first connection
+    connection.cursor()
+    connection.close()
+
+    results = []
+    for name, release in (('close', close_connection),
+                          ('keep', keep_connection)):
+        elapsed = run_cycles(connection, options.cycles, release)
+        results.append((name, elapsed))
+        connection.close()
+
+    sys.stdout.write('%s, %d cycles per path\n' % (
+        connection.settings_dict['ENGINE'], options.cycles))
+    for name, elapsed in results:
+        sys.stdout.write('%-6s %8.3fs total %8.3fms per test\n' % (
+            name, elapsed, elapsed * 1000 / options.cycles))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+"""
+Measure what nosedjango costs per test and at startup.
+
+Every isolation mode is a class of synthetic tests in
+``nosedjangotests.benchmarks.cases``. Each one is run in a fresh ``nosetests``
+process with ``-n`` tests. A run with no tests at all gives the startup time
+(interpreter, settings, test database), and a run of ``-n`` tests that do
+nothing without touching the database is the control. The difference between
+a mode's run and the control, divided by ``-n``, is the cost of a single
+test. That cost includes the test body, saving a poll and counting the polls,
+as well as nosedjango's isolation. It is reported as measured, so noise can
+make it slightly negative. Run it from the directory containing
+``nosedjangotests``::
+
+    python -m nosedjangotests.benchmarks.overhead -n 200
+
+By default it measures an in-memory sqlite database and a file-based one,
+which is really closed and reopened like a PostgreSQL connection. Add
+``--settings nosedjangotests.benchmarks.settings_postgres`` (configured with
+the usual ``PG*`` environment variables) to measure a local PostgreSQL.
+
+Save a run with ``--save FILE`` and compare a later one against it with
+``--compare FILE``; the benchmark exits with status 1 if any measurement got
+slower by more than ``--threshold`` percent and by more than ``--noise-floor``
+milliseconds per test.
+"""
+
+import os
+import shlex
+import subprocess
+import sys
+import time
+from optparse import OptionParser
+
+try:
+    import json
+except ImportError:
+    from django.utils import simplejson as json
+
+CASES_MODULE = 'nosedjangotests.benchmarks.cases'
+TESTS_ENV = 'NOSEDJANGO_BENCHMARK_TESTS'
+CONTROL_CASE = 'ControlCase'
+
+MODES = (
+    ('transactional', 'TransactionalCase'),
+    ('flush', 'FlushCase'),
+    ('django', 'DjangoCase'),
+    ('fixtures', 'FixturesCase'),
+    ('urls', 'UrlsCase'),
+    ('fixtures+urls', 'FixturesUrlsCase'),
+)
+MODE_NAMES = [name for name, _ in MODES]
+
+DEFAULT_SETTINGS = (
+    'nosedjangotests.benchmarks.settings_sqlite',
+    'nosedjangotests.benchmarks.settings_sqlite_file',
+)
+
+class BenchmarkError(Exception):
+    pass
+
+def get_root_dir():
+    """
+    The directory ``nosedjangotests`` lives in.
+    """
+    return os.path.dirname(os.path.dirname(
+        os.path.dirname(os.path.abspath(__file__))))
+
+def time_run(settings_module, case, tests, nose_args):
+    """
+    Run ``tests`` tests of ``case`` in a new process and return the wall
+    clock time it took.
+    """
+    root_dir = get_root_dir()
+    env = dict(os.environ)
+    env[TESTS_ENV] = str(tests)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [root_dir] + [path for path in [env.get('PYTHONPATH')] if path])
+
+    argv = [sys.executable, '-m', 'nose', '--with-django',
+            '--django-settings', settings_module] + nose_args + [
+            '%s:%s' % (CASES_MODULE, case)]
+
+    start = time.time()
+    process = subprocess.Popen(
+        argv, cwd=root_dir, env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.communicate()[0]
+    elapsed = time.time() - start
+    if process.returncode:
+        raise BenchmarkError(
+            '%s failed with %s:\n%s' % (case, settings_module, output))
+    return elapsed
+
+def best_of(repeat, *args):
+    return min([time_run(*args) for i in range(repeat)])
+
+def benchmark(settings_module, modes, tests, repeat, nose_args):
+    """
+    Return ``{'startup': seconds, 'control': seconds, 'per_test': {mode:
+    seconds}, 'tests': tests}`` for one settings module. ``control`` is what
+    a test that does nothing costs on top of the startup, and every mode is
+    measured against it.
+    """
+    # Untimed, to get .pyc files written and the OS caches warm
+    time_run(settings_module, MODES[0][1], 0, nose_args)
+    startup = best_of(repeat, settings_module, MODES[0][1], 0, nose_args)
+    control = best_of(repeat, settings_module, CONTROL_CASE, tests, nose_args)
+    per_test = {}
+    for name, case in MODES:
+        if name not in modes:
+            continue
+        elapsed = best_of(repeat, settings_module, case, tests, nose_args)
+        per_test[name] = (elapsed - control) / tests
+    return {
+        'startup': startup,
+        'control': (control - startup) / tests,
+        'per_test': per_test,
+        'tests': tests,
+    }
+
+def _get_value(result, name):
+    if name in ('startup', 'control'):
+        return result.get(name)
+    return result['per_test'].get(name)
+
+def _measurements(results):
+    for settings_module in sorted(results):
+        result = results[settings_module]
+        for name in ['startup', 'control'] + MODE_NAMES:
+            value = _get_value(result, name)
+            if value is not None:
+                yield settings_module, name, value
+
+def is_regression(value, old_value, threshold, noise_floor):
+    """
+    Did a measurement get slower by more than ``threshold`` percent and by
+    more than ``noise_floor`` seconds? Per-test values close to zero make
+    percentages meaningless, so only the noise floor counts for them.
+    """
+    if value - old_value <= noise_floor:
+        return False
+    if old_value <= noise_floor:
+        return True
+    return (value - old_value) * 100 / old_value > threshold
+
+def print_results(results, stream, baseline=None, threshold=None,
+                  noise_floor=0.0):
+    """
+    Print the results, with the change against ``baseline`` if given.
+    Returns the measurements that got slower than ``threshold`` percent and
+    ``noise_floor`` seconds per test.
+    """
+    regressions = []
+    for settings_module, name, value in _measurements(results):
+        if name == 'startup':
+            stream.write('%s\n' % settings_module)
+            line = '  %-15s %9.1fms' % (name, value * 1000)
+        else:
+            line = '  %-15s %9.3fms per test' % (name, value * 1000)
+
+        old_value = None
+        if baseline is not None:
+            old_result = baseline.get(settings_module)
+            if old_result is not None:
+                old_value = _get_value(old_result, name)
+        if old_value is not None:
+            floor = noise_floor
+            if name == 'startup':
+                # Spread over as many tests as a run has
+                floor = noise_floor * results[settings_module]['tests']
+            line = '%-40s %+9.3fms' % (line, (value - old_value) * 1000)
+            if old_value > 0:
+                line += ' %+7.1f%%' % ((value - old_value) * 100 / old_value)
+            if is_regression(value, old_value, threshold, floor):
+                line += '  REGRESSION'
+                regressions.append((settings_module, name))
+        stream.write('%s\n' % line)
+    return regressions
+
+def main(argv=None):
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('-n', '--tests', type='int', default=100,
+                      help='Number of tests per mode (default 100).')
+    parser.add_option('--repeat', type='int', default=3,
+                      help='Run everything this many times and keep the '
+                      'fastest run (default 3).')
+    parser.add_option('--settings', action='append', default=[],
+                      help='Django settings module to benchmark, can be '
+                      'given more than once. Defaults to in-memory and '
+                      'file-based sqlite.')
+    parser.add_option('--mode', action='append', default=[],
+                      choices=MODE_NAMES, type='choice',
+                      help='Isolation mode to benchmark, one of %s, can be '
+                      'given more than once. Defaults to all of them.'
+                      % ', '.join(MODE_NAMES))
+    parser.add_option('--nose-args', default='',
+                      help='Extra nosetests options, for instance '
+                      '"--django-keep-connection".')
+    parser.add_option('--save', metavar='FILE',
+                      help='Write the results to FILE as JSON.')
+    parser.add_option('--compare', metavar='FILE',
+                      help='Compare the results with a run saved to FILE.')
+    parser.add_option('--threshold', type='float', default=10.0,
+                      help='Percentage by which a measurement may get '
+                      'slower than in --compare before it counts as a '
+                      'regression (default 10).')
+    parser.add_option('--noise-floor', type='float', default=0.02,
+                      metavar='MS',
+                      help='Milliseconds per test a measurement may get '
+                      'slower than in --compare without counting as a '
+                      'regression, whatever the percentage (default 0.02).')
+    options, args = parser.parse_args(argv)
+
+    settings_modules = options.settings or list(DEFAULT_SETTINGS)
+    modes = options.mode or MODE_NAMES
+    nose_args = shlex.split(options.nose_args)
+
+    baseline = None
+    if options.compare:
+        f = open(options.compare)
+        try:
+            baseline = json.load(f)
+        finally:
+            f.close()
+
+    results = {}
+    for settings_module in settings_modules:
+        try:
+            results[settings_module] = benchmark(
+                settings_module, modes, options.tests, options.repeat,
+                nose_args)
+        except BenchmarkError, e:
+            sys.stderr.write('%s\n' % e)
+            return 2
+
+    regressions = print_results(
+        results, sys.stdout, baseline, options.threshold,
+        options.noise_floor / 1000)
+
+    if options.save:
+        f = open(options.save, 'w')
+        try:
+            json.dump(results, f, indent=2)
+        finally:
+            f.close()
+
+    if regressions:
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,16 @@
+# A file-based sqlite database gets really closed and reopened like a
+# database server connection, so it stands in for PostgreSQL where there is
+# none to benchmark against.
+import os
+import tempfile
+
+from nosedjangotests.settings import *
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(tempfile.gettempdir(), 'nosedjango-bench.db'),
+        'TEST_NAME': os.path.join(
+            tempfile.gettempdir(), 'test_nosedjango-bench.db'),
+    }
+}
@@ -0,0 +1,16 @@
+"""
+Not collected, loaded by ``test_scheduling`` along with ``scattered_b``.
+"""
+from unittest import TestCase
+
+
+class PollsA(TestCase):
+    fixtures = ['polls1.json']
+
+    def test_polls(self):
+        pass
+
+
+class PlainA(TestCase):
+    def test_plain(self):
+        pass
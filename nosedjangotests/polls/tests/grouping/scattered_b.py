@@ -0,0 +1,16 @@
+"""
+Not collected, loaded by ``test_scheduling`` along with ``scattered_a``.
+"""
+from unittest import TestCase
+
+
+class PollsB(TestCase):
+    fixtures = ['polls1.json']
+
+    def test_polls(self):
+        pass
+
+
+class PlainB(TestCase):
+    def test_plain(self):
+        pass
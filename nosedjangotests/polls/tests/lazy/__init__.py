@@ -0,0 +1,14 @@
+"""
+Not collected, run by ``setup.py nosetests`` with ``--django-lazy-db``:
+``without_database`` first, then ``on_demand``.
+"""
+from django.db import connection
+
+
+def has_test_database():
+    """
+    Has the test database been created? Creating it switches the connection
+    over to the test database name.
+    """
+    return connection.settings_dict['NAME'] == \
+        connection.creation._get_test_db_name()
@@ -0,0 +1,25 @@
+"""
+nose runs the classes in name order: ``OnFirstCursor`` creates the test
+database, ``WithTestDatabase`` finds it.
+"""
+from unittest import TestCase
+
+from django.test import TestCase as DjangoTestCase
+
+from nosedjangotests.polls.models import Poll
+from nosedjangotests.polls.tests import lazy
+
+
+class OnFirstCursor(TestCase):
+    def test_creates_test_database(self):
+        self.assertFalse(lazy.has_test_database())
+        self.assertEqual(Poll.objects.count(), 0)
+        self.assertTrue(lazy.has_test_database())
+
+
+class WithTestDatabase(DjangoTestCase):
+    fixtures = ['polls1.json']
+
+    def test_uses_test_database(self):
+        self.assertTrue(lazy.has_test_database())
+        self.assertEqual(Poll.objects.count(), 1)
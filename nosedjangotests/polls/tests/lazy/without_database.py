@@ -0,0 +1,13 @@
+from unittest import TestCase
+
+from nosedjangotests.polls.tests import lazy
+
+
+class WithoutDatabase(TestCase):
+    uses_database = False
+
+    def test_no_test_database(self):
+        self.assertFalse(lazy.has_test_database())
+
+    def test_still_no_test_database(self):
+        self.assertFalse(lazy.has_test_database())
@@ -0,0 +1,42 @@
+from StringIO import StringIO
+from unittest import TestCase as UnitTestCase
+
+from nosedjangotests.benchmarks import overhead
+
+def _result(startup, control, per_test):
+    return {'startup': startup, 'control': control, 'per_test': per_test,
+            'tests': 100}
+
+
+class CompareTestCase(UnitTestCase):
+    uses_database = False
+
+    def _regressions(self, old, new, noise_floor=0.00002):
+        baseline = {'settings': old}
+        return overhead.print_results(
+            {'settings': new}, StringIO(), baseline, 10.0, noise_floor)
+
+    def test_zero_baseline_compared(self):
+        old = _result(0.5, 0.001, {'transactional': 0.0})
+        new = _result(0.5, 0.001, {'transactional': 0.001})
+        self.assertEqual(self._regressions(old, new),
+                         [('settings', 'transactional')])
+
+    def test_noise_ignored(self):
+        old = _result(0.5, 0.001, {'transactional': 0.00001})
+        new = _result(0.5, 0.001, {'transactional': 0.000025})
+        self.assertEqual(self._regressions(old, new), [])
+
+    def test_percentage(self):
+        old = _result(0.5, 0.001, {'transactional': 0.001, 'flush': 0.002})
+        new = _result(0.6, 0.001, {'transactional': 0.00105,
+                                   'flush': 0.003})
+        self.assertEqual(self._regressions(old, new),
+                         [('settings', 'startup'), ('settings', 'flush')])
+
+    def test_raw_values_reported(self):
+        stream = StringIO()
+        overhead.print_results(
+            {'settings': _result(0.5, 0.001, {'transactional': -0.0001})},
+            stream)
+        self.assertTrue('-0.100ms per test' in stream.getvalue())
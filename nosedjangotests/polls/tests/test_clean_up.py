@@ -0,0 +1,118 @@
+from unittest import TestCase as UnitTestCase
+
+from django.db import connection
+
+from nosedjango import databases
+from nosedjango.nosedjango import NoseDjango
+
+from nosedjangotests.polls.models import Poll
+
+
+class FakeTest(object):
+    def __init__(self, context):
+        self.context = context
+        self.test = None
+
+
+class Transactional(object):
+    pass
+
+
+class NotTransactional(object):
+    use_transaction_isolation = False
+
+
+class WithoutDatabase(object):
+    uses_database = False
+
+
+class RebuildsSchema(object):
+    rebuild_schema = True
+
+
+def _write_unseen_poll(commit=False):
+    """
+    Insert a poll through the DB-API connection, which the query count
+    doesn't see, just like a write from another process.
+    """
+    connection.cursor()
+    cursor = connection.connection.cursor()
+    cursor.execute(
+        "INSERT INTO %s (question, pub_date) "
+        "VALUES ('Unseen?', '2011-01-01 00:00:00')"
+        % connection.ops.quote_name(Poll._meta.db_table))
+    if commit:
+        connection.connection.commit()
+
+
+class CanSkipCleanUpTestCase(UnitTestCase):
+    uses_database = False
+
+    def setUp(self):
+        self.plugin = NoseDjango()
+
+    def can_skip(self, context, use_transaction_isolation=True,
+                 using_django_testcase_management=False):
+        return self.plugin._can_skip_clean_up(
+            FakeTest(context), use_transaction_isolation,
+            using_django_testcase_management)
+
+    def test_transactional_without_queries(self):
+        self.assertTrue(self.can_skip(Transactional))
+
+    def test_transactional_with_queries(self):
+        self.plugin.query_count = 1
+        self.assertFalse(self.can_skip(Transactional))
+
+    def test_not_transactional_without_queries(self):
+        self.assertFalse(self.can_skip(
+            NotTransactional, use_transaction_isolation=False))
+
+    def test_django_test_case_without_queries(self):
+        self.assertFalse(self.can_skip(
+            Transactional, using_django_testcase_management=True))
+
+    def test_without_database(self):
+        self.assertTrue(self.can_skip(
+            WithoutDatabase, use_transaction_isolation=False))
+
+    def test_without_database_with_queries(self):
+        self.plugin.query_count = 1
+        self.assertFalse(self.can_skip(
+            WithoutDatabase, use_transaction_isolation=False))
+
+    def test_rebuilds_schema(self):
+        self.assertFalse(self.can_skip(RebuildsSchema))
+
+
+class TestSkippedRollback(UnitTestCase):
+    """
+    A test without queries isn't rolled back, so what it wrote behind the
+    query count's back is still there in the next test, until a test that
+    does run queries is rolled back.
+    """
+
+    def test_1_write_unseen(self):
+        _write_unseen_poll()
+
+    def test_2_not_rolled_back(self):
+        self.assertEqual(Poll.objects.count(), 1)
+
+    def test_3_rolled_back(self):
+        self.assertEqual(Poll.objects.count(), 0)
+
+
+class FlushedWithoutQueriesTestCase(UnitTestCase):
+    """
+    Tests without transaction isolation are flushed even when they ran no
+    queries themselves.
+    """
+    use_transaction_isolation = False
+
+    def test_flush_command(self):
+        plugin = NoseDjango()
+        plugin.test_databases = databases.TestDatabases(0)
+
+        _write_unseen_poll(commit=True)
+        plugin._clean_up_test(FakeTest(NotTransactional))
+        self.assertEqual(Poll.objects.count(), 0)
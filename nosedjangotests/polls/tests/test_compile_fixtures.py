@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase as UnitTestCase
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+try:
+    import json
+except ImportError:
+    from django.utils import simplejson as json
+
+from nosedjango.fixtures import (
+    FixtureCache, FixtureNotSupported, compile_fixture, get_compiled_path,
+    read_compiled_fixture)
+
+from nosedjangotests.polls.models import Poll
+
+FIXTURE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'fixtures')
+
+
+class CompiledFixtureTestCase(UnitTestCase):
+    def setUp(self):
+        # Compiled next to a copy, the real fixtures stay uncompiled
+        self.fixture_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.fixture_dir, 'polls1.json')
+        shutil.copy(os.path.join(FIXTURE_DIR, 'polls1.json'), self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.fixture_dir)
+
+    def write_fixture(self, objects):
+        f = open(self.path, 'w')
+        try:
+            json.dump(objects, f)
+        finally:
+            f.close()
+
+    def test_compile_and_load(self):
+        compiled_path = compile_fixture(self.path, 'json')
+        self.assertEqual(compiled_path, get_compiled_path(self.path))
+
+        objects = read_compiled_fixture(self.path)
+        self.assertEqual(len(objects), 1)
+        poll, m2m_data, has_pk = objects[0]
+        self.assertEqual(poll.pk, 1)
+        self.assertEqual(poll.question, 'What bear is best?')
+        self.assertTrue(has_pk)
+
+        self.assertTrue(FixtureCache().load([self.path], commit=False))
+        self.assertEqual(
+            Poll.objects.get(pk=1).question, 'What bear is best?')
+
+    def test_stale_hash(self):
+        compile_fixture(self.path, 'json')
+        self.write_fixture([{'model': 'polls.poll', 'pk': 1, 'fields': {
+            'question': 'Bears, beets?', 'pub_date': '2007-07-15 00:00:00'}}])
+        self.assertEqual(read_compiled_fixture(self.path), None)
+
+        # Loaded from the JSON instead
+        self.assertTrue(FixtureCache().load([self.path], commit=False))
+        self.assertEqual(Poll.objects.get(pk=1).question, 'Bears, beets?')
+
+    def test_changed_attnames(self):
+        compiled_path = compile_fixture(self.path, 'json')
+        f = open(compiled_path, 'rb')
+        try:
+            data = pickle.load(f)
+        finally:
+            f.close()
+        # As if a field was added to the model since
+        data['models']['polls.poll'].append('author_id')
+        f = open(compiled_path, 'wb')
+        try:
+            pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+        finally:
+            f.close()
+        self.assertEqual(read_compiled_fixture(self.path), None)
+
+        self.assertTrue(FixtureCache().load([self.path], commit=False))
+        self.assertEqual(
+            Poll.objects.get(pk=1).question, 'What bear is best?')
+
+    def test_natural_keys_rejected(self):
+        self.write_fixture([{'model': 'auth.permission', 'pk': 1000, 'fields': {
+            'name': 'Can vote', 'codename': 'vote',
+            'content_type': ['polls', 'poll']}}])
+        try:
+            compile_fixture(self.path, 'json')
+        except FixtureNotSupported, e:
+            self.assertTrue('natural keys' in str(e))
+        else:
+            self.fail('Compiled a fixture with natural keys')
+        self.assertFalse(os.path.exists(get_compiled_path(self.path)))
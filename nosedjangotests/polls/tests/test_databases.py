@@ -0,0 +1,146 @@
+"""
+How ``nosedjango.databases`` sorts out the aliases in ``DATABASES``, without
+creating anything.
+"""
+from unittest import TestCase as UnitTestCase
+
+import django.db
+from django.core.exceptions import ImproperlyConfigured
+from django.db.utils import ConnectionHandler
+
+from nosedjango import databases
+
+def _sqlite(name, **extra):
+    settings_dict = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': name}
+    settings_dict.update(extra)
+    return settings_dict
+
+
+class ClassificationTestCase(UnitTestCase):
+    uses_database = False
+
+    def _get_test_databases(self, settings_databases):
+        old_connections = django.db.connections
+        django.db.connections = ConnectionHandler(settings_databases)
+        try:
+            return databases.TestDatabases(verbosity=0)
+        finally:
+            django.db.connections = old_connections
+
+    def test_mirror(self):
+        test_databases = self._get_test_databases({
+            'default': _sqlite('/tmp/default.db'),
+            'replica': _sqlite('/tmp/replica.db', TEST_MIRROR='default'),
+        })
+        self.assertEqual(test_databases.mirrors, {'replica': 'default'})
+        self.assertEqual(test_databases.created, [])
+        self.assertEqual(test_databases.aliases, [])
+        self.assertTrue(test_databases)
+
+    def test_duplicates(self):
+        # Without a TEST_NAME, sqlite test databases are in memory
+        test_databases = self._get_test_databases({
+            'default': _sqlite('/tmp/default.db',
+                               TEST_NAME='/tmp/test_default.db'),
+            'also_default': _sqlite('/tmp/default.db'),
+            'other': _sqlite('/tmp/other.db', TEST_NAME='/tmp/test_other.db'),
+            'other_again': _sqlite('/tmp/other.db'),
+        })
+        self.assertEqual(test_databases.created, ['other'])
+        self.assertEqual(test_databases.duplicates, {
+            'also_default': 'default',
+            'other_again': 'other',
+        })
+        self.assertEqual(test_databases.aliases,
+                         ['other', 'also_default', 'other_again'])
+
+    def test_in_memory_never_shared(self):
+        test_databases = self._get_test_databases({
+            'default': _sqlite(':memory:'),
+            'other': _sqlite(':memory:'),
+            'other_again': _sqlite(':memory:'),
+        })
+        self.assertEqual(test_databases.created, ['other', 'other_again'])
+        self.assertEqual(test_databases.duplicates, {})
+
+    def test_nothing_to_do(self):
+        test_databases = self._get_test_databases({
+            'default': _sqlite(':memory:'),
+        })
+        self.assertFalse(test_databases)
+
+
+class CreationWavesTestCase(UnitTestCase):
+    uses_database = False
+
+    def test_independent(self):
+        self.assertEqual(
+            databases.get_creation_waves(['a', 'b', 'c'], {}),
+            [['a', 'b', 'c']])
+
+    def test_dependencies(self):
+        waves = databases.get_creation_waves(['a', 'b', 'c', 'd'], {
+            'a': ['b'],
+            'b': ['c'],
+            'd': ['c'],
+        })
+        self.assertEqual(waves, [['c'], ['b', 'd'], ['a']])
+
+    def test_missing_dependency_is_met(self):
+        # default is created apart from the other aliases
+        self.assertEqual(
+            databases.get_creation_waves(['a', 'b'], {'a': ['default']}),
+            [['a', 'b']])
+
+    def test_circular(self):
+        self.assertRaises(
+            ImproperlyConfigured, databases.get_creation_waves,
+            ['a', 'b', 'c'], {'a': ['b'], 'b': ['a']})
+
+
+class RecordingTestDatabases(databases.TestDatabases):
+    """
+    Creates and drops nothing, only records what would be.
+    """
+    fail = ()
+
+    def _create(self, alias, master_dbs=None):
+        if alias in self.fail:
+            raise ValueError('Creating %s failed' % alias)
+        self.ready.append(alias)
+
+    def _destroy(self, alias):
+        self.destroyed.append(alias)
+
+
+class AbortSetUpTestCase(UnitTestCase):
+    uses_database = False
+
+    def setUp(self):
+        self.old_connections = django.db.connections
+        # Databases on a server, created in threads
+        django.db.connections = ConnectionHandler({
+            'default': _sqlite(':memory:'),
+            'first': {'ENGINE': 'django.db.backends.dummy', 'NAME': 'first'},
+            'second': {'ENGINE': 'django.db.backends.dummy', 'NAME': 'second'},
+        })
+        self.test_databases = RecordingTestDatabases(verbosity=0)
+        self.test_databases.destroyed = []
+
+    def tearDown(self):
+        django.db.connections = self.old_connections
+
+    def test_default_failed(self):
+        self.test_databases.start_set_up()
+        self.assertEqual(self.test_databases.started, ['first', 'second'])
+        self.test_databases.abort_set_up()
+        self.assertEqual(sorted(self.test_databases.destroyed),
+                         ['first', 'second'])
+        self.assertEqual(self.test_databases.pool, None)
+
+    def test_other_failed(self):
+        self.test_databases.fail = ['second']
+        self.test_databases.start_set_up()
+        self.assertRaises(ValueError, self.test_databases.set_up)
+        self.assertEqual(self.test_databases.destroyed, ['first'])
+        self.assertFalse(self.test_databases.is_set_up)
@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase as UnitTestCase
+
+try:
+    import json
+except ImportError:
+    from django.utils import simplejson as json
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.db.models import signals
+
+from nosedjango.cursors import add_query_listener, remove_query_listener
+from nosedjango.fixtures import FixtureCache
+
+from nosedjangotests.polls.models import Choice
+
+
+def content_type_saved(sender, **kwargs):
+    pass
+
+
+class FixtureOrderTestCase(UnitTestCase):
+    """
+    Objects saved one by one go in along with their model, not after every
+    bulk insert, since InnoDB checks foreign keys right away.
+    """
+    def setUp(self):
+        self.fixture_dir = tempfile.mkdtemp()
+        self.fixture_path = os.path.join(self.fixture_dir, 'order.json')
+        f = open(self.fixture_path, 'w')
+        try:
+            # The choice comes first and points at the content type
+            json.dump([
+                {'model': 'polls.choice', 'pk': 1, 'fields': {
+                    'content_type': 500, 'object_id': 1,
+                    'choice': 'Grizzly', 'votes': 0}},
+                {'model': 'contenttypes.contenttype', 'pk': 500, 'fields': {
+                    'name': 'bear', 'app_label': 'polls', 'model': 'bear'}},
+            ], f)
+        finally:
+            f.close()
+
+        # Content types have to be saved one by one now
+        signals.post_save.connect(content_type_saved, sender=ContentType)
+        self.statements = []
+        add_query_listener(connection, self.record)
+
+    def tearDown(self):
+        remove_query_listener(connection, self.record)
+        signals.post_save.disconnect(content_type_saved, sender=ContentType)
+        shutil.rmtree(self.fixture_dir)
+
+    def record(self, sql, duration):
+        if sql.upper().startswith('INSERT'):
+            self.statements.append(sql)
+
+    def get_insert_index(self, table):
+        for index, sql in enumerate(self.statements):
+            if table in sql:
+                return index
+        self.fail('No INSERT INTO %s in %r' % (table, self.statements))
+
+    def test_one_by_one_before_dependents(self):
+        self.assertTrue(
+            FixtureCache().load([self.fixture_path], commit=False))
+        self.assertTrue(
+            self.get_insert_index('django_content_type')
+            < self.get_insert_index('polls_choice'))
+        self.assertEqual(Choice.objects.get(pk=1).content_type.name, 'bear')
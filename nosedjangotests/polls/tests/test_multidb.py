@@ -0,0 +1,85 @@
+"""
+Isolation of databases other than ``default``. Run with
+``--django-settings nosedjangotests.settings_multidb``; the tests skip
+themselves with single-database settings.
+"""
+import datetime
+from unittest import TestCase as UnitTestCase
+
+from nose.plugins.skip import SkipTest
+
+from django.conf import settings
+from django.db import connections
+
+from nosedjangotests.polls.models import Poll
+
+def _skip_unless_multidb():
+    if 'other' not in settings.DATABASES:
+        raise SkipTest('Needs nosedjangotests.settings_multidb')
+
+def _test_other_database_1(self):
+    _skip_unless_multidb()
+    self.assertEqual(Poll.objects.using('other').count(), 0)
+    Poll.objects.using('other').create(
+        question='Other?', pub_date=datetime.datetime.now())
+    self.assertEqual(Poll.objects.using('other').count(), 1)
+    self.assertEqual(Poll.objects.count(), 0)
+
+def _test_other_database_2(self):
+    _skip_unless_multidb()
+    self.assertEqual(Poll.objects.using('other').count(), 0)
+
+def _test_replica(self):
+    _skip_unless_multidb()
+    self.assertTrue(connections['replica'] is connections['default'])
+    Poll.objects.create(question='Replica?', pub_date=datetime.datetime.now())
+    self.assertEqual(Poll.objects.using('replica').count(), 1)
+
+def _test_duplicate(self):
+    _skip_unless_multidb()
+    self.assertEqual(connections['other_duplicate'].settings_dict['NAME'],
+                     connections['other'].settings_dict['NAME'])
+    self.assertEqual(Poll.objects.using('other_duplicate').count(), 0)
+
+def _test_dependent(self):
+    _skip_unless_multidb()
+    settings_dict = connections['dependent'].settings_dict
+    # A worker's clone is named after the main process's test database
+    self.assertTrue(settings_dict['NAME'].startswith(
+        settings_dict['TEST_NAME']))
+    self.assertEqual(Poll.objects.using('dependent').count(), 0)
+
+
+class MultiDatabaseTestCase(UnitTestCase):
+    def test_other_database_1(self):
+        _test_other_database_1(self)
+
+    def test_other_database_2(self):
+        _test_other_database_2(self)
+
+    def test_replica(self):
+        _test_replica(self)
+
+    def test_duplicate(self):
+        _test_duplicate(self)
+
+    def test_dependent(self):
+        _test_dependent(self)
+
+
+class NoTransactionMultiDatabaseTestCase(MultiDatabaseTestCase):
+    use_transaction_isolation = False
+
+
+class MultiDatabaseFixtureTestCase(UnitTestCase):
+    fixtures = ['polls1.json']
+    multi_db = True
+
+    def test_fixtures_1(self):
+        _skip_unless_multidb()
+        self.assertEqual(Poll.objects.using('other').count(), 1)
+        Poll.objects.using('other').all().delete()
+
+    def test_fixtures_2(self):
+        _skip_unless_multidb()
+        self.assertEqual(Poll.objects.using('other').count(), 1)
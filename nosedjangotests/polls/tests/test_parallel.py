@@ -0,0 +1,39 @@
+import threading
+from unittest import TestCase as UnitTestCase
+
+from nosedjango import parallel
+
+
+class ThreadPoolTestCase(UnitTestCase):
+    uses_database = False
+
+    def test_bounded(self):
+        release = threading.Event()
+        pool = parallel.ThreadPool(max_threads=2)
+        try:
+            pool.submit(release.wait)
+            pool.submit(release.wait)
+
+            # No thread is started while both slots are taken
+            submitter = threading.Thread(
+                target=pool.submit, args=(release.wait,))
+            submitter.start()
+            submitter.join(0.1)
+            self.assertTrue(submitter.isAlive())
+            self.assertEqual(len(pool.threads), 2)
+        finally:
+            release.set()
+        submitter.join()
+        pool.join()
+
+    def test_errors(self):
+        def fail():
+            raise ValueError('Failed')
+
+        pool = parallel.ThreadPool(max_threads=1)
+        pool.submit(fail)
+        # Wouldn't get a slot if the failed call had kept its own
+        pool.submit(fail)
+        self.assertRaises(ValueError, pool.join)
+        # The errors are reported once
+        pool.join()
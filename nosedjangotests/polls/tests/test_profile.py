@@ -0,0 +1,83 @@
+import json
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+from unittest import TestCase as UnitTestCase
+
+from nosedjango.plugins import profile_plugin
+
+class FakeConfig(object):
+    def __init__(self, worker):
+        self.worker = worker
+
+class FakeTest(object):
+    def __init__(self, name):
+        self.name = name
+
+    def id(self):
+        return self.name
+
+
+class ProfileJournalTestCase(UnitTestCase):
+    uses_database = False
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.profile_file = os.path.join(self.tmp_dir, 'profile.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _get_plugin(self, worker):
+        plugin = profile_plugin.ProfilePlugin()
+        plugin.sort = 'total'
+        plugin.limit = 0
+        plugin.profile_file = self.profile_file
+        plugin.nose_config = FakeConfig(worker)
+        plugin.print_report = lambda profiles, stream: None
+        return plugin
+
+    def _run_test(self, plugin, name):
+        plugin.beforeTest(FakeTest(name))
+        plugin.startTest(None)
+        plugin.query_executed('SELECT 1', 0.5)
+        plugin.stopTest(None)
+        plugin.afterRollback(None)
+
+    def test_worker_profiles_merged(self):
+        main = self._get_plugin(worker=False)
+        main.begin()
+        self._run_test(main, 'main_test')
+
+        # Workers run begin but never finalize
+        worker = self._get_plugin(worker=True)
+        worker.begin()
+        self._run_test(worker, 'worker_test')
+        worker.journal.close()
+
+        main.finalize(None)
+        f = open(self.profile_file)
+        try:
+            profiles = json.load(f)
+        finally:
+            f.close()
+        self.assertEqual(sorted([profile['test'] for profile in profiles]),
+                         ['main_test', 'worker_test'])
+        self.assertEqual([profile['queries'] for profile in profiles], [1, 1])
+        self.assertEqual(os.listdir(self.tmp_dir), ['profile.json'])
+
+    def test_stale_journals_removed(self):
+        stale = open(self.profile_file + '.1.journal', 'w')
+        stale.write('%s\n' % json.dumps({'test': 'stale'}))
+        stale.close()
+        self._get_plugin(worker=False).begin()
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+    def test_report(self):
+        plugin = self._get_plugin(worker=False)
+        self._run_test(plugin, 'reported_test')
+        stream = StringIO()
+        profile_plugin.ProfilePlugin.print_report(
+            plugin, plugin.profiles, stream)
+        self.assertTrue('reported_test' in stream.getvalue())
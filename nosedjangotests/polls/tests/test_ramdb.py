@@ -0,0 +1,128 @@
+"""
+Pointing ``DATABASES`` at the throwaway server, without starting one:
+``RAMDB_ENV`` is what multiprocess workers get from the main process.
+"""
+import os
+import shutil
+import stat
+import tempfile
+from unittest import TestCase as UnitTestCase
+
+from nose.config import ConfigError
+from nose.plugins.skip import SkipTest
+
+from nosedjango.plugins import ramdb_plugin
+
+POSTGRESQL_ENGINE = 'django.db.backends.postgresql_psycopg2'
+SQLITE_ENGINE = 'django.db.backends.sqlite3'
+
+class FakeSettings(object):
+    def __init__(self, databases):
+        self.DATABASES = databases
+
+
+class RamDbPluginTestCase(UnitTestCase):
+    uses_database = False
+
+    def setUp(self):
+        self.old_env = os.environ.get(ramdb_plugin.RAMDB_ENV)
+        os.environ[ramdb_plugin.RAMDB_ENV] = os.pathsep.join(
+            [ramdb_plugin.POSTGRESQL, '/dev/shm/nosedjango-ramdb-x', '5432',
+             'postgres'])
+        self.plugin = ramdb_plugin.RamDbPlugin()
+
+    def tearDown(self):
+        if self.old_env is None:
+            os.environ.pop(ramdb_plugin.RAMDB_ENV, None)
+        else:
+            os.environ[ramdb_plugin.RAMDB_ENV] = self.old_env
+
+    def test_server_settings_from_env(self):
+        self.plugin.engine = ramdb_plugin.POSTGRESQL
+        self.assertEqual(self.plugin._get_server_settings(), {
+            'HOST': '/dev/shm/nosedjango-ramdb-x',
+            'PORT': '5432',
+            'USER': 'postgres',
+            'PASSWORD': '',
+        })
+        self.assertEqual(self.plugin.server, None)
+
+    def test_databases_rewritten(self):
+        settings = FakeSettings({
+            'default': {'ENGINE': POSTGRESQL_ENGINE, 'NAME': 'app',
+                        'HOST': 'db.example.com', 'USER': 'app',
+                        'PASSWORD': 'secret'},
+            'other': {'ENGINE': 'django.contrib.gis.db.backends.postgis',
+                      'NAME': 'gis', 'HOST': 'gis.example.com'},
+            'local': {'ENGINE': SQLITE_ENGINE, 'NAME': 'local.db'},
+        })
+        self.plugin.beforeConnectionSetup(settings)
+
+        self.assertEqual(self.plugin.engine, ramdb_plugin.POSTGRESQL)
+        self.assertEqual(settings.DATABASES['default'], {
+            'ENGINE': POSTGRESQL_ENGINE, 'NAME': 'app',
+            'HOST': '/dev/shm/nosedjango-ramdb-x', 'PORT': '5432',
+            'USER': 'postgres', 'PASSWORD': '',
+        })
+        self.assertEqual(settings.DATABASES['other']['HOST'],
+                         '/dev/shm/nosedjango-ramdb-x')
+        self.assertEqual(settings.DATABASES['local'],
+                         {'ENGINE': SQLITE_ENGINE, 'NAME': 'local.db'})
+
+    def test_sqlite_default(self):
+        settings = FakeSettings({
+            'default': {'ENGINE': SQLITE_ENGINE, 'NAME': 'local.db'},
+        })
+        self.assertRaises(
+            ConfigError, self.plugin.beforeConnectionSetup, settings)
+
+
+class PostgreSQLServerTestCase(UnitTestCase):
+    uses_database = False
+
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.bin_dir = os.path.join(self.base_dir, 'bin')
+        os.mkdir(self.bin_dir)
+        postgres = os.path.join(self.bin_dir, 'postgres')
+        open(postgres, 'w').close()
+        os.chmod(postgres, stat.S_IRWXU)
+
+    def tearDown(self):
+        shutil.rmtree(self.base_dir)
+
+    def test_server_command(self):
+        server = ramdb_plugin.PostgreSQLServer(self.base_dir, self.bin_dir)
+        command = server.get_server_command()
+        self.assertEqual(command[0], os.path.join(self.bin_dir, 'postgres'))
+        self.assertTrue('listen_addresses=' in command)
+        self.assertEqual(command[command.index('-k') + 1], self.base_dir)
+        self.assertEqual(server.get_settings()['HOST'], self.base_dir)
+
+    def test_root(self):
+        server = ramdb_plugin.PostgreSQLServer(self.base_dir, self.bin_dir)
+        if os.geteuid() == 0:
+            self.assertEqual(server.run_as,
+                             ramdb_plugin.get_user_ids('nobody'))
+            self.assertEqual(server.system_user, 'nobody')
+        else:
+            self.assertEqual(server.run_as, None)
+
+    def test_unknown_user(self):
+        if os.geteuid() != 0:
+            raise SkipTest('Needs root')
+        self.assertRaises(
+            ConfigError, ramdb_plugin.PostgreSQLServer, self.base_dir,
+            self.bin_dir, 'no-such-user-here')
+
+    def test_run_as_system_user(self):
+        if os.geteuid() != 0:
+            raise SkipTest('Needs root')
+        server = ramdb_plugin.PostgreSQLServer(self.base_dir, self.bin_dir)
+        os.chown(self.base_dir, *server.run_as)
+        server._run(['id', '-u'])
+        f = open(server.log_path)
+        try:
+            self.assertEqual(f.read().strip(), str(server.run_as[0]))
+        finally:
+            f.close()
@@ -0,0 +1,80 @@
+"""
+The state table ``--django-reuse-db`` keeps in the test database, on a
+throwaway sqlite alias of its own.
+"""
+import datetime
+import os
+import shutil
+import tempfile
+from unittest import TestCase as UnitTestCase
+
+from django.conf import settings
+from django.db import connections
+
+from nosedjango import reuse
+from nosedjangotests.polls.models import Poll
+
+ALIAS = 'reuse_test'
+
+
+class ReuseStateTestCase(UnitTestCase):
+    uses_database = False
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.old_name = os.path.join(self.tmp_dir, 'real.db')
+        settings.DATABASES[ALIAS] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': self.old_name,
+            'TEST_NAME': os.path.join(self.tmp_dir, 'test.db'),
+        }
+        self.connection = connections[ALIAS]
+        self.connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        self.fingerprint = 'f' * 16
+
+    def tearDown(self):
+        self.connection.close()
+        del connections._connections[ALIAS]
+        del settings.DATABASES[ALIAS]
+        shutil.rmtree(self.tmp_dir)
+
+    def _keep(self, clean):
+        reuse.keep_test_db(self.connection, self.old_name, self.fingerprint,
+                           clean, verbosity=0)
+
+    def test_round_trip(self):
+        self.assertEqual(reuse.get_state(self.connection), None)
+        reuse.set_state(self.connection, self.fingerprint, clean=True)
+        self.assertEqual(reuse.get_state(self.connection),
+                         (self.fingerprint, True))
+        reuse.set_state(self.connection, self.fingerprint, clean=False)
+        self.assertEqual(reuse.get_state(self.connection),
+                         (self.fingerprint, False))
+
+    def test_fingerprint_mismatch(self):
+        self._keep(clean=True)
+        self.assertFalse(reuse.reuse_test_db(
+            self.connection, 'e' * 16, verbosity=0))
+        # Left pointing at the real database, for create_test_db
+        self.assertEqual(self.connection.settings_dict['NAME'], self.old_name)
+
+    def test_clean(self):
+        Poll.objects.using(ALIAS).create(
+            question='Kept?', pub_date=datetime.datetime.now())
+        self._keep(clean=True)
+        self.assertTrue(reuse.reuse_test_db(
+            self.connection, self.fingerprint, verbosity=0))
+        self.assertEqual(Poll.objects.using(ALIAS).count(), 1)
+        # Until this run cleans up after itself
+        self.assertEqual(reuse.get_state(self.connection),
+                         (self.fingerprint, False))
+
+    def test_unclean_flushed(self):
+        Poll.objects.using(ALIAS).create(
+            question='Left over?', pub_date=datetime.datetime.now())
+        self._keep(clean=False)
+        self.assertTrue(reuse.reuse_test_db(
+            self.connection, self.fingerprint, verbosity=0))
+        self.assertEqual(self.connection.settings_dict['NAME'],
+                         os.path.join(self.tmp_dir, 'test.db'))
+        self.assertEqual(Poll.objects.using(ALIAS).count(), 0)
@@ -0,0 +1,144 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import TestCase as UnitTestCase
+
+from nose.loader import TestLoader
+from nose.suite import ContextSuite
+
+from nosedjango import scheduling
+
+PACKAGE = 'nosedjangotests.polls.tests.grouping'
+
+
+class FakeTest(object):
+    def __init__(self, name):
+        self.name = name
+
+    def __call__(self, result):
+        pass
+
+    def id(self):
+        return self.name
+
+    def __repr__(self):
+        return self.name
+
+class FakeContext(object):
+    pass
+
+
+def get_fixtures_key(context):
+    return tuple(getattr(context, 'fixtures', None) or ())
+
+def flatten_ids(suite):
+    if hasattr(suite, '__iter__'):
+        ids = []
+        for case in suite:
+            ids.extend(flatten_ids(case))
+        return ids
+    return [suite.id()[len(PACKAGE) + 1:]]
+
+
+class GroupTestsTestCase(UnitTestCase):
+    uses_database = False
+
+    def test_scattered_modules(self):
+        suite = TestLoader().loadTestsFromNames([
+            '%s.scattered_a' % PACKAGE,
+            '%s.scattered_b' % PACKAGE,
+        ])
+        grouped = scheduling.group_tests(suite, get_fixtures_key)
+        self.assertEqual(flatten_ids(grouped), [
+            'scattered_a.PlainA.test_plain',
+            'scattered_b.PlainB.test_plain',
+            'scattered_a.PollsA.test_polls',
+            'scattered_b.PollsB.test_polls',
+        ])
+
+
+class DurationHistoryTestCase(UnitTestCase):
+    uses_database = False
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'durations.json')
+        self.history = scheduling.DurationHistory(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_longest_first(self):
+        self.history.tests.update({'a': 1.0, 'b': 3.0, 'c': 2.0, 'd': 2.0})
+        batches = [FakeTest(name) for name in 'abcd']
+        ordered = self.history.order_batches(batches)
+        # Equal estimates keep their order
+        self.assertEqual([batch.id() for batch in ordered],
+                         ['b', 'c', 'd', 'a'])
+
+    def test_suites(self):
+        self.history.tests.update({'a': 1.0, 'b': 3.0, 'c': 2.5})
+        suite = unittest.TestSuite([FakeTest('a'), FakeTest('b')])
+        self.assertEqual(self.history.estimate(suite, 0.0), 4.0)
+
+        # A context's own duration includes its setup
+        self.history.contexts[scheduling.get_context_key(FakeContext)] = 10.0
+        context_suite = ContextSuite([FakeTest('c')], context=FakeContext)
+        self.assertEqual(self.history.estimate(context_suite, 0.0), 10.0)
+
+        ordered = self.history.order_batches(
+            [FakeTest('c'), suite, context_suite])
+        self.assertEqual(ordered, [context_suite, suite, ordered[2]])
+        self.assertEqual(ordered[2].id(), 'c')
+
+    def test_no_history(self):
+        batches = [FakeTest(name) for name in 'abc']
+        self.assertEqual(self.history.order_batches(batches), batches)
+
+    def test_never_timed(self):
+        # New tests count as average ones
+        self.history.tests.update({'a': 1.0, 'b': 3.0})
+        batches = [FakeTest(name) for name in ['a', 'new', 'b']]
+        self.assertEqual(self.history.estimate(batches[1], 2.0), 2.0)
+        self.assertEqual(
+            [batch.id() for batch in self.history.order_batches(batches)],
+            ['b', 'new', 'a'])
+
+    def test_merge_journals(self):
+        self.history.tests['old'] = 1.0
+        self.history.save()
+
+        for pid, lines in [
+                (101, [['tests', 'a', 1.5], ['contexts', 'm.A', 2.0]]),
+                (102, [['tests', 'b', 0.5], ['tests', 'old', 4.0]])]:
+            f = open(self.history._journal_path(pid), 'w')
+            for line in lines:
+                f.write('%s\n' % json.dumps(line))
+            if pid == 102:
+                # Killed halfway through a line
+                f.write('["tests", "c"')
+            f.close()
+
+        history = scheduling.DurationHistory(self.path)
+        history.load()
+        history.merge_journals()
+        history.save()
+        self.assertEqual(os.listdir(self.tmp_dir), ['durations.json'])
+
+        reloaded = scheduling.DurationHistory(self.path)
+        reloaded.load()
+        self.assertEqual(reloaded.tests, {'a': 1.5, 'b': 0.5, 'old': 4.0})
+        self.assertEqual(reloaded.contexts, {'m.A': 2.0})
+
+    def test_worker_journal(self):
+        worker = scheduling.DurationHistory(self.path)
+        worker.open_journal()
+        worker.record_test('a', 1.0)
+        worker.record_context(None, 1.0)
+        worker.journal.close()
+
+        self.history.merge_journals()
+        self.assertEqual(self.history.tests, {'a': 1.0})
+        self.assertEqual(self.history.contexts, {})
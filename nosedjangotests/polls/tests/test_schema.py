@@ -0,0 +1,106 @@
+import copy
+import os
+import shutil
+import tempfile
+from unittest import TestCase as UnitTestCase
+
+from django.conf import settings
+from django.db import connection
+
+from nosedjango.cursors import add_cursor_hook, remove_cursor_hook
+from nosedjango.schema import (
+    diff_schema_descriptions, get_schema_description, get_schema_fingerprint)
+from nosedjangotests.polls.models import Poll
+
+
+class SchemaFingerprintTestCase(UnitTestCase):
+    uses_database = False
+
+    def test_no_queries(self):
+        cursors = []
+        hook = lambda connection: cursors.append(connection)
+        add_cursor_hook(connection, hook)
+        try:
+            get_schema_fingerprint()
+        finally:
+            remove_cursor_hook(connection, hook)
+        self.assertEqual(cursors, [])
+
+    def test_stable(self):
+        self.assertEqual(get_schema_fingerprint(), get_schema_fingerprint())
+        self.assertEqual(len(get_schema_fingerprint()), 16)
+
+    def test_diff(self):
+        old = get_schema_description()
+        self.assertEqual(diff_schema_descriptions(old, old), [])
+
+        new = copy.deepcopy(old)
+        for model in new[2]:
+            if model[1] == 'polls_poll':
+                model[1] = 'polls_question'
+        lines = diff_schema_descriptions(old, new)
+        self.assertTrue('-table polls_poll (polls)' in lines)
+        self.assertTrue('+table polls_question (polls)' in lines)
+
+    def test_saved_by_older_version(self):
+        new = get_schema_description()
+        old = new[:5]
+        old[2] = [model[:5] for model in old[2]]
+        lines = diff_schema_descriptions(old, new)
+        self.assertTrue('+  verbose name poll' in lines)
+
+
+class SyncdbDataFingerprintTestCase(UnitTestCase):
+    """
+    What ``syncdb`` writes besides the tables is part of the fingerprint.
+    """
+    uses_database = False
+
+    def setUp(self):
+        self.fingerprint = get_schema_fingerprint()
+
+    def test_permissions(self):
+        opts = Poll._meta
+        old_permissions = opts.permissions
+        old_description = get_schema_description()
+        opts.permissions = [('close_poll', 'Can close poll')]
+        try:
+            self.assertNotEqual(get_schema_fingerprint(), self.fingerprint)
+            lines = diff_schema_descriptions(
+                old_description, get_schema_description())
+            self.assertTrue('+  permission close_poll Can close poll' in lines)
+        finally:
+            opts.permissions = old_permissions
+        self.assertEqual(get_schema_fingerprint(), self.fingerprint)
+
+    def test_verbose_name(self):
+        opts = Poll._meta
+        old_verbose_name = opts.verbose_name
+        opts.verbose_name = 'question'
+        try:
+            self.assertNotEqual(get_schema_fingerprint(), self.fingerprint)
+        finally:
+            opts.verbose_name = old_verbose_name
+
+    def test_initial_data(self):
+        fixture_dir = tempfile.mkdtemp()
+        old_fixture_dirs = settings.FIXTURE_DIRS
+        settings.FIXTURE_DIRS = [fixture_dir]
+        try:
+            # Only initial_data counts
+            open(os.path.join(fixture_dir, 'other.json'), 'w').close()
+            self.assertEqual(get_schema_fingerprint(), self.fingerprint)
+
+            f = open(os.path.join(fixture_dir, 'initial_data.json'), 'w')
+            f.write('[]')
+            f.close()
+            with_initial_data = get_schema_fingerprint()
+            self.assertNotEqual(with_initial_data, self.fingerprint)
+
+            f = open(os.path.join(fixture_dir, 'initial_data.json'), 'w')
+            f.write('[{"model": "polls.poll", "pk": 1, "fields": {}}]')
+            f.close()
+            self.assertNotEqual(get_schema_fingerprint(), with_initial_data)
+        finally:
+            settings.FIXTURE_DIRS = old_fixture_dirs
+            shutil.rmtree(fixture_dir)
@@ -0,0 +1,79 @@
+import os
+import shutil
+import socket
+import tempfile
+import time
+from unittest import TestCase as UnitTestCase
+
+from nosedjango import server
+
+
+class ServerSocketTestCase(UnitTestCase):
+    uses_database = False
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.tmp_dir, 'server.sock')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_default_path_private(self):
+        path = server.get_default_socket_path('myproject.settings')
+        self.assertEqual(os.path.dirname(path),
+                         server.get_user_temp_dir())
+
+    def test_listen(self):
+        test_server = server.TestServer(None, self.socket_path, 1, None)
+        test_server.listen()
+        try:
+            self.assertEqual(os.stat(self.socket_path).st_mode & 0777, 0700)
+            sock = server.connect(self.socket_path)
+            self.assertNotEqual(sock, None)
+            sock.close()
+        finally:
+            test_server.listener.close()
+
+    def test_writable_socket_ignored(self):
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.socket_path)
+        listener.listen(1)
+        try:
+            os.chmod(self.socket_path, 0777)
+            self.assertEqual(server.connect(self.socket_path), None)
+        finally:
+            listener.close()
+
+    def test_other_file_kept(self):
+        open(self.socket_path, 'w').close()
+        test_server = server.TestServer(None, self.socket_path, 1, None)
+        self.assertRaises(RuntimeError, test_server.listen)
+        self.assertTrue(os.path.isfile(self.socket_path))
+
+
+class StaleCodeTestCase(UnitTestCase):
+    uses_database = False
+
+    def test_changed_modules(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            kept = os.path.join(tmp_dir, 'kept.py')
+            edited = os.path.join(tmp_dir, 'edited.py')
+            removed = os.path.join(tmp_dir, 'removed.py')
+            for path in (kept, edited, removed):
+                open(path, 'w').close()
+            mtimes = dict([(path, os.stat(path).st_mtime)
+                           for path in (kept, edited, removed)])
+
+            later = time.time() + 10
+            os.utime(edited, (later, later))
+            os.remove(removed)
+            self.assertEqual(server.get_changed_modules(mtimes),
+                             sorted([edited, removed]))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_imported_modules(self):
+        mtimes = server.get_module_mtimes()
+        self.assertTrue(os.path.abspath(server.__file__).rstrip('c') in mtimes)
+        self.assertEqual(server.get_changed_modules(mtimes), [])
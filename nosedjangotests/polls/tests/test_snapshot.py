@@ -0,0 +1,50 @@
+import datetime
+from unittest import TestCase as UnitTestCase
+
+from nose.plugins.skip import SkipTest
+
+from django.db import connection
+
+from nosedjango.flush import DirtyTableTracker, get_flusher
+from nosedjango.nosedjango import NoseDjango
+
+from nosedjangotests.polls.models import Poll
+
+
+class SchemaSnapshotTestCase(UnitTestCase):
+    """
+    The snapshot for ``rebuild_schema`` tests is taken before the first of
+    them, after rows earlier tests left behind are removed.
+    """
+    use_transaction_isolation = False
+
+    def setUp(self):
+        if 'sqlite3' not in connection.settings_dict['ENGINE']:
+            raise SkipTest('Snapshots other databases in place')
+        self.plugin = NoseDjango()
+        self.plugin.old_db = connection.settings_dict['NAME']
+
+    def tearDown(self):
+        if self.plugin.dirty_tables is not None:
+            self.plugin.dirty_tables.stop()
+        if self.plugin.schema_snapshot is not None:
+            self.plugin.schema_snapshot.delete()
+
+    def leave_poll_behind(self):
+        Poll.objects.create(
+            question='Left behind?', pub_date=datetime.datetime.now())
+
+    def test_dirty_tables_reset(self):
+        self.plugin.flusher = get_flusher(connection)
+        self.plugin.flusher.capture_seed()
+        self.plugin.dirty_tables = DirtyTableTracker(connection)
+        self.plugin.dirty_tables.start()
+
+        self.leave_poll_behind()
+        self.plugin._save_schema_snapshot()
+        self.assertEqual(Poll.objects.count(), 0)
+
+    def test_flush_command(self):
+        self.leave_poll_behind()
+        self.plugin._save_schema_snapshot()
+        self.assertEqual(Poll.objects.count(), 0)
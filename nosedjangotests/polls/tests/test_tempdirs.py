@@ -0,0 +1,48 @@
+import os
+import shutil
+import stat
+import tempfile
+from unittest import TestCase as UnitTestCase
+
+from nosedjango.nosedjango import (
+    _read_settings_path_cache, _write_settings_path_cache)
+from nosedjango.tempdirs import ensure_private_dir, is_private_dir
+
+
+class PrivateDirTestCase(UnitTestCase):
+    uses_database = False
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.private_dir = os.path.join(self.tmp_dir, 'nosedjango')
+        self.cache_path = os.path.join(self.private_dir, 'settings.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_created_private(self):
+        self.assertTrue(ensure_private_dir(self.private_dir))
+        mode = stat.S_IMODE(os.stat(self.private_dir).st_mode)
+        self.assertEqual(mode, 0700)
+
+    def test_cache_round_trip(self):
+        _write_settings_path_cache(self.cache_path, {'key': '/path'})
+        self.assertEqual(
+            _read_settings_path_cache(self.cache_path), {'key': '/path'})
+
+    def test_writable_dir_ignored(self):
+        _write_settings_path_cache(self.cache_path, {'key': '/path'})
+        os.chmod(self.private_dir, 0777)
+        self.assertFalse(is_private_dir(self.private_dir))
+        self.assertEqual(_read_settings_path_cache(self.cache_path), {})
+
+        # Not written to either
+        os.remove(self.cache_path)
+        _write_settings_path_cache(self.cache_path, {'key': '/path'})
+        self.assertFalse(os.path.exists(self.cache_path))
+
+    def test_symlink_ignored(self):
+        real_dir = os.path.join(self.tmp_dir, 'elsewhere')
+        os.mkdir(real_dir, 0700)
+        os.symlink(real_dir, self.private_dir)
+        self.assertFalse(ensure_private_dir(self.private_dir))
@@ -0,0 +1,36 @@
+# A second database, another alias for it, a database created after it and a
+# replica of the default one, for the tests in
+# nosedjangotests.polls.tests.test_multidb
+import os
+import tempfile
+
+from nosedjangotests.settings import *
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    },
+    'other': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(tempfile.gettempdir(), 'nosedjango-other.db'),
+        'TEST_NAME': os.path.join(
+            tempfile.gettempdir(), 'test_nosedjango-other.db'),
+    },
+    'other_duplicate': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(tempfile.gettempdir(), 'nosedjango-other.db'),
+    },
+    'dependent': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(tempfile.gettempdir(), 'nosedjango-dependent.db'),
+        'TEST_NAME': os.path.join(
+            tempfile.gettempdir(), 'test_nosedjango-dependent.db'),
+        'TEST_DEPENDENCIES': ['other'],
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+        'TEST_MIRROR': 'default',
+    },
+}
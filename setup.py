@@ -33,6 +33,18 @@ class RunTests(Command):
         ]
         TestProgram(argv=args, exit=False)
 
+        print "Running tests with context-level fixtures"
+        args = [
+            '-v',
+            '--with-doctest',
+            '--with-django',
+            '--django-settings', 'nosedjangotests.settings',
+            '--with-django-sqlite',
+            '--django-context-fixtures',
+            'nosedjangotests.polls',
+        ]
+        TestProgram(argv=args, exit=False)
+
         print "Running tests multiprocess"
         args = [
             '-v',
@@ -45,6 +57,29 @@ class RunTests(Command):
         ]
         TestProgram(argv=args, exit=False)
 
+        print "Running tests with multiple databases"
+        args = [
+            '-v',
+            '--with-doctest',
+            '--with-django',
+            '--django-settings', 'nosedjangotests.settings_multidb',
+            '--with-django-sqlite',
+            'nosedjangotests.polls',
+        ]
+        TestProgram(argv=args, exit=False)
+
+        print "Running tests with a lazily created test database"
+        args = [
+            '-v',
+            '--with-django',
+            '--django-settings', 'nosedjangotests.settings',
+            '--with-django-sqlite',
+            '--django-lazy-db',
+            'nosedjangotests.polls.tests.lazy.without_database',
+            'nosedjangotests.polls.tests.lazy.on_demand',
+        ]
+        TestProgram(argv=args, exit=False)
+
         print "Running tests with mysql. (will fail if mysql not configured)"
         args = [
             '-v',
@@ -82,11 +117,17 @@ setup(
     cmdclass = {'nosetests': RunTests},
     include_package_data = True,
     entry_points = {
+        'console_scripts': [
+            'nosedjango-compile-fixtures = nosedjango.compile_fixtures:main',
+            'nosedjango-schema-diff = nosedjango.schema_diff:main',
+            ],
         'nose.plugins': [
             'celery = nosedjango.plugins.celery_plugin:CeleryPlugin',
             'cherrypyliveserver = nosedjango.plugins.cherrypy_plugin:CherryPyLiveServerPlugin',
             'django = nosedjango.nosedjango:NoseDjango',
             'djangofilestorage = nosedjango.plugins.file_storage_plugin:FileStoragePlugin',
+            'djangoprofile = nosedjango.plugins.profile_plugin:ProfilePlugin',
+            'djangoramdb = nosedjango.plugins.ramdb_plugin:RamDbPlugin',
             'djangosphinxsearch = nosedjango.plugins.sphinxsearch_plugin:SphinxSearchPlugin',
             'djangosqlite = nosedjango.plugins.sqlite_plugin:SqlitePlugin',
             'selenium = nosedjango.plugins.selenium_plugin:SeleniumPlugin',